@@ -0,0 +1,118 @@
+"""benchmarks.cases
+
+Benchmark cases. Each case function yields ``(name, params, run)``: `params` is a JSON-serializable dict that,
+with `name`, identifies the measurement across commits, and `run` is a zero-argument callable doing the timed work.
+Inputs are generated before `run` is returned, so only the library call is timed.
+
+"""
+import os
+import sys
+import shutil
+import itertools
+import tempfile
+import subprocess
+import numpy as np
+import metricspace as ms
+from generators import poisson_trains, class_trains, cost_values, class_sizes, count_tables
+
+# Grids of the "standard" and "quick" suites: trials, spikes per train and number of cost values
+GRIDS = {
+    "standard": dict(trials=(50, 200), spikes=(10, 50), nq=(8, 32), slide_res=(1e-1, 1e-2, 1e-3)),
+    "quick": dict(trials=(20,), spikes=(10,), nq=(4,), slide_res=(1e-1,)),
+}
+
+# Median seconds the startup cases must stay under; run.py exits with status 1 when one is exceeded. They include
+# starting the interpreter, and the first calls assume a warm numba cache (the untimed warm-up run fills it).
+TARGETS = {"import": 0.3, "first_call": 1.5}
+
+# Code run in a fresh interpreter by the startup cases
+FIRST_CALL = (
+    "import numpy as np, metricspace as ms; "
+    "ms.spkd([np.array([0.1, 0.3]), np.array([0.2])], np.array([0.0, 1.0]), backend={backend!r})"
+)
+
+# distclust modes: the weighted mean with trumping 0-distances, the weighted mean and the median
+DISTCLUST_MODES = (dict(expo=-2, iftrump=1), dict(expo=2, iftrump=0), dict(expo=2, iftrump=1), dict(expo=0, iftrump=1))
+
+
+def spkd_cases(grid, seed):
+    for backend, numt, spikes, nq in itertools.product(
+        ms.available_backends(), grid["trials"], grid["spikes"], grid["nq"]
+    ):
+        rng = np.random.default_rng(seed)
+        cspks = poisson_trains(rng, numt, spikes)
+        qvals = cost_values(nq)
+        params = dict(backend=backend, trials=numt, spikes=spikes, nq=nq)
+        yield "spkd", params, lambda cspks=cspks, qvals=qvals, backend=backend: ms.spkd(cspks, qvals, backend=backend)
+
+
+def spkd_slide_cases(grid, seed):
+    backends = [b for b in ms.available_backends() if b != "numba"]
+    numt, spikes, nq = min(grid["trials"]), min(grid["spikes"]), min(grid["nq"])
+    for backend, res in itertools.product(backends, grid["slide_res"]):
+        rng = np.random.default_rng(seed)
+        cspks = poisson_trains(rng, numt, spikes)
+        qvals = cost_values(nq)
+        params = dict(backend=backend, trials=numt, spikes=spikes, nq=nq, res=res)
+        yield "spkd_slide", params, lambda cspks=cspks, qvals=qvals, res=res, backend=backend: ms.spkd_slide(
+            cspks, qvals, res, backend=backend
+        )
+
+
+def distclust_cases(grid, seed):
+    for numt, nq, mode in itertools.product(grid["trials"], grid["nq"], DISTCLUST_MODES):
+        rng = np.random.default_rng(seed)
+        nsam = class_sizes(numt, 5)
+        cspks, _ = class_trains(rng, nsam, min(grid["spikes"]))
+        dists = ms.spkd(cspks, cost_values(nq))
+        params = dict(trials=numt, nq=nq, **mode)
+        yield "distclust", params, lambda dists=dists, nsam=nsam, mode=mode: ms.distclust(dists, nsam, **mode)
+
+
+def entropy_cases(grid, seed):
+    for ncla, num_tables in itertools.product((5, 20), (1, 1000)):
+        rng = np.random.default_rng(seed)
+        tables = count_tables(rng, num_tables, ncla, 10 * ncla)
+        probs = tables / tables.sum(axis=(1, 2), keepdims=True)
+        counts = tables.reshape(num_tables, -1)
+        params = dict(classes=ncla, tables=num_tables)
+        yield "tblxinfo", params, lambda probs=probs: ms.tblxinfo(probs)
+        yield "tblxtpbi", params, lambda tables=tables: ms.tblxtpbi(tables)
+        yield "tblxbi_ja", params, lambda tables=tables: ms.tblxbi(tables, "ja")
+        yield "histinfo", params, lambda counts=counts: ms.histinfo(counts / counts.sum(1, keepdims=True), axis=1)
+        yield "histjabi", params, lambda counts=counts: ms.histjabi(counts, axis=1)
+        yield "histtpbi", params, lambda counts=counts: ms.histtpbi(counts, axis=1)
+
+
+def _python(code, env=None):
+    """ A callable running `code` in a new interpreter. """
+    return lambda: subprocess.run([sys.executable, "-c", code], check=True, env=env)
+
+
+def _cold_python(code):
+    """ A callable running `code` in a new interpreter with an empty numba cache. """
+
+    def run():
+        cache = tempfile.mkdtemp()
+        try:
+            subprocess.run([sys.executable, "-c", code], check=True, env=dict(os.environ, NUMBA_CACHE_DIR=cache))
+        finally:
+            shutil.rmtree(cache, ignore_errors=True)
+
+    return run
+
+
+def startup_cases(grid, seed):
+    yield "import", dict(), _python("import metricspace")
+    for backend in ms.available_backends():
+        yield "first_call", dict(backend=backend), _python(FIRST_CALL.format(backend=backend))
+    yield "first_call_cold", dict(backend="py"), _cold_python(FIRST_CALL.format(backend="py"))
+
+
+SUITES = {
+    "spkd": spkd_cases,
+    "spkd_slide": spkd_slide_cases,
+    "distclust": distclust_cases,
+    "entropy": entropy_cases,
+    "startup": startup_cases,
+}
@@ -0,0 +1,59 @@
+"""benchmarks.compare
+
+Compare two result files of benchmarks/run.py, e.g. the release in production against a candidate commit.
+
+    python benchmarks/compare.py results/base.json results/new.json --threshold 1.2
+
+Prints the median time and peak memory ratio (new / base) of every case present in both files, and exits with
+status 1 if any case is slower or larger than `--threshold` times the base, so it can gate an upgrade or a CI job.
+
+"""
+import sys
+import json
+import argparse
+
+
+def load(path):
+    """ Results of one file, keyed by case name and parameters. """
+    with open(path) as f:
+        data = json.load(f)
+    return data["meta"], {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in data["results"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", help="result file of the reference commit")
+    parser.add_argument("new", help="result file of the commit to check")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio above which a case is a regression")
+    parser.add_argument("--min-time", type=float, default=1e-3, help="ignore time ratios of cases faster than this")
+    args = parser.parse_args(argv)
+
+    base_meta, base = load(args.base)
+    new_meta, new = load(args.new)
+    print(f"base: {base_meta.get('commit')} ({base_meta.get('date')})   new: {new_meta.get('commit')} ({new_meta.get('date')})")
+    for field in ("grid", "python", "numpy", "platform", "cpu_count", "rust", "backends"):
+        if base_meta.get(field) != new_meta.get(field):
+            print(f"warning: {field} differs: {base_meta.get(field)} -> {new_meta.get(field)}")
+
+    regressions = 0
+    for key in sorted(base.keys() & new.keys()):
+        b, n = base[key], new[key]
+        time_ratio = n["median"] / b["median"] if b["median"] > 0 else float("nan")
+        peak_ratio = n["peak"] / b["peak"] if b["peak"] > 0 else float("nan")
+        slower = b["median"] >= args.min_time and time_ratio > args.threshold
+        larger = peak_ratio > args.threshold
+        flag = " REGRESSION" if slower or larger else ""
+        regressions += bool(flag)
+        print(
+            f"{key[0]:<16} {key[1]:<70} {b['median'] * 1e3:>10.2f} -> {n['median'] * 1e3:>10.2f} ms "
+            f"x{time_ratio:5.2f}   peak x{peak_ratio:5.2f}{flag}"
+        )
+    for key in sorted(base.keys() ^ new.keys()):
+        print(f"{key[0]:<16} {key[1]:<70} only in {'base' if key in base else 'new'}")
+
+    print(f"{regressions} regression(s) above x{args.threshold}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""benchmarks.generators
+
+Synthetic inputs for the benchmark suite. Every generator takes a numpy Generator, so a seed reproduces the
+same spike trains on every machine and commit.
+
+"""
+import numpy as np
+
+
+def poisson_trains(rng, num_trials, spikes_per_train, duration=1.0):
+    """ Sorted homogeneous Poisson spike trains with `spikes_per_train` spikes on average. """
+    counts = rng.poisson(spikes_per_train, num_trials)
+    return [np.sort(rng.uniform(0, duration, n)) for n in counts]
+
+
+def class_trains(rng, nsam, spikes_per_train, duration=1.0, jitter=0.01, p_drop=0.2):
+    """
+    Spike trains grouped into classes, for distclust and the information pipeline.
+
+    Each class has a template Poisson train; its trials are copies of the template with every spike jittered by
+    `jitter` seconds (sd), dropped with probability `p_drop`, plus as many uniform extra spikes on average.
+
+    Returns
+    -------
+    tuple
+        ``(cspks, labels)``: the spike trains, class by class, and the class of each.
+    """
+    cspks, labels = [], []
+    for cls, n in enumerate(nsam):
+        template = rng.uniform(0, duration, rng.poisson(spikes_per_train))
+        for _ in range(n):
+            kept = template[rng.random(len(template)) >= p_drop]
+            extra = rng.uniform(0, duration, rng.poisson(p_drop * spikes_per_train))
+            spikes = np.concatenate([kept + rng.normal(0, jitter, len(kept)), extra])
+            cspks.append(np.sort(np.clip(spikes, 0, duration)))
+            labels.append(cls)
+    return cspks, np.array(labels)
+
+
+def cost_values(nq):
+    """ 0 and `nq - 1` log-spaced cost values from 2 ** -4 to 2 ** 9, the range of the examples. """
+    return np.concatenate(([0], 2 ** np.linspace(-4, 9, nq - 1)))
+
+
+def class_sizes(num_trials, num_classes):
+    """ Split `num_trials` into `num_classes` classes of (almost) equal size. """
+    nsam = np.full(num_classes, num_trials // num_classes)
+    nsam[: num_trials % num_classes] += 1
+    return nsam
+
+
+def count_tables(rng, num_tables, ncla, total):
+    """ Random ``ncla x ncla`` count tables with `total` counts each, weighted towards the diagonal. """
+    p = rng.dirichlet(np.ones(ncla * ncla), num_tables).reshape(num_tables, ncla, ncla)
+    p = p + np.eye(ncla)[None] * 2 / ncla
+    p /= p.sum(axis=(1, 2), keepdims=True)
+    return np.stack([rng.multinomial(total, x.ravel()).reshape(ncla, ncla) for x in p]).astype(float)
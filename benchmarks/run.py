@@ -0,0 +1,108 @@
+"""benchmarks.run
+
+Run the benchmark suite and write the timings and peak memory to a JSON file.
+
+    python benchmarks/run.py                      # standard grid, results/<commit>.json
+    python benchmarks/run.py --grid quick --suite spkd --suite entropy
+    python benchmarks/run.py --suite startup      # import and first-call latency against their targets
+    python benchmarks/compare.py results/abc1234.json results/def5678.json
+
+Each case runs once untimed (numba compilation, caches), then `--repeat` timed runs; the minimum and median are
+reported. Peak memory is measured in one more run under tracemalloc, which sees numpy and Python allocations but
+not memory allocated inside the Rust extension. The startup cases time fresh interpreters and have latency targets
+(cases.TARGETS); the exit status is 1 if a median is above its target.
+
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import metricspace as ms  # noqa: E402
+from cases import GRIDS, SUITES, TARGETS  # noqa: E402
+
+
+def measure(run, repeat):
+    """ Wall-clock times of `repeat` calls of `run` after one warm-up call, and the peak traced memory of one call. """
+    run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return times, peak
+
+
+def git_commit():
+    """ Short hash of the checked-out commit, with '+dirty' for local changes, or None outside a git checkout. """
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=here, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+dirty" if dirty.strip() else "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grid", choices=sorted(GRIDS), default="standard", help="problem sizes to run")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES), help="suites to run; default all")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic inputs")
+    parser.add_argument("--out", help="output JSON file; default benchmarks/results/<commit>.json")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{commit or 'local'}.json")
+    meta = {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "grid": args.grid,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "rust": "rs" in ms.available_backends(),
+        "backends": list(ms.available_backends()),
+    }
+
+    results = []
+    missed = 0
+    for suite in args.suite or sorted(SUITES):
+        for name, params, run in SUITES[suite](GRIDS[args.grid], args.seed):
+            times, peak = measure(run, args.repeat)
+            median = float(np.median(times))
+            target = TARGETS.get(name)
+            results.append(
+                dict(name=name, params=params, times=times, min=min(times), median=median, peak=peak, target=target)
+            )
+            flag = ""
+            if target is not None and median > target:
+                flag = f" ABOVE TARGET {target * 1e3:.0f} ms"
+                missed += 1
+            print(f"{name:<16} {json.dumps(params):<70} {median * 1e3:>10.2f} ms {peak / 2**20:>9.2f} MiB{flag}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    print(f"Wrote {len(results)} results to {out}")
+    if missed:
+        print(f"{missed} case(s) above their latency target")
+    return 1 if missed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
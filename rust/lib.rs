@@ -1,7 +1,76 @@
-use ndarray::Array2;
-use ndarray::{s, Array1, Array3, ArrayBase, ArrayView3, Dim, OwnedRepr};
-use numpy::{IntoPyArray, PyArray1};
+use ndarray::{Array1, Array3};
+use numpy::{IntoPyArray, PyArray1, PyReadonlyArray1};
+use pyo3::exceptions::PyValueError;
 use pyo3::{prelude::*, types::PyList};
+use rayon::prelude::*;
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::time::Duration;
+
+// Struct: DistanceScratch
+//
+// Working memory for _compute_spiketrain_distance(). `row` holds a single row
+// of the dynamic-programming table for every q value, laid out as
+// (num_spikes_xjj + 1, num_qvals) so the inner loop over q is contiguous, and
+// `diag` holds the north-west neighbour of the cell being updated.
+//
+// The banded kernel reuses `row` for a single q value at a time, with `stamp`
+// holding the row each column was last written in, and the q_*/out_* vectors
+// to split the q values between the two kernels. `candidates` and `current`
+// hold the offsets and last distances of the sliding search.
+//
+// Each worker thread owns one scratch that only ever grows, so the pair loop
+// does not allocate once the largest spike-train has been seen. `cells` and
+// `offsets` count the work of the current pair for PairProgress.
+struct DistanceScratch {
+    row: Vec<f64>,
+    diag: Vec<f64>,
+    stamp: Vec<usize>,
+    q_full: Vec<f64>,
+    q_band: Vec<f64>,
+    out_full: Vec<f64>,
+    out_band: Vec<f64>,
+    candidates: Vec<f64>,
+    current: Vec<f64>,
+    cells: u64,
+    offsets: u64,
+}
+
+impl DistanceScratch {
+    fn new() -> Self {
+        DistanceScratch {
+            row: Vec::new(),
+            diag: Vec::new(),
+            stamp: Vec::new(),
+            q_full: Vec::new(),
+            q_band: Vec::new(),
+            out_full: Vec::new(),
+            out_band: Vec::new(),
+            candidates: Vec::new(),
+            current: Vec::new(),
+            cells: 0,
+            offsets: 0,
+        }
+    }
+
+    fn reserve(&mut self, num_spikes_xjj: usize, num_qvals: usize) {
+        let row_len: usize = (num_spikes_xjj + 1) * num_qvals;
+        if self.row.len() < row_len {
+            self.row.resize(row_len, 0.0);
+        }
+        if self.diag.len() < num_qvals {
+            self.diag.resize(num_qvals, 0.0);
+        }
+    }
+
+    fn reserve_banded(&mut self, num_spikes_xjj: usize) {
+        if self.row.len() < num_spikes_xjj + 1 {
+            self.row.resize(num_spikes_xjj + 1, 0.0);
+        }
+        if self.stamp.len() < num_spikes_xjj + 1 {
+            self.stamp.resize(num_spikes_xjj + 1, 0);
+        }
+    }
+}
 
 // Function: _compute_spiketrain_distance()
 //
@@ -10,79 +79,549 @@ use pyo3::{prelude::*, types::PyList};
 // Most of our performance boost comes from this calculation which is the
 // computation of pairwise distances between two spike trains.
 //
-// This function computes the pairwise distance between two spike-trains.
-fn _compute_spiketrain_distance(scr: &mut Array3<f64>, sd: &ArrayView3<f64>) {
-    let (num_qvals, num_spikes_xii, num_spikes_xjj) = scr.dim();
+// This function computes the pairwise distance between two spike-trains for
+// every q value. The recurrence is the same as the full (nq, n+1, m+1) table,
+//     scr[xii, xjj] = min(scr[xii-1, xjj] + 1,
+//                         scr[xii, xjj-1] + 1,
+//                         scr[xii-1, xjj-1] + q * |a[xii-1] - b[xjj-1]|)
+// but only one row is kept, so the working memory is O(nq * m) and the spike
+// time differences are computed on the fly instead of stored. `offset` is
+// added to every spike of the first spike train.
+fn _compute_spiketrain_distance(
+    spk_train_a: &[f64],
+    spk_train_b: &[f64],
+    qvals: &[f64],
+    offset: f64,
+    scratch: &mut DistanceScratch,
+    out: &mut [f64],
+) {
+    let num_qvals: usize = qvals.len();
+    let num_spikes_xjj: usize = spk_train_b.len();
+    scratch.reserve(num_spikes_xjj, num_qvals);
+    scratch.cells += (spk_train_a.len() * num_spikes_xjj * num_qvals) as u64;
+    let row: &mut [f64] = &mut scratch.row[..(num_spikes_xjj + 1) * num_qvals];
+    let diag: &mut [f64] = &mut scratch.diag[..num_qvals];
+
+    // First row: inserting every spike of the second spike train
+    for xjj in 0..=num_spikes_xjj {
+        row[xjj * num_qvals..(xjj + 1) * num_qvals].fill(xjj as f64);
+    }
     // First spike train
-    for xii in 1..num_spikes_xii {
+    for (xii, &spike) in spk_train_a.iter().enumerate() {
+        let t_a: f64 = spike + offset;
+        diag.copy_from_slice(&row[..num_qvals]);
+        row[..num_qvals].fill((xii + 1) as f64);
         // Second spike train
-        for xjj in 1..num_spikes_xjj {
+        for (xjj, &t_b) in spk_train_b.iter().enumerate() {
+            let dt: f64 = (t_a - t_b).abs();
+            let (prev, cur) = row.split_at_mut((xjj + 1) * num_qvals);
+            let left: &[f64] = &prev[xjj * num_qvals..];
+            let cur: &mut [f64] = &mut cur[..num_qvals];
             // For each q value
             for q in 0..num_qvals {
-                let a: f64 = scr[[q, xii - 1, xjj]] + 1.0;
-                let b: f64 = scr[[q, xii, xjj - 1]] + 1.0;
-                let c: f64 = scr[[q, xii - 1, xjj - 1]] + sd[[q, xii - 1, xjj - 1]];
-                scr[[q, xii, xjj]] = a.min(b.min(c));
+                let up: f64 = cur[q];
+                let a: f64 = up + 1.0;
+                let b: f64 = left[q] + 1.0;
+                let c: f64 = diag[q] + qvals[q] * dt;
+                diag[q] = up;
+                cur[q] = a.min(b.min(c));
+            }
+        }
+    }
+    out.copy_from_slice(&row[num_spikes_xjj * num_qvals..]);
+}
+
+// Function: _compute_spiketrain_distance_banded()
+//
+// Calls: None
+//
+// Exact banded version of _compute_spiketrain_distance() for sorted spike
+// trains. Moving a spike by |dt| costs q * |dt|, so once q * |dt| >= 2 it is
+// never cheaper than deleting one spike and inserting the other. For each q,
+// a[xii] can therefore only be matched with the spikes of b inside the window
+// |a[xii] - b[xjj]| < 2 / q, a band [lo, hi) that only moves forward as xii
+// grows. Cells outside the band are resolved in closed form:
+//     - left of the band, a[xii] can't be matched, so the value is the cell
+//       above + 1. `stamp` keeps the row each column was last written in and
+//       the elapsed rows are added when the column is read.
+//     - right of the band, b[xjj] can't be matched, so the value is the last
+//       band cell (`anchor`) + 1 per column.
+// For large q the work drops from O(n * m) to about O(n + m) per q value.
+fn _compute_spiketrain_distance_banded(
+    spk_train_a: &[f64],
+    spk_train_b: &[f64],
+    qvals: &[f64],
+    offset: f64,
+    scratch: &mut DistanceScratch,
+    out: &mut [f64],
+) {
+    let num_spikes_xii: usize = spk_train_a.len();
+    let num_spikes_xjj: usize = spk_train_b.len();
+    scratch.reserve_banded(num_spikes_xjj);
+    let row: &mut [f64] = &mut scratch.row[..num_spikes_xjj + 1];
+    let stamp: &mut [usize] = &mut scratch.stamp[..num_spikes_xjj + 1];
+    let mut cells: u64 = 0;
+
+    for (iq, &q) in qvals.iter().enumerate() {
+        let window: f64 = if q > 0.0 { 2.0 / q } else { f64::INFINITY };
+        for xjj in 0..=num_spikes_xjj {
+            row[xjj] = xjj as f64;
+            stamp[xjj] = 0;
+        }
+
+        // Columns <= prev_hi hold (value, row written) pairs for the previous
+        // row; columns > prev_hi are right of its band.
+        let mut prev_hi: usize = num_spikes_xjj;
+        let mut anchor: f64 = 0.0;
+        let mut lo: usize = 0;
+        let mut hi: usize = 0;
+        for (i, &spike) in spk_train_a.iter().enumerate() {
+            let xii: usize = i + 1;
+            let t_a: f64 = spike + offset;
+            while lo < num_spikes_xjj && spk_train_b[lo] <= t_a - window {
+                lo += 1;
+            }
+            while hi < num_spikes_xjj && spk_train_b[hi] < t_a + window {
+                hi += 1;
+            }
+            let band_start: usize = lo + 1;
+            let band_end: usize = hi;
+
+            // Columns that move from right of the previous band straight to
+            // left of this one
+            for xjj in prev_hi + 1..band_start {
+                row[xjj] = anchor + (xjj - prev_hi) as f64 + 1.0;
+                stamp[xjj] = xii;
+            }
+
+            let edge: usize = band_start - 1;
+            let mut diag: f64 = if edge <= prev_hi {
+                row[edge] + (xii - 1 - stamp[edge]) as f64
+            } else {
+                anchor + (edge - prev_hi) as f64
+            };
+            let mut left: f64 = diag + 1.0;
+            cells += (band_end + 1 - band_start) as u64;
+            for xjj in band_start..=band_end {
+                let up: f64 = if xjj <= prev_hi {
+                    row[xjj] + (xii - 1 - stamp[xjj]) as f64
+                } else {
+                    anchor + (xjj - prev_hi) as f64
+                };
+                let c: f64 = diag + q * (t_a - spk_train_b[xjj - 1]).abs();
+                let val: f64 = (up + 1.0).min((left + 1.0).min(c));
+                row[xjj] = val;
+                stamp[xjj] = xii;
+                diag = up;
+                left = val;
+            }
+            anchor = left;
+            prev_hi = band_end;
+        }
+
+        out[iq] = if num_spikes_xjj <= prev_hi {
+            row[num_spikes_xjj] + (num_spikes_xii - stamp[num_spikes_xjj]) as f64
+        } else {
+            anchor + (num_spikes_xjj - prev_hi) as f64
+        };
+    }
+    scratch.cells += cells;
+}
+
+// Function: _banded_pair_distance()
+//
+// Calls: _compute_spiketrain_distance(), _compute_spiketrain_distance_banded()
+//
+// q values whose 2 / q window spans both spike trains have nothing to skip,
+// so they are computed together by the rolling-row kernel; the rest go
+// through the banded kernel one q value at a time.
+fn _banded_pair_distance(
+    spk_train_a: &[f64],
+    spk_train_b: &[f64],
+    qvals: &[f64],
+    offset: f64,
+    scratch: &mut DistanceScratch,
+    out: &mut [f64],
+) {
+    let last_a: f64 = spk_train_a[spk_train_a.len() - 1] + offset;
+    let last_spike: f64 = last_a.max(spk_train_b[spk_train_b.len() - 1]);
+    let span: f64 = last_spike - (spk_train_a[0] + offset).min(spk_train_b[0]);
+
+    let mut q_full: Vec<f64> = std::mem::take(&mut scratch.q_full);
+    let mut q_band: Vec<f64> = std::mem::take(&mut scratch.q_band);
+    let mut out_full: Vec<f64> = std::mem::take(&mut scratch.out_full);
+    let mut out_band: Vec<f64> = std::mem::take(&mut scratch.out_band);
+    q_full.clear();
+    q_band.clear();
+    for &q in qvals {
+        if q * span < 2.0 {
+            q_full.push(q);
+        } else {
+            q_band.push(q);
+        }
+    }
+    out_full.resize(q_full.len(), 0.0);
+    out_band.resize(q_band.len(), 0.0);
+
+    if !q_full.is_empty() {
+        _compute_spiketrain_distance(spk_train_a, spk_train_b, &q_full, offset, scratch, &mut out_full);
+    }
+    if !q_band.is_empty() {
+        _compute_spiketrain_distance_banded(
+            spk_train_a,
+            spk_train_b,
+            &q_band,
+            offset,
+            scratch,
+            &mut out_band,
+        );
+    }
+
+    let (mut i_full, mut i_band): (usize, usize) = (0, 0);
+    for (iq, &q) in qvals.iter().enumerate() {
+        if q * span < 2.0 {
+            out[iq] = out_full[i_full];
+            i_full += 1;
+        } else {
+            out[iq] = out_band[i_band];
+            i_band += 1;
+        }
+    }
+
+    scratch.q_full = q_full;
+    scratch.q_band = q_band;
+    scratch.out_full = out_full;
+    scratch.out_band = out_band;
+}
+
+// Function: _pair_distance()
+//
+// Calls: _compute_spiketrain_distance(), _banded_pair_distance()
+//
+// Computes the distances between one pair of spike-trains for every q value
+// and writes them into `out`.
+fn _pair_distance(
+    spk_train_a: &[f64],
+    spk_train_b: &[f64],
+    qvals: &[f64],
+    banded: bool,
+    scratch: &mut DistanceScratch,
+    out: &mut [f64],
+) {
+    let curcounts_xi: usize = spk_train_a.len();
+    let curcounts_xj: usize = spk_train_b.len();
+
+    if curcounts_xi == 0 || curcounts_xj == 0 {
+        out.fill(curcounts_xi.max(curcounts_xj) as f64);
+        return;
+    }
+    if banded {
+        _banded_pair_distance(spk_train_a, spk_train_b, qvals, 0.0, scratch, out);
+    } else {
+        _compute_spiketrain_distance(spk_train_a, spk_train_b, qvals, 0.0, scratch, out);
+    }
+}
+
+// Function: _slide_pair_distance()
+//
+// Calls: _compute_spiketrain_distance(), _banded_pair_distance()
+//
+// Minimum distance between one pair of spike-trains over the offsets of the
+// first spike-train, for every q value. With `exact`, the offsets are the
+// window ends and every b[xjj] - a[xii] in (-1, 1): for a fixed alignment the
+// cost is convex and piecewise-linear in the offset with breakpoints where two
+// matched spikes coincide, so the minimum over the window is at one of them.
+//
+// Offsets that can't beat the current minimum for any q value are skipped:
+//     - the distance is never below |n - m|, so the search stops once every q
+//       value reaches it;
+//     - shifting by ds changes the cost of any alignment by at most
+//       q * min(n, m) * |ds|, which bounds the distance from the last
+//       evaluated offset.
+fn _slide_pair_distance(
+    spk_train_a: &[f64],
+    spk_train_b: &[f64],
+    qvals: &[f64],
+    offsets: &[f64],
+    exact: bool,
+    banded: bool,
+    scratch: &mut DistanceScratch,
+    out: &mut [f64],
+) {
+    let curcounts_xi: usize = spk_train_a.len();
+    let curcounts_xj: usize = spk_train_b.len();
+
+    if curcounts_xi == 0 || curcounts_xj == 0 {
+        out.fill(curcounts_xi.max(curcounts_xj) as f64);
+        return;
+    }
+
+    let mut candidates: Vec<f64> = std::mem::take(&mut scratch.candidates);
+    let mut current: Vec<f64> = std::mem::take(&mut scratch.current);
+    candidates.clear();
+    if exact {
+        candidates.push(-1.0);
+        candidates.push(1.0);
+        for &t_a in spk_train_a {
+            for &t_b in spk_train_b {
+                let shift: f64 = t_b - t_a;
+                if shift > -1.0 && shift < 1.0 {
+                    candidates.push(shift);
+                }
+            }
+        }
+        candidates.sort_by(|x, y| x.total_cmp(y));
+        candidates.dedup();
+    } else {
+        candidates.extend_from_slice(offsets);
+    }
+    current.resize(qvals.len(), 0.0);
+
+    let floor: f64 = (curcounts_xi as f64 - curcounts_xj as f64).abs();
+    let lipschitz: f64 = curcounts_xi.min(curcounts_xj) as f64;
+    out.fill(f64::INFINITY);
+
+    let mut last: Option<f64> = None;
+    for &offset in candidates.iter() {
+        if let Some(last_offset) = last {
+            let shift: f64 = (offset - last_offset).abs();
+            let improvable: bool = (0..qvals.len())
+                .any(|iq| floor.max(current[iq] - qvals[iq] * lipschitz * shift) < out[iq]);
+            if !improvable {
+                continue;
             }
         }
+
+        if banded {
+            _banded_pair_distance(spk_train_a, spk_train_b, qvals, offset, scratch, &mut current);
+        } else {
+            _compute_spiketrain_distance(spk_train_a, spk_train_b, qvals, offset, scratch, &mut current);
+        }
+        scratch.offsets += 1;
+        last = Some(offset);
+
+        let mut done: bool = true;
+        for iq in 0..qvals.len() {
+            out[iq] = out[iq].min(current[iq]);
+            if out[iq] > floor {
+                done = false;
+            }
+        }
+        if done {
+            break;
+        }
     }
+
+    scratch.candidates = candidates;
+    scratch.current = current;
+}
+
+// Function: _iterate_pairs()
+//
+// Calls: `pair_fn`
+//
+// Computes the distances of an explicit list of (xi, xj) pairs, xi indexing
+// `trains_a` and xj indexing `trains_b`, and returns them as a flat
+// (pairs.len(), num_qvals) buffer.
+//
+// The pairs are independent, so they are spread over the worker threads of
+// `pool`, each with its own DistanceScratch. `pair_fn` computes one pair,
+// e.g. _pair_distance() or _slide_pair_distance(). The work of each pair is
+// added to `progress`, and once it is cancelled the remaining pairs are
+// skipped and left at 0.
+fn _iterate_pairs<F>(
+    trains_a: &[&[f64]],
+    trains_b: &[&[f64]],
+    pairs: &[(usize, usize)],
+    num_qvals: usize,
+    pool: &rayon::ThreadPool,
+    progress: &PairProgress,
+    pair_fn: F,
+) -> Vec<f64>
+where
+    F: Fn(&[f64], &[f64], &mut DistanceScratch, &mut [f64]) + Sync,
+{
+    let mut results: Vec<f64> = vec![0.0; pairs.len() * num_qvals];
+    pool.install(|| {
+        results
+            .par_chunks_mut(num_qvals.max(1))
+            .zip(pairs.par_iter())
+            .for_each_init(DistanceScratch::new, |scratch, (out, &(xi, xj))| {
+                if progress.cancelled.load(Ordering::Relaxed) {
+                    return;
+                }
+                pair_fn(trains_a[xi], trains_b[xj], scratch, out);
+                progress.record(scratch);
+            });
+    });
+    results
+}
+
+// Function: _upper_triangle_pairs()
+//
+// Calls: None
+//
+// All (xi, xj) pairs with xi < xj < numt, row by row.
+fn _upper_triangle_pairs(numt: usize) -> Vec<(usize, usize)> {
+    (0..numt)
+        .flat_map(|xi| (xi + 1..numt).map(move |xj| (xi, xj)))
+        .collect()
 }
 
 // Function: _iterate_spiketrain_pairs()
 //
-// Calls: _compute_spiketrain_distance()
+// Calls: _iterate_pairs()
 //
 // This function computes the pairwise distances between all the spike trains.
 //
-// Calls _compute_spiketrain_distance(&scr, &sd) to compute the pairwise distances.
-// for each spike-train.
-fn _iterate_spiketrain_pairs(
+// The upper-triangle (xi, xj) pairs are computed by _iterate_pairs() and
+// written back into `d` once all are done.
+fn _iterate_spiketrain_pairs<F>(
     numt: usize,
-    cspks: &Vec<Array1<f64>>,
-    qvals: &ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>>,
+    cspks: &[&[f64]],
     num_qvals: usize,
-    d: &mut ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>>,
-) {
-    for xi in 0..numt - 1 {
-        for xj in xi + 1..numt {
-            let curcounts_xi: usize = cspks[xi].len();
-            let curcounts_xj: usize = cspks[xj].len();
-
-            if curcounts_xi != 0 && curcounts_xj != 0 {
-                let mut outer_diff: ArrayBase<OwnedRepr<f64>, Dim<[usize; 2]>> =
-                    cspks[xi].clone().into_shape((curcounts_xi, 1)).unwrap()
-                        - cspks[xj].clone().into_shape((1, curcounts_xj)).unwrap();
-
-                outer_diff.mapv_inplace(|x| x.abs());
-
-                let sd: ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>> =
-                    qvals.clone().into_shape((num_qvals, 1, 1)).unwrap() * &outer_diff.clone();
-                let mut scr: ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>> =
-                    Array3::<f64>::zeros((num_qvals, curcounts_xi + 1, curcounts_xj + 1));
-
-                scr.slice_mut(s![.., 1.., 0])
-                    .assign(&Array2::from_elem((num_qvals, curcounts_xi), 1.0));
-                scr.slice_mut(s![.., 0, 1..])
-                    .assign(&Array2::from_elem((num_qvals, curcounts_xj), 1.0));
-
-                _compute_spiketrain_distance(&mut scr, &sd.view());
-
-                let final_values: Array1<f64> = Array1::from_shape_vec(
-                    num_qvals,
-                    (0..num_qvals)
-                        .map(|q| scr[[q, scr.shape()[1] - 1, scr.shape()[2] - 1]])
-                        .collect(),
-                )
-                .unwrap();
-
-                d.slice_mut(s![xi, xj, ..]).assign(&final_values);
-            } else {
-                println!("d's shape: {:?}", d.dim());
-                d.slice_mut(s![xi, xj, ..])
-                    .fill(curcounts_xi.max(curcounts_xj) as f64);
-            }
+    d: &mut Array3<f64>,
+    pool: &rayon::ThreadPool,
+    progress: &PairProgress,
+    pair_fn: F,
+) where
+    F: Fn(&[f64], &[f64], &mut DistanceScratch, &mut [f64]) + Sync,
+{
+    let pairs: Vec<(usize, usize)> = _upper_triangle_pairs(numt);
+    let results: Vec<f64> = _iterate_pairs(cspks, cspks, &pairs, num_qvals, pool, progress, pair_fn);
+
+    for (k, &(xi, xj)) in pairs.iter().enumerate() {
+        for q in 0..num_qvals {
+            d[[xi, xj, q]] = results[k * num_qvals + q];
+        }
+    }
+}
+
+// Struct: PairProgress
+//
+// Work done by the pair loop, shared by the worker threads: pairs finished,
+// dynamic-programming cells computed and offsets evaluated by the sliding
+// search. Setting `cancelled` makes the workers skip the remaining pairs.
+struct PairProgress {
+    pairs: AtomicU64,
+    cells: AtomicU64,
+    offsets: AtomicU64,
+    cancelled: AtomicBool,
+}
+
+impl PairProgress {
+    fn new() -> Self {
+        PairProgress {
+            pairs: AtomicU64::new(0),
+            cells: AtomicU64::new(0),
+            offsets: AtomicU64::new(0),
+            cancelled: AtomicBool::new(false),
         }
     }
+
+    // Add the work counted in `scratch` for one finished pair and reset it.
+    fn record(&self, scratch: &mut DistanceScratch) {
+        self.cells.fetch_add(std::mem::take(&mut scratch.cells), Ordering::Relaxed);
+        self.offsets.fetch_add(std::mem::take(&mut scratch.offsets), Ordering::Relaxed);
+        self.pairs.fetch_add(1, Ordering::Relaxed);
+    }
+
+    fn counts(&self) -> (u64, u64, u64) {
+        (
+            self.pairs.load(Ordering::Relaxed),
+            self.cells.load(Ordering::Relaxed),
+            self.offsets.load(Ordering::Relaxed),
+        )
+    }
+}
+
+// Function: _report_progress()
+//
+// Calls: SpkdMonitor._update()
+//
+// Hand the counters of `progress` to the Python monitor, and cancel the pair
+// loop when it asks to stop.
+fn _report_progress(py: Python, monitor: &PyObject, progress: &PairProgress, last: bool) -> PyResult<()> {
+    let (pairs, cells, offsets) = progress.counts();
+    let keep_going: bool = monitor
+        .call_method1(py, "_update", (pairs, cells, offsets, last))?
+        .extract(py)?;
+    if !keep_going {
+        progress.cancelled.store(true, Ordering::Relaxed);
+    }
+    Ok(())
+}
+
+// Function: _run_monitored()
+//
+// Calls: `compute`, _report_progress()
+//
+// Run `compute` with the GIL released. Without a monitor that is all; with
+// one, `compute` runs on a scoped thread while the calling thread takes the
+// GIL every 50 ms to report `progress` to the monitor, which also lets a
+// cancellation from Python reach the workers. `num_pairs` is the size of the
+// pair loop, for the monitor's ETA.
+fn _run_monitored<T, F>(
+    py: Python,
+    monitor: Option<&PyAny>,
+    num_pairs: usize,
+    progress: &PairProgress,
+    compute: F,
+) -> PyResult<T>
+where
+    F: FnOnce() -> T + Send,
+    T: Send,
+{
+    let monitor: PyObject = match monitor {
+        None => return Ok(py.allow_threads(compute)),
+        Some(monitor) => monitor.into(),
+    };
+    let keep_going: bool = monitor.call_method1(py, "_begin", (num_pairs,))?.extract(py)?;
+    if !keep_going {
+        progress.cancelled.store(true, Ordering::Relaxed);
+    }
+
+    let (result, error): (T, Option<PyErr>) = py.allow_threads(|| {
+        std::thread::scope(|scope| {
+            let handle = scope.spawn(compute);
+            let mut error: Option<PyErr> = None;
+            while !handle.is_finished() {
+                std::thread::sleep(Duration::from_millis(50));
+                if error.is_none() {
+                    error = Python::with_gil(|py| _report_progress(py, &monitor, progress, false)).err();
+                    if error.is_some() {
+                        progress.cancelled.store(true, Ordering::Relaxed);
+                    }
+                }
+            }
+            (handle.join().expect("pair loop panicked"), error)
+        })
+    });
+    if let Some(error) = error {
+        return Err(error);
+    }
+    _report_progress(py, &monitor, progress, true)?;
+    Ok(result)
+}
+
+// Function: _build_thread_pool()
+//
+// Calls: None
+//
+// Build the rayon pool used for the pair loop. `n_jobs` of None runs one
+// thread, as n_jobs=None in the Python functions, so using several cores is
+// opt-in; 0 is rejected rather than left to rayon's one thread per core.
+fn _build_thread_pool(n_jobs: Option<usize>) -> PyResult<rayon::ThreadPool> {
+    let n: usize = n_jobs.unwrap_or(1);
+    if n == 0 {
+        return Err(PyValueError::new_err(
+            "n_jobs must be a positive integer or None.",
+        ));
+    }
+    rayon::ThreadPoolBuilder::new()
+        .num_threads(n)
+        .build()
+        .map_err(|e| PyValueError::new_err(e.to_string()))
 }
 
 // Function: _calculate_spkd_impl()
@@ -92,19 +631,22 @@ fn _iterate_spiketrain_pairs(
 // Initialize arrays to start the iteration and properly orient returned matrix.
 // The final resulting d matrix should contain 0's on the diagonal and the
 // upper triangular matrix should be the same as the lower triangular matrix.
-// Separate out this functionaliity for future use with multiprocessing.
-fn _calculate_spkd_impl(
-    cspks: &Vec<Array1<f64>>,
-    qvals: &ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>>,
+// Runs without touching the Python interpreter so the GIL can be released.
+fn _calculate_spkd_impl<F>(
+    cspks: &[&[f64]],
     num_qvals: usize,
-    num_vectors: usize,
-) -> ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>> {
-    let numt: usize = num_vectors; // number of spike trains
+    pool: &rayon::ThreadPool,
+    progress: &PairProgress,
+    pair_fn: F,
+) -> Array3<f64>
+where
+    F: Fn(&[f64], &[f64], &mut DistanceScratch, &mut [f64]) + Sync,
+{
+    let numt: usize = cspks.len(); // number of spike trains
 
-    let mut d: ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>> =
-        Array3::<f64>::zeros((numt, numt, num_qvals));
+    let mut d: Array3<f64> = Array3::<f64>::zeros((numt, numt, num_qvals));
 
-    _iterate_spiketrain_pairs(numt, cspks, qvals, num_qvals, &mut d);
+    _iterate_spiketrain_pairs(numt, cspks, num_qvals, &mut d, pool, progress, pair_fn);
 
     // Orient and mirror the matrix on the 1st and 2nd axes diagonal
     d = d.permuted_axes([1, 0, 2]);
@@ -113,54 +655,318 @@ fn _calculate_spkd_impl(
 }
 
 #[pyfunction]
+#[pyo3(signature = (cspks, qvals, n_jobs=None, banded=false, monitor=None))]
 // Function: _calculate_spkd_rs()
 //
-// Calls: _calculate_spkd_impl()
+// Calls: _calculate_spkd_impl(), _run_monitored()
 //
 // Entry point for the calculate_spkd function.
 //
 // Format input arrays from python into rust-friendly types and call the
-// _calculate_spkd_impl function to do the actual computation.
+// _calculate_spkd_impl function to do the actual computation. The pair loop
+// runs on `n_jobs` threads with the GIL released. `banded` selects the exact
+// banded kernel, which expects sorted spike times. Empty spike trains are
+// kept and get the spike count of the other train as their distance. With a
+// `monitor` (a Python SpkdMonitor) the progress of the pair loop is reported
+// while it runs, and the monitor can cancel it.
 pub fn calculate_spkd_rs(
     py: Python,
     cspks: &PyList,
     qvals: &PyArray1<f64>,
+    n_jobs: Option<usize>,
+    banded: bool,
+    monitor: Option<&PyAny>,
 ) -> PyResult<PyObject> {
-    let mut cspk_vectors: Vec<Array1<f64>> = Vec::new();
-    let mut num_vectors: usize = 0;
+    let cspk_vectors: Vec<Vec<f64>> = _extract_spike_trains(cspks)?;
+    let cspk_slices: Vec<&[f64]> = cspk_vectors.iter().map(|v| v.as_slice()).collect();
+
+    let qvals: Vec<f64> = qvals.to_owned_array().to_vec();
 
-    // Convert the PyList to a Vec<Array1<f64>> to simulate the python
-    // equivalent of a list of numpy arrays
+    let pool: rayon::ThreadPool = _build_thread_pool(n_jobs)?;
+    let progress: PairProgress = PairProgress::new();
+    let num_pairs: usize = cspk_slices.len() * cspk_slices.len().saturating_sub(1) / 2;
+    let d: Array3<f64> = _run_monitored(py, monitor, num_pairs, &progress, || {
+        _calculate_spkd_impl(&cspk_slices, qvals.len(), &pool, &progress, |a, b, scratch, out| {
+            _pair_distance(a, b, &qvals, banded, scratch, out)
+        })
+    })?;
+
+    // Convert the Array3 to a PyArray
+    let py_array: &numpy::PyArray3<f64> = d.into_pyarray(py);
+
+    // Convert the PyArray to a PyObject
+    Ok(py_array.to_object(py))
+}
+
+// Function: _extract_spike_trains()
+//
+// Calls: None
+//
+// Copy a PyList of float64 numpy arrays into owned vectors, keeping empty
+// spike trains so that indices line up with the Python list.
+fn _extract_spike_trains(cspks: &PyList) -> PyResult<Vec<Vec<f64>>> {
+    let mut cspk_vectors: Vec<Vec<f64>> = Vec::with_capacity(cspks.len());
     for pyarray in cspks.iter() {
         let numpy_array: &PyArray1<f64> = pyarray.extract()?;
-        let array: Array1<f64> = numpy_array.to_owned_array();
-        let shape: &[usize] = array.shape();
+        cspk_vectors.push(numpy_array.to_owned_array().to_vec());
+    }
+    Ok(cspk_vectors)
+}
+
+// Function: _csr_spike_trains()
+//
+// Calls: None
+//
+// Split the flat spike times `values` into one slice per spike-train, train i
+// being values[offsets[i]..offsets[i + 1]]. The slices borrow `values`, so no
+// spike time is copied. Empty spike-trains are kept.
+fn _csr_spike_trains<'a>(values: &'a [f64], offsets: &[i64]) -> PyResult<Vec<&'a [f64]>> {
+    if offsets.is_empty() || offsets[0] < 0 || offsets[offsets.len() - 1] as usize > values.len() {
+        return Err(PyValueError::new_err(
+            "offsets must start at 0 or more and end at most at the number of spike times",
+        ));
+    }
+    if offsets.windows(2).any(|w| w[1] < w[0]) {
+        return Err(PyValueError::new_err("offsets must be non-decreasing"));
+    }
+    Ok(offsets
+        .windows(2)
+        .map(|w| &values[w[0] as usize..w[1] as usize])
+        .collect())
+}
+
+#[pyfunction]
+#[pyo3(signature = (values, offsets, qvals, n_jobs=None, banded=false, monitor=None))]
+// Function: calculate_spkd_csr_rs()
+//
+// Calls: _csr_spike_trains(), _calculate_spkd_impl(), _run_monitored()
+//
+// Entry point for the calculate_spkd function with the flat (CSR) layout:
+// all spike times concatenated in `values`, spike-train i between
+// offsets[i] and offsets[i + 1]. The numpy buffers are borrowed, not copied,
+// and the pair loop is the same as calculate_spkd_rs().
+pub fn calculate_spkd_csr_rs(
+    py: Python,
+    values: PyReadonlyArray1<f64>,
+    offsets: PyReadonlyArray1<i64>,
+    qvals: &PyArray1<f64>,
+    n_jobs: Option<usize>,
+    banded: bool,
+    monitor: Option<&PyAny>,
+) -> PyResult<PyObject> {
+    let values: &[f64] = values.as_slice()?;
+    let offsets: &[i64] = offsets.as_slice()?;
+    let cspk_slices: Vec<&[f64]> = _csr_spike_trains(values, offsets)?;
+
+    let qvals: Vec<f64> = qvals.to_owned_array().to_vec();
+
+    let pool: rayon::ThreadPool = _build_thread_pool(n_jobs)?;
+    let progress: PairProgress = PairProgress::new();
+    let num_pairs: usize = cspk_slices.len() * cspk_slices.len().saturating_sub(1) / 2;
+    let d: Array3<f64> = _run_monitored(py, monitor, num_pairs, &progress, || {
+        _calculate_spkd_impl(&cspk_slices, qvals.len(), &pool, &progress, |a, b, scratch, out| {
+            _pair_distance(a, b, &qvals, banded, scratch, out)
+        })
+    })?;
+
+    let py_array: &numpy::PyArray3<f64> = d.into_pyarray(py);
+    Ok(py_array.to_object(py))
+}
+
+#[pyfunction]
+#[pyo3(signature = (cspks, qvals, offsets, exact=false, n_jobs=None, banded=false, monitor=None))]
+// Function: calculate_spkd_slide_rs()
+//
+// Calls: _calculate_spkd_impl(), _run_monitored()
+//
+// Entry point for the spkd_slide function.
+//
+// Same pair loop as calculate_spkd_rs(), but each pair runs the pruned offset
+// search of _slide_pair_distance() over the sorted `offsets` grid, or over the
+// exact candidate offsets when `exact` is set. Empty spike trains are kept and
+// get the spike count of the other train as their distance.
+pub fn calculate_spkd_slide_rs(
+    py: Python,
+    cspks: &PyList,
+    qvals: &PyArray1<f64>,
+    offsets: &PyArray1<f64>,
+    exact: bool,
+    n_jobs: Option<usize>,
+    banded: bool,
+    monitor: Option<&PyAny>,
+) -> PyResult<PyObject> {
+    let cspk_vectors: Vec<Vec<f64>> = _extract_spike_trains(cspks)?;
+    let cspk_slices: Vec<&[f64]> = cspk_vectors.iter().map(|v| v.as_slice()).collect();
+
+    let qvals: Vec<f64> = qvals.to_owned_array().to_vec();
+    let offsets: Vec<f64> = offsets.to_owned_array().to_vec();
+
+    let pool: rayon::ThreadPool = _build_thread_pool(n_jobs)?;
+    let progress: PairProgress = PairProgress::new();
+    let num_pairs: usize = cspk_slices.len() * cspk_slices.len().saturating_sub(1) / 2;
+    let d: Array3<f64> = _run_monitored(py, monitor, num_pairs, &progress, || {
+        _calculate_spkd_impl(&cspk_slices, qvals.len(), &pool, &progress, |a, b, scratch, out| {
+            _slide_pair_distance(a, b, &qvals, &offsets, exact, banded, scratch, out)
+        })
+    })?;
+
+    let py_array: &numpy::PyArray3<f64> = d.into_pyarray(py);
+    Ok(py_array.to_object(py))
+}
+
+// Function: _calculate_cross_impl()
+//
+// Calls: _iterate_pairs()
+//
+// Distances between every spike-train of `slices_a` and every spike-train of
+// `slices_b`, as a (num_a, num_b, num_qvals) array. When `same` is set the two
+// sets are the same, so only the upper triangle is computed and then mirrored.
+// Runs without touching the Python interpreter so the GIL can be released.
+fn _calculate_cross_impl<F>(
+    slices_a: &[&[f64]],
+    slices_b: &[&[f64]],
+    same: bool,
+    num_qvals: usize,
+    pool: &rayon::ThreadPool,
+    progress: &PairProgress,
+    pair_fn: F,
+) -> Array3<f64>
+where
+    F: Fn(&[f64], &[f64], &mut DistanceScratch, &mut [f64]) + Sync,
+{
+    let (num_a, num_b): (usize, usize) = (slices_a.len(), slices_b.len());
+    let pairs: Vec<(usize, usize)> = if same {
+        _upper_triangle_pairs(num_a)
+    } else {
+        (0..num_a)
+            .flat_map(|xi| (0..num_b).map(move |xj| (xi, xj)))
+            .collect()
+    };
+    let results: Vec<f64> = _iterate_pairs(slices_a, slices_b, &pairs, num_qvals, pool, progress, pair_fn);
 
-        if shape.is_empty() || shape[0] == 0 {
-            continue; // Skip empty arrays
+    let mut d: Array3<f64> = Array3::<f64>::zeros((num_a, num_b, num_qvals));
+    for (k, &(xi, xj)) in pairs.iter().enumerate() {
+        for q in 0..num_qvals {
+            d[[xi, xj, q]] = results[k * num_qvals + q];
+            if same {
+                d[[xj, xi, q]] = results[k * num_qvals + q];
+            }
         }
-        num_vectors += 1;
-        cspk_vectors.push(array);
     }
+    d
+}
 
-    let qvals: Array1<f64> = qvals.to_owned_array();
-    let numqvals: usize = qvals.len();
-    let q_reshaped: ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>> =
-        qvals.into_shape((numqvals, 1, 1)).unwrap();
+#[pyfunction]
+#[pyo3(signature = (cspks_a, cspks_b, qvals, n_jobs=None, banded=false, monitor=None))]
+// Function: calculate_spkd_cross_rs()
+//
+// Calls: _calculate_cross_impl(), _run_monitored()
+//
+// Distances between every spike-train of `cspks_a` and every spike-train of
+// `cspks_b`, as a (len(cspks_a), len(cspks_b), num_qvals) array. Uses the same
+// kernels and thread pool as calculate_spkd_rs(). When both arguments are the
+// same list object only the upper triangle is computed and then mirrored.
+pub fn calculate_spkd_cross_rs(
+    py: Python,
+    cspks_a: &PyList,
+    cspks_b: &PyList,
+    qvals: &PyArray1<f64>,
+    n_jobs: Option<usize>,
+    banded: bool,
+    monitor: Option<&PyAny>,
+) -> PyResult<PyObject> {
+    let same: bool = cspks_a.is(cspks_b);
+    let vectors_a: Vec<Vec<f64>> = _extract_spike_trains(cspks_a)?;
+    let vectors_b: Vec<Vec<f64>> = if same {
+        Vec::new()
+    } else {
+        _extract_spike_trains(cspks_b)?
+    };
+    let slices_a: Vec<&[f64]> = vectors_a.iter().map(|v| v.as_slice()).collect();
+    let slices_b: Vec<&[f64]> = if same {
+        slices_a.clone()
+    } else {
+        vectors_b.iter().map(|v| v.as_slice()).collect()
+    };
 
-    let d: ArrayBase<OwnedRepr<f64>, Dim<[usize; 3]>> =
-        _calculate_spkd_impl(&cspk_vectors, &q_reshaped, numqvals, num_vectors);
+    let qvals: Vec<f64> = qvals.to_owned_array().to_vec();
 
-    // Convert the ArrayBase to a PyArray
-    let py_array: &numpy::PyArray<f64, Dim<[usize; 3]>> = d.into_pyarray(py);
+    let pool: rayon::ThreadPool = _build_thread_pool(n_jobs)?;
+    let progress: PairProgress = PairProgress::new();
+    let num_pairs: usize = if same {
+        slices_a.len() * slices_a.len().saturating_sub(1) / 2
+    } else {
+        slices_a.len() * slices_b.len()
+    };
+    let d: Array3<f64> = _run_monitored(py, monitor, num_pairs, &progress, || {
+        _calculate_cross_impl(&slices_a, &slices_b, same, qvals.len(), &pool, &progress, |a, b, scratch, out| {
+            _pair_distance(a, b, &qvals, banded, scratch, out)
+        })
+    })?;
 
-    // Convert the PyArray to a PyObject
+    let py_array: &numpy::PyArray3<f64> = d.into_pyarray(py);
+    Ok(py_array.to_object(py))
+}
+
+#[pyfunction]
+#[pyo3(signature = (cspks_a, cspks_b, qvals, offsets, exact=false, n_jobs=None, banded=false, monitor=None))]
+// Function: calculate_spkd_slide_cross_rs()
+//
+// Calls: _calculate_cross_impl(), _run_monitored()
+//
+// Sliding distances between every spike-train of `cspks_a` and every
+// spike-train of `cspks_b`, as calculate_spkd_cross_rs(). The offset search of
+// _slide_pair_distance() shifts the spike-train of `cspks_a`, as
+// calculate_spkd_slide_rs() shifts the first spike-train of each pair.
+pub fn calculate_spkd_slide_cross_rs(
+    py: Python,
+    cspks_a: &PyList,
+    cspks_b: &PyList,
+    qvals: &PyArray1<f64>,
+    offsets: &PyArray1<f64>,
+    exact: bool,
+    n_jobs: Option<usize>,
+    banded: bool,
+    monitor: Option<&PyAny>,
+) -> PyResult<PyObject> {
+    let same: bool = cspks_a.is(cspks_b);
+    let vectors_a: Vec<Vec<f64>> = _extract_spike_trains(cspks_a)?;
+    let vectors_b: Vec<Vec<f64>> = if same {
+        Vec::new()
+    } else {
+        _extract_spike_trains(cspks_b)?
+    };
+    let slices_a: Vec<&[f64]> = vectors_a.iter().map(|v| v.as_slice()).collect();
+    let slices_b: Vec<&[f64]> = if same {
+        slices_a.clone()
+    } else {
+        vectors_b.iter().map(|v| v.as_slice()).collect()
+    };
+
+    let qvals: Vec<f64> = qvals.to_owned_array().to_vec();
+    let offsets: Vec<f64> = offsets.to_owned_array().to_vec();
+
+    let pool: rayon::ThreadPool = _build_thread_pool(n_jobs)?;
+    let progress: PairProgress = PairProgress::new();
+    let num_pairs: usize = if same {
+        slices_a.len() * slices_a.len().saturating_sub(1) / 2
+    } else {
+        slices_a.len() * slices_b.len()
+    };
+    let d: Array3<f64> = _run_monitored(py, monitor, num_pairs, &progress, || {
+        _calculate_cross_impl(&slices_a, &slices_b, same, qvals.len(), &pool, &progress, |a, b, scratch, out| {
+            _slide_pair_distance(a, b, &qvals, &offsets, exact, banded, scratch, out)
+        })
+    })?;
+
+    let py_array: &numpy::PyArray3<f64> = d.into_pyarray(py);
     Ok(py_array.to_object(py))
 }
 
 // Module: metricspace (rust implementation)
 //
-// Calls: _calculate_spkd_rs()
+// Calls: _calculate_spkd_rs(), calculate_spkd_slide_rs(), calculate_spkd_cross_rs(),
+//        calculate_spkd_slide_cross_rs(), calculate_spkd_csr_rs()
 //
 // Entry point for the rust_metricspace module.
 // Rust implementation of metricspace functions.
@@ -169,6 +975,14 @@ pub fn calculate_spkd_rs(
 fn metricspace_rs(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_wrapped(wrap_pyfunction!(calculate_spkd_rs))
         .unwrap();
+    m.add_wrapped(wrap_pyfunction!(calculate_spkd_slide_rs))
+        .unwrap();
+    m.add_wrapped(wrap_pyfunction!(calculate_spkd_cross_rs))
+        .unwrap();
+    m.add_wrapped(wrap_pyfunction!(calculate_spkd_slide_cross_rs))
+        .unwrap();
+    m.add_wrapped(wrap_pyfunction!(calculate_spkd_csr_rs))
+        .unwrap();
     Ok(())
 }
 
@@ -1,12 +1,74 @@
-from .model import *
-from .model.spkd import spkd, spkd_slide
-from .model.distclust import distclust
-from .entropy import histinfo, histjabi, histbi, tblxbi, histtpbi, tblxtpbi, tblxinfo
+import importlib
+
+# Public name -> subpackage defining it. Subpackages are imported on first attribute access (PEP 562), so
+# `import metricspace` does not load numpy; numba and the Rust extension are imported by the first call using them.
+_EXPORTS = {
+    "distclust": ".model",
+    "distclust_resample": ".model",
+    "distclust_jackknife": ".model",
+    "distclust_population": ".model",
+    "info_curve": ".model",
+    "InfoCurve": ".model",
+    "spkd": ".model",
+    "spkd_slide": ".model",
+    "spkd_cross": ".model",
+    "spkd_curve": ".model",
+    "SpkdCurve": ".model",
+    "spkd_blocked": ".model",
+    "DistanceStore": ".model",
+    "IncrementalSpkd": ".model",
+    "SpkdCache": ".model",
+    "SpkdIndex": ".model",
+    "SpkdMonitor": ".model",
+    "SpkdCancelled": ".model",
+    "spkd_multiunit": ".model",
+    "spkd_interval": ".model",
+    "SpkdExecutor": ".model",
+    "SpkdFuture": ".model",
+    "SharedArray": ".model",
+    "warmup": ".model",
+    "available_backends": ".model",
+    "select_backend": ".model",
+    "calibrate_backends": ".model",
+    "epoch": ".utils",
+    "histinfo": ".entropy",
+    "histjabi": ".entropy",
+    "histbi": ".entropy",
+    "tblxbi": ".entropy",
+    "histtpbi": ".entropy",
+    "tblxtpbi": ".entropy",
+    "tblxinfo": ".entropy",
+}
 
 __all__ = [
     "distclust",
+    "distclust_resample",
+    "distclust_jackknife",
+    "distclust_population",
+    "info_curve",
+    "InfoCurve",
     "spkd",
     "spkd_slide",
+    "spkd_cross",
+    "spkd_curve",
+    "SpkdCurve",
+    "spkd_blocked",
+    "DistanceStore",
+    "IncrementalSpkd",
+    "SpkdCache",
+    "SpkdIndex",
+    "SpkdMonitor",
+    "SpkdCancelled",
+    "spkd_multiunit",
+    "spkd_interval",
+    "SpkdExecutor",
+    "SpkdFuture",
+    "SharedArray",
+    "warmup",
+    "available_backends",
+    "select_backend",
+    "calibrate_backends",
+    "epoch",
     "histinfo",
     "histjabi",
     "histbi",
@@ -15,3 +77,15 @@ __all__ = [
     "tblxtpbi",
     "tblxinfo",
 ]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,8 +1,8 @@
-from . import histjabi as hjabi
-from . import histtpbi as htpbi
+from .histjabi import histjabi
+from .histtpbi import histtpbi
 
 
-def histbi(cvec, estimate_type, param=None):
+def histbi(cvec, estimate_type, param=None, axis=None):
     """
       Calculates the bias estimate for the naive plugin histogram entropy estimate, in bits.
 
@@ -12,14 +12,16 @@ def histbi(cvec, estimate_type, param=None):
             - 'ja' uses the jackknife estimate of the bias, which is the more conservative option.
             
           param (int, optional): Additional parameter for specific bias estimation. Default is None.
+          axis (int or tuple of int, optional): Axes holding the counts; the other axes are batch axes and are
+              kept in the result. Default is None, all axes.
 
       Returns:
-          float: Bias estimate in bits.
+          float or numpy.ndarray: Bias estimate in bits, one per batch element.
       """
     h = None
     if estimate_type == 'ja':
-        h = hjabi.histjabi(cvec)
-    elif type == 'tp':
+        h = histjabi(cvec, axis=axis)
+    elif estimate_type == 'tp':
         useall = 0 if param is None else param
-        h = htpbi.histtpbi(cvec, useall)
+        h = histtpbi(cvec, useall, axis=axis)
     return h
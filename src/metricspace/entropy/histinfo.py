@@ -1,23 +1,20 @@
 import numpy as np
 
 
-def histinfo(pvec):
+def histinfo(pvec, axis=None):
     """
        Calculates the histogram information, in bits. Computes the entropy of the table, not the mutual information
        between rows and columns as tblx* functions do.
 
        Args:
            pvec (numpy.ndarray): Vector of probabilities.
+           axis (int or tuple of int, optional): Axes holding the histogram; the other axes are batch axes and are
+               kept in the result. Default is None, all axes.
 
        Returns:
-           float: Histogram information in bits.
+           float or numpy.ndarray: Histogram information in bits, one per batch element.
        """
-    pnz = pvec.flatten()
-    pnz = pnz[pnz > 0]
-
-    if len(pnz) == 0:
-        h = 0
-    else:
-        h = -np.dot(pnz, np.log2(pnz))
-
-    return h
+    pvec = np.asarray(pvec, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(pvec > 0, -pvec * np.log2(pvec), 0.0)
+    return np.sum(terms, axis=axis)
@@ -1,23 +1,23 @@
 import numpy as np
 
 
-def histjabi(cvec):
+def histjabi(cvec, axis=None):
     """
         Calculates the jackknife bias that should be added to the naive plugin estimate, in bits.
 
         Args:
             cvec (numpy.ndarray): Vector of counts.
+            axis (int or tuple of int, optional): Axes holding the counts; the other axes are batch axes and are
+                kept in the result. Default is None, all axes.
 
         Returns:
-            float: Jackknife bias in bits.
+            float or numpy.ndarray: Jackknife bias in bits, one per batch element.
         """
-    cvec = np.reshape(cvec, (np.prod(cvec.shape), 1))
-    if np.max(cvec) <= 1:
-        h = 0
-        return h
-    nsamps = np.sum(cvec)
-    cv2 = cvec[cvec >= 2]
-    jdev = np.log((nsamps - 1) / nsamps) + (1 / (nsamps * (nsamps - 1))) * np.sum(
-        cv2 * (cv2 - 1) * np.log(cv2 / (cv2 - 1)))
-    h = -(nsamps - 1) * jdev / np.log(2)  # first-order correction
-    return h
+    cvec = np.asarray(cvec, dtype=np.float64)
+    nsamps = np.sum(cvec, axis=axis)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cv2 = np.where(cvec >= 2, cvec * (cvec - 1) * np.log(cvec / (cvec - 1)), 0.0)
+        jdev = np.log((nsamps - 1) / nsamps) + (1 / (nsamps * (nsamps - 1))) * np.sum(cv2, axis=axis)
+        h = -(nsamps - 1) * jdev / np.log(2)  # first-order correction
+    # [()] turns the 0-d result of a single vector into a scalar, as np.sum does
+    return np.where(np.max(cvec, axis=axis) <= 1, 0.0, h)[()]
@@ -1,24 +1,28 @@
 import numpy as np
 
 
-def histtpbi(cvec, useall=0):
+def histtpbi(cvec, useall=0, axis=None):
     """
         Calculates the Treves-Panzeri bias that should be added to the naive plugin estimate, in bits.
 
         Args:
             cvec (numpy.ndarray): Vector of counts.
-            useall (int, optional): Use all bins or specific bins based on the parameter. Default is 0.
+            useall (int, optional): Count all bins if nonzero, otherwise only the occupied bins. Default is 0.
+            axis (int or tuple of int, optional): Axes holding the counts; the other axes are batch axes and are
+                kept in the result. Default is None, all axes.
 
         Returns:
-            float: Treves-Panzeri bias in bits.
+            float or numpy.ndarray: Treves-Panzeri bias in bits, one per batch element.
         """
-    counts = np.reshape(cvec, (1, np.prod(cvec.shape)))
-    if np.sum(counts) == 0:
-        h = 0
-        return h
+    cvec = np.asarray(cvec, dtype=np.float64)
     if useall:
-        bins = len(counts)
+        bins = np.sum(np.ones_like(cvec), axis=axis)
     else:
-        bins = np.sum(counts > 0)
-    h = (bins - 1) / (2 * np.sum(counts) * np.log(2))
-    return h
+        bins = np.sum(cvec > 0, axis=axis)
+    return _tpbi(bins, np.sum(cvec, axis=axis))
+
+
+def _tpbi(bins, total):
+    """ Treves-Panzeri bias of `total` counts in `bins` bins, 0 where there are no counts; a scalar for 0-d inputs. """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total == 0, 0.0, (bins - 1) / (2 * total * np.log(2)))[()]
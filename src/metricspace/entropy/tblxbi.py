@@ -1,6 +1,6 @@
 import numpy as np
-from . import histbi as hbi
-from . import tblxtpbi as ttpbi
+from .histbi import histbi
+from .tblxtpbi import tblxtpbi
 
 
 def tblxbi(ctabl, estimate_type, param=None):
@@ -8,18 +8,24 @@ def tblxbi(ctabl, estimate_type, param=None):
         Calculates the Treves-Panzeri or jackknife bias correction to be added to the naive transinformation estimate, in bits.
 
         Args:
-            ctabl (numpy.ndarray): 2-dimensional array of counts.
+            ctabl (numpy.ndarray): 2-dimensional array of counts, or a stack of them with the tables on the last two
+                axes, e.g. ``(R, nq, K, K)``.
             estimate_type (str): Type of bias estimation. 'ja' for jackknife estimate, 'tr' for Treves-Panzeri estimate.
             param (int, optional): Additional parameter for specific bias estimation. Default is None.
 
         Returns:
-            float: Bias correction estimate in bits.
+            float or numpy.ndarray: Bias correction estimate in bits, one per table.
         """
+    ctabl = np.asarray(ctabl)
     h = None
     ty = estimate_type[0:2].lower()
     if ty == 'ja':
-        h = hbi.histbi(np.sum(ctabl, axis=0), 'ja') + hbi.histbi(np.sum(ctabl, axis=1), 'ja') - hbi.histbi(ctabl, 'ja')
+        h = (
+            histbi(np.sum(ctabl, axis=-2), 'ja', axis=-1)
+            + histbi(np.sum(ctabl, axis=-1), 'ja', axis=-1)
+            - histbi(ctabl, 'ja', axis=(-2, -1))
+        )
     elif ty == 'tr':
         useall = 0 if param is None else param
-        h = ttpbi.tblxtpbi(ctabl, useall)
+        h = tblxtpbi(ctabl, useall)
     return h
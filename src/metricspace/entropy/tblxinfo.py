@@ -1,5 +1,5 @@
 import numpy as np
-from . import histinfo as hinfo
+from .histinfo import histinfo
 
 
 def tblxinfo(tabl):
@@ -7,10 +7,16 @@ def tblxinfo(tabl):
     Calculates the transinformation, in bits.
 
     Args:
-        tabl (numpy.ndarray): 2-dimensional array of probabilities.
+        tabl (numpy.ndarray): 2-dimensional array of probabilities, or a stack of them with the tables on the last
+            two axes, e.g. ``(R, nq, K, K)``.
 
     Returns:
-        float: Transinformation in bits.
+        float or numpy.ndarray: Transinformation in bits, one per table.
     """
-    h = hinfo.histinfo(np.sum(tabl, axis=1)) + hinfo.histinfo(np.sum(tabl, axis=0)) - hinfo.histinfo(tabl)
+    tabl = np.asarray(tabl, dtype=np.float64)
+    h = (
+        histinfo(np.sum(tabl, axis=-1), axis=-1)
+        + histinfo(np.sum(tabl, axis=-2), axis=-1)
+        - histinfo(tabl, axis=(-2, -1))
+    )
     return h
@@ -1,5 +1,5 @@
 import numpy as np
-from . import histtpbi as htpbi
+from .histtpbi import histtpbi, _tpbi
 
 
 def tblxtpbi(ctabl, useall=0):
@@ -7,21 +7,24 @@ def tblxtpbi(ctabl, useall=0):
         Calculates the Treves-Panzeri bias correction to be added to the naive transinformation estimate, in bits.
 
         Args:
-            ctabl (numpy.ndarray): 2-dimensional array of counts.
-            useall (int, optional): Use all bins or specific bins based on the parameter. Default is 0.
+            ctabl (numpy.ndarray): 2-dimensional array of counts, or a stack of them with the tables on the last two
+                axes, e.g. ``(R, nq, K, K)``.
+            useall (int, optional): 1 counts all bins, -1 only the occupied bins, and 0 the bins of the table with
+                empty rows and columns removed. Default is 0.
 
         Returns:
-            float: Treves-Panzeri bias correction estimate in bits.
+            float or numpy.ndarray: Treves-Panzeri bias correction estimate in bits, one per table.
         """
+    ctabl = np.asarray(ctabl, dtype=np.float64)
+    cols, rows = np.sum(ctabl, axis=-2), np.sum(ctabl, axis=-1)
     h = None
     if useall == 1:
-        h = htpbi.histtpbi(np.sum(ctabl, axis=0), 1) + htpbi.histtpbi(np.sum(ctabl, axis=1), 1) - htpbi.histtpbi(ctabl,
-                                                                                                                 1)
+        h = histtpbi(cols, 1, axis=-1) + histtpbi(rows, 1, axis=-1) - histtpbi(ctabl, 1, axis=(-2, -1))
     elif useall == 0:
-        pruned = ctabl[np.where(np.sum(ctabl, axis=1) > 0), :][:, np.where(np.sum(ctabl, axis=0) > 0)]
-        h = htpbi.histtpbi(np.sum(pruned, axis=0), 1) + htpbi.histtpbi(np.sum(pruned, axis=1), 1) - htpbi.histtpbi(
-            pruned, 1)
+        # all bins of the table pruned of empty rows and columns
+        ncols, nrows = np.sum(cols > 0, axis=-1), np.sum(rows > 0, axis=-1)
+        total = np.sum(rows, axis=-1)
+        h = _tpbi(ncols, total) + _tpbi(nrows, total) - _tpbi(ncols * nrows, total)
     elif useall == -1:
-        h = htpbi.histtpbi(np.sum(ctabl, axis=0), 0) + htpbi.histtpbi(np.sum(ctabl, axis=1), 0) - htpbi.histtpbi(ctabl,
-                                                                                                                 0)
+        h = histtpbi(cols, 0, axis=-1) + histtpbi(rows, 0, axis=-1) - histtpbi(ctabl, 0, axis=(-2, -1))
     return h
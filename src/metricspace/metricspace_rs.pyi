@@ -2,22 +2,151 @@ from __future__ import annotations
 import numpy as np
 
 
-def calculate_spkd_rust(cspks: np.ndarray | list, qvals: list | np.ndarray) -> np.ndarray: 
+def calculate_spkd_rs(
+    cspks: list, qvals: np.ndarray, n_jobs: int | None = None, banded: bool = False, monitor=None
+) -> np.ndarray: 
     """
         Internal function to compute pairwise spike train distances with variable time precision for multiple cost values.
 
         Rust implementation. 
 
         Args:
-            cspks (nested iterable[list | np.ndarray]): Each inner list contains spike times for a single spike train.
-            qvals (list of float | int): List of time precision values to use in the computation.
+            cspks (list[np.ndarray]): Each inner array contains spike times for a single spike train.
+            qvals (np.ndarray): Array of time precision values to use in the computation.
+            n_jobs (int, optional): Number of worker threads for the pairwise loop. None uses one thread, as in
+                spkd; the Python callers pass the positive count resolved from their own n_jobs.
+            banded (bool, optional): Use the exact banded kernel. Spike times must be sorted.
+            monitor (SpkdMonitor, optional): Receives the progress of the pair loop, and cancels it when asked to.
 
         Returns:
-            ndarray: A 3D array containing pairwise spike train distances for each time precision value.
+            ndarray: A 3D array containing pairwise spike train distances for each time precision value. Empty
+                spike trains are kept.
 
         Raises:
                 TypeError: If cspks is not a list or numpy array.
+                ValueError: If n_jobs is 0, or if the worker thread pool cannot be created.
+    """
+    ...
+
+
+def calculate_spkd_csr_rs(
+    values: np.ndarray,
+    offsets: np.ndarray,
+    qvals: np.ndarray,
+    n_jobs: int | None = None,
+    banded: bool = False,
+    monitor=None,
+) -> np.ndarray:
+    """
+        Internal function to compute pairwise spike train distances for multiple cost values, from the flat (CSR)
+        spike train layout.
+
+        Rust implementation. The arrays are read in place, without copying them.
+
+        Args:
+            values (np.ndarray): Contiguous float64 array of every spike time, spike train after spike train.
+            offsets (np.ndarray): Contiguous int64 array; spike train i is values[offsets[i]:offsets[i + 1]].
+            qvals (np.ndarray): Array of time precision values to use in the computation.
+            n_jobs (int, optional): Number of worker threads for the pairwise loop. None uses one thread, as in
+                spkd; the Python callers pass the positive count resolved from their own n_jobs.
+            banded (bool, optional): Use the exact banded kernel. Spike times must be sorted.
+            monitor (SpkdMonitor, optional): Receives the progress of the pair loop, and cancels it when asked to.
+
+        Returns:
+            ndarray: A 3D array of shape (len(offsets) - 1, len(offsets) - 1, len(qvals)), filled below the
+                diagonal; mirror it to get the symmetric distances.
+
+        Raises:
+                ValueError: If offsets are not non-decreasing indices into values, if n_jobs is 0, or if the
+                    worker thread pool cannot be created.
+    """
+    ...
+
+
+def calculate_spkd_slide_rs(
+    cspks: list,
+    qvals: np.ndarray,
+    offsets: np.ndarray,
+    exact: bool = False,
+    n_jobs: int | None = None,
+    banded: bool = False,
+    monitor=None,
+) -> np.ndarray:
+    """
+        Internal function to compute the minimum pairwise spike train distances over time-translations of one
+        spike train, for multiple cost values.
+
+        Rust implementation.
+
+        Args:
+            cspks (list[np.ndarray]): Each inner array contains spike times for a single spike train.
+            qvals (np.ndarray): Array of time precision values to use in the computation.
+            offsets (np.ndarray): Sorted grid of offsets to search. Ignored when exact is True.
+            exact (bool, optional): Search every offset in [-1, 1] where two spikes coincide.
+            n_jobs (int, optional): Number of worker threads for the pairwise loop. None uses one thread, as in
+                spkd; the Python callers pass the positive count resolved from their own n_jobs.
+            banded (bool, optional): Use the exact banded kernel. Spike times must be sorted.
+            monitor (SpkdMonitor, optional): Receives the progress of the pair loop, and cancels it when asked to.
+
+        Returns:
+            ndarray: A 3D array containing pairwise spike train distances for each time precision value.
+    """
+    ...
+
+
+def calculate_spkd_cross_rs(
+    cspks_a: list, cspks_b: list, qvals: np.ndarray, n_jobs: int | None = None, banded: bool = False, monitor=None
+) -> np.ndarray:
+    """
+        Internal function to compute the spike train distances between every train of cspks_a and every train of
+        cspks_b, for multiple cost values.
+
+        Rust implementation. When both lists are the same object only the upper triangle is computed.
+
+        Args:
+            cspks_a (list[np.ndarray]): Each inner array contains spike times for a single spike train.
+            cspks_b (list[np.ndarray]): Each inner array contains spike times for a single spike train.
+            qvals (np.ndarray): Array of time precision values to use in the computation.
+            n_jobs (int, optional): Number of worker threads for the pairwise loop. None uses one thread, as in
+                spkd; the Python callers pass the positive count resolved from their own n_jobs.
+            banded (bool, optional): Use the exact banded kernel. Spike times must be sorted.
+            monitor (SpkdMonitor, optional): Receives the progress of the pair loop, and cancels it when asked to.
+
+        Returns:
+            ndarray: A 3D array of shape (len(cspks_a), len(cspks_b), len(qvals)).
+    """
+    ...
+
+
+def calculate_spkd_slide_cross_rs(
+    cspks_a: list,
+    cspks_b: list,
+    qvals: np.ndarray,
+    offsets: np.ndarray,
+    exact: bool = False,
+    n_jobs: int | None = None,
+    banded: bool = False,
+    monitor=None,
+) -> np.ndarray:
+    """
+        Internal function to compute the minimum spike train distances over time-translations between every train
+        of cspks_a and every train of cspks_b, for multiple cost values.
+
+        Rust implementation. The trains of cspks_a are the ones shifted. When both lists are the same object only
+        the upper triangle is computed.
+
+        Args:
+            cspks_a (list[np.ndarray]): Each inner array contains spike times for a single spike train.
+            cspks_b (list[np.ndarray]): Each inner array contains spike times for a single spike train.
+            qvals (np.ndarray): Array of time precision values to use in the computation.
+            offsets (np.ndarray): Sorted grid of offsets to search. Ignored when exact is True.
+            exact (bool, optional): Search every offset in [-1, 1] where two spikes coincide.
+            n_jobs (int, optional): Number of worker threads for the pairwise loop. None uses one thread, as in
+                spkd; the Python callers pass the positive count resolved from their own n_jobs.
+            banded (bool, optional): Use the exact banded kernel. Spike times must be sorted.
+            monitor (SpkdMonitor, optional): Receives the progress of the pair loop, and cancels it when asked to.
+
+        Returns:
+            ndarray: A 3D array of shape (len(cspks_a), len(cspks_b), len(qvals)).
     """
-    cspks: np.ndarray | list
-    qvals: np.ndarray | list 
     ...
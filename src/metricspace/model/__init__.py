@@ -1,4 +1,19 @@
-from .spkd import spkd, spkd_slide
+from .spkd import spkd, spkd_slide, spkd_cross
+from .spkd_curve import spkd_curve, SpkdCurve
+from .spkd_multiunit import spkd_multiunit
+from .spkd_interval import spkd_interval
+from .spkd_incremental import IncrementalSpkd
+from .spkd_cache import SpkdCache
+from .spkd_index import SpkdIndex
+from .monitor import SpkdMonitor, SpkdCancelled
+from .distance_store import spkd_blocked, DistanceStore
 from .distclust import distclust
+from .distclust_resample import distclust_resample
+from .distclust_jackknife import distclust_jackknife
+from .distclust_population import distclust_population
+from .info_curve import info_curve, InfoCurve
+from .executor import SpkdExecutor, SpkdFuture, SharedArray
+from .warmup import warmup
+from .backends import available_backends, select_backend, calibrate_backends
 
-__all__ = ['distclust', 'spkd', 'spkd_slide']
+__all__ = ['distclust', 'distclust_resample', 'distclust_jackknife', 'distclust_population', 'info_curve', 'InfoCurve', 'spkd', 'spkd_slide', 'spkd_cross', 'spkd_curve', 'SpkdCurve', 'spkd_blocked', 'DistanceStore', 'IncrementalSpkd', 'SpkdCache', 'SpkdIndex', 'SpkdMonitor', 'SpkdCancelled', 'spkd_multiunit', 'spkd_interval', 'SpkdExecutor', 'SpkdFuture', 'SharedArray', 'warmup', 'available_backends', 'select_backend', 'calibrate_backends']
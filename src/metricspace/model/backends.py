@@ -0,0 +1,201 @@
+import time
+import functools
+import importlib
+import importlib.util
+import numpy as np
+
+# Engines computing pairwise distances, fastest first on equal footing:
+#   'rs'    - the compiled Rust extension, rayon threads
+#   'numba' - one prange-parallel numba loop over all pairs; plain and banded distances only
+#   'py'    - a Python loop over the pairs calling numba kernels, single-threaded; every feature
+BACKENDS = ("rs", "numba", "py")
+
+# Cost model of each backend: seconds per call, per spike train pair and per dynamic program cell on one thread.
+# Rough figures of a recent x86 core; calibrate_backends() replaces them with measurements of this machine.
+_PROFILE = {
+    "rs": (5e-5, 1e-7, 2e-9),
+    "numba": (2e-4, 1e-7, 2e-9),
+    "py": (1e-5, 3e-6, 2e-9),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _rust_importable():
+    """ Whether the Rust extension can be imported. Imports it, once per process. """
+    try:
+        importlib.import_module("metricspace.metricspace_rs")
+    except ImportError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def _numba_installed():
+    """ Whether numba is installed, without importing it. """
+    return importlib.util.find_spec("numba") is not None
+
+
+def available_backends() -> tuple:
+    """
+    Backends that can run in this installation.
+
+    The Rust extension is optional: wheels built without it, or installs that cannot compile it, fall back to the
+    numba backends.
+
+    Returns
+    -------
+    tuple of str
+        The available names of ``('rs', 'numba', 'py')``, in that order.
+
+    """
+    available = []
+    if _rust_importable():
+        available.append("rs")
+    if _numba_installed():
+        available += ["numba", "py"]
+    return tuple(available)
+
+
+def select_backend(cspks: list | tuple, qvals: list | np.ndarray, n_jobs: int | None = None, slide: bool = False):
+    """
+    The backend :func:`spkd` (or :func:`spkd_slide` with `slide`) picks for these arguments when none is given.
+
+    Parameters
+    ----------
+    cspks : list[np.ndarray or list] or tuple(np.ndarray, np.ndarray)
+        Spike trains, as for :func:`spkd`.
+    qvals : list or np.ndarray
+        Cost values.
+    n_jobs : int, optional
+        Number of threads, as for :func:`spkd`. Defaults to None, 1.
+    slide : bool, optional
+        Whether the sliding distance is computed, which the 'numba' backend does not support. Defaults to False.
+
+    Returns
+    -------
+    str
+        One of ``'rs'``, ``'numba'`` and ``'py'``.
+
+    """
+    from .spkd import _resolve_n_jobs
+
+    if isinstance(cspks, tuple):
+        counts = np.diff(np.asarray(cspks[1], dtype=np.int64))
+    else:
+        counts = np.array([len(x) for x in cspks], dtype=np.int64)
+    return _resolve_backend(None, None, counts, None, np.size(qvals), _resolve_n_jobs(n_jobs), slide)
+
+
+def calibrate_backends(repeat: int = 3) -> dict:
+    """
+    Measure the cost model :func:`select_backend` uses on this machine.
+
+    Every available backend is timed, on one thread, on a tiny problem, on many short spike trains and on a few
+    long ones, and its cost per call, per pair and per dynamic program cell is fitted to the timings. The model
+    is kept for the rest of the process; call this once, e.g. in a worker initializer after :func:`warmup`.
+
+    Parameters
+    ----------
+    repeat : int, optional
+        Timed runs per problem; the fastest counts. Defaults to 3.
+
+    Returns
+    -------
+    dict
+        ``{backend: (seconds per call, seconds per pair, seconds per cell)}`` of the available backends.
+
+    """
+    from .spkd import spkd
+
+    rng = np.random.default_rng(0)
+    problems = [
+        ([np.array([0.5]), np.array([0.5])], np.ones(1)),
+        ([np.sort(rng.uniform(0, 1, 2)) for _ in range(300)], np.ones(1)),
+        ([np.sort(rng.uniform(0, 1, 300)) for _ in range(8)], np.ones(8)),
+    ]
+    work = np.array([[1.0, *_work(np.array([len(x) for x in cspks]), None, len(qvals))] for cspks, qvals in problems])
+    for backend in available_backends():
+        timings = []
+        for cspks, qvals in problems:
+            spkd(cspks, qvals, backend=backend)
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                spkd(cspks, qvals, backend=backend)
+                runs.append(time.perf_counter() - start)
+            timings.append(min(runs))
+        coefficients = np.linalg.lstsq(work, np.array(timings), rcond=None)[0]
+        _PROFILE[backend] = tuple(float(max(c, 0.0)) for c in coefficients)
+    return {backend: _PROFILE[backend] for backend in available_backends()}
+
+
+def _work(counts_a, counts_b, nq):
+    """
+    Number of spike train pairs and of dynamic program cells of a call.
+
+    Args:
+        counts_a (numpy.ndarray): Spike counts of the first spike trains.
+        counts_b (numpy.ndarray or None): Spike counts of the second spike trains, or None for the pairs of the
+            first ones.
+        nq (int): Number of cost values.
+
+    Returns:
+        tuple: ``(pairs, cells)``.
+    """
+    counts_a = counts_a.astype(np.float64)
+    if counts_b is None:
+        total = counts_a.sum()
+        return len(counts_a) * (len(counts_a) - 1) / 2, (total * total - np.dot(counts_a, counts_a)) / 2 * nq
+    return len(counts_a) * len(counts_b), counts_a.sum() * float(np.sum(counts_b)) * nq
+
+
+def _resolve_backend(backend, use_rs, counts_a, counts_b, nq, n_jobs, slide=False):
+    """
+    The backend to run a call on.
+
+    Args:
+        backend (str or None): Backend asked for, or None.
+        use_rs (bool or None): True for the Rust extension, False for a numba backend, None for any.
+        counts_a (numpy.ndarray): Spike counts of the first spike trains.
+        counts_b (numpy.ndarray or None): Spike counts of the second spike trains, or None for the pairs of the
+            first ones.
+        nq (int): Number of cost values.
+        n_jobs (int): Resolved number of threads.
+        slide (bool): Whether the sliding distance is computed.
+
+    Returns:
+        str: The backend of lowest estimated time among the available ones allowed by the arguments.
+
+    Raises:
+        ValueError: If `backend` is unknown, contradicts `use_rs` or does not support the sliding distance.
+        ImportError: If the backend asked for is not installed.
+    """
+    if backend is not None:
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {', '.join(map(repr, BACKENDS))} or None, got {backend!r}.")
+        if use_rs is not None and use_rs != (backend == "rs"):
+            raise ValueError(f"use_rs={use_rs} contradicts backend={backend!r}.")
+        if slide and backend == "numba":
+            raise ValueError("The 'numba' backend does not compute sliding distances; use 'rs' or 'py'.")
+        candidates = [backend]
+    elif use_rs:
+        candidates = ["rs"]
+    else:
+        candidates = [b for b in BACKENDS if not (slide and b == "numba") and not (use_rs is False and b == "rs")]
+
+    available = [b for b in candidates if b in available_backends()]
+    if not available:
+        if candidates == ["rs"]:
+            raise ImportError("The Rust extension metricspace_rs is not installed; use the 'numba' or 'py' backend.")
+        raise ImportError(f"None of the backends {candidates} can be imported; numba is required without Rust.")
+    if len(available) == 1:
+        return available[0]
+
+    pairs, cells = _work(counts_a, counts_b, nq)
+
+    def estimate(b):
+        per_call, per_pair, per_cell = _PROFILE[b]
+        threads = 1 if b == "py" else n_jobs
+        return per_call + (pairs * per_pair + cells * per_cell) / threads
+
+    return min(available, key=estimate)
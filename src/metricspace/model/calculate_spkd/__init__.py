@@ -1,3 +1,3 @@
-from .spkd_functions import calculate_spkd_py
+from .spkd_functions import calculate_spkd_py, calculate_spkd_cross_py
 
-__all__ = ["calculate_spkd_py"]
+__all__ = ["calculate_spkd_py", "calculate_spkd_cross_py"]
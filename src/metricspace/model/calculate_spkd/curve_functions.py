@@ -0,0 +1,154 @@
+"""metricspace.model.calculate_spkd.curve_functions.py
+
+Contains internal kernels for the exact spike distance cost curve. These functions are
+called by the public function in metricspace.model.spkd_curve.py.
+
+For a fixed alignment of two spike trains with ``k`` matched spike pairs, the cost is
+``(n + m - 2k) + q * S``, where ``S`` is the summed time shift of the matched pairs. The distance is the minimum
+of these lines over all alignments, a concave piecewise-linear function of q. Only the smallest ``S`` for each
+``k`` can ever be on the lower envelope, so one dynamic program over (spike, spike, k) gives the whole curve.
+
+"""
+import numpy as np
+from numba import jit
+
+# summed shift of a number of matches no alignment reaches; finite, as fastmath kernels assume no infinities
+_UNREACHABLE = 1e300
+
+
+def calculate_curve_py(spk_train_a, spk_train_b, row_prev, row_cur):
+    """
+    Internal function to compute the exact cost curve of a pair of spike trains.
+
+    Parameters
+    ----------
+    spk_train_a : np.ndarray
+        Sorted spike times of the first spike train.
+    spk_train_b : np.ndarray
+        Sorted spike times of the second spike train.
+    row_prev, row_cur : np.ndarray
+        Scratch arrays of shape at least ``(len(spk_train_b) + 1, min(len(spk_train_a), len(spk_train_b)) + 1)``.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        ``(starts, intercepts, slopes)`` of the lower envelope, ordered by increasing q. Segment ``i`` gives the
+        distance ``intercepts[i] + q * slopes[i]`` for ``starts[i] <= q < starts[i + 1]``; ``starts[0]`` is 0.
+
+    """
+    n, m = len(spk_train_a), len(spk_train_b)
+    if n == 0 or m == 0:
+        return np.zeros(1), np.array([float(n + m)]), np.zeros(1)
+    match_costs = _match_costs_py(spk_train_a, spk_train_b, row_prev, row_cur)
+    return _lower_envelope_py(match_costs, n, m)
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _match_costs_py(spk_train_a, spk_train_b, row_prev, row_cur):
+    """
+    Smallest summed time shift needed to match exactly ``k`` spike pairs, for every ``k``.
+
+    ``row[j, k]`` holds the smallest summed ``|a - b|`` over alignments of ``a[:i]`` and ``b[:j]`` with ``k``
+    matched pairs, where each element is the minimum of the element above, the element to the left, and the
+    up-left element with one more match. Two rows are kept and swapped as ``i`` grows.
+
+    Args:
+        spk_train_a (numpy.ndarray): Spike times of the first spike train, length n.
+        spk_train_b (numpy.ndarray): Spike times of the second spike train, length m.
+        row_prev (numpy.ndarray): Scratch array of shape at least ``(m + 1, min(n, m) + 1)``.
+        row_cur (numpy.ndarray): Scratch array of the same shape as `row_prev`.
+
+    Returns:
+        numpy.ndarray: 1D array of length ``min(n, m) + 1``, `_UNREACHABLE` where no alignment has that many
+            matches.
+    """
+    n = spk_train_a.shape[0]
+    m = spk_train_b.shape[0]
+    kmax = min(n, m)
+    for xjj in range(m + 1):
+        row_prev[xjj, 0] = 0.0
+        row_cur[xjj, 0] = 0.0
+        for k in range(1, kmax + 1):
+            row_prev[xjj, k] = _UNREACHABLE
+            row_cur[xjj, k] = _UNREACHABLE
+
+    for xii in range(1, n + 1):
+        t_a = spk_train_a[xii - 1]
+        for xjj in range(1, m + 1):
+            dt = abs(t_a - spk_train_b[xjj - 1])
+            for k in range(1, min(xii, xjj) + 1):
+                val = min(row_prev[xjj, k], row_cur[xjj - 1, k])
+                row_cur[xjj, k] = min(val, row_prev[xjj - 1, k - 1] + dt)
+        row_prev, row_cur = row_cur, row_prev
+
+    return row_prev[m, :kmax + 1].copy()
+
+
+@jit(nopython=True, cache=True)
+def _lower_envelope_py(match_costs, n, m):
+    """
+    Lower envelope over ``q >= 0`` of the lines ``(n + m - 2k) + q * match_costs[k]``.
+
+    Lines are visited from the most matches (smallest intercept, largest slope) to the fewest, so the envelope
+    is built left to right with the usual convex-hull stack.
+
+    Args:
+        match_costs (numpy.ndarray): Output of `_match_costs_py`.
+        n (int): Number of spikes in the first spike train.
+        m (int): Number of spikes in the second spike train.
+
+    Returns:
+        tuple of numpy.ndarray: ``(starts, intercepts, slopes)`` of the envelope segments.
+    """
+    kmax = match_costs.shape[0] - 1
+    intercepts = np.empty(kmax + 1)
+    slopes = np.empty(kmax + 1)
+    starts = np.empty(kmax + 1)
+    size = 0
+    for k in range(kmax, -1, -1):
+        slope = match_costs[k]
+        if slope >= _UNREACHABLE:
+            continue
+        intercept = float(n + m - 2 * k)
+        if size > 0 and slopes[size - 1] <= slope:
+            continue  # same or steeper slope with a higher intercept is never below the envelope
+        while size > 0:
+            start = (intercept - intercepts[size - 1]) / (slopes[size - 1] - slope)
+            if start <= starts[size - 1]:
+                size -= 1
+            else:
+                break
+        if size == 0:
+            start = 0.0
+        intercepts[size] = intercept
+        slopes[size] = slope
+        starts[size] = start
+        size += 1
+    return starts[:size].copy(), intercepts[:size].copy(), slopes[:size].copy()
+
+
+@jit(nopython=True, cache=True)
+def _evaluate_curves_py(numt, offsets, starts, intercepts, slopes, qvals, d):
+    """
+    Fill the ``(numt, numt, len(qvals))`` distance array `d` from the stored envelopes of every pair.
+
+    Args:
+        numt (int): Number of spike trains.
+        offsets (numpy.ndarray): Start of each pair's segments in the flat segment arrays, length ``npairs + 1``.
+        starts (numpy.ndarray): Flat array of segment start q values.
+        intercepts (numpy.ndarray): Flat array of segment intercepts.
+        slopes (numpy.ndarray): Flat array of segment slopes.
+        qvals (numpy.ndarray): Non-negative cost values to evaluate.
+        d (numpy.ndarray): Output array, updated in place.
+    """
+    pair = 0
+    for xi in range(numt - 1):
+        for xj in range(xi + 1, numt):
+            lo = offsets[pair]
+            hi = offsets[pair + 1]
+            for iq in range(qvals.shape[0]):
+                seg = lo + np.searchsorted(starts[lo:hi], qvals[iq], side="right") - 1
+                val = intercepts[seg] + qvals[iq] * slopes[seg]
+                d[xi, xj, iq] = val
+                d[xj, xi, iq] = val
+            pair += 1
@@ -0,0 +1,56 @@
+"""metricspace.model.calculate_spkd.index_functions.py
+
+Contains the internal kernel of the nearest-neighbour index in metricspace.model.spkd_index.py. A query compares
+the query spike train with one vantage point or one leaf of the tree at a time, so the loop over the library spike
+trains of a call runs compiled, and the Python search only handles the tree.
+
+"""
+import numpy as np
+from numba import jit
+from .spkd_functions import _distance_optimized_py, _distance_banded_py
+
+
+@jit(nopython=True, cache=True)
+def _distances_to_py(spk_train, values, offsets, members, qvals, tau, banded, row, diag, stamp, out):
+    """
+    Distances from one spike train to some spike trains of a library, at one cost value.
+
+    The distance is at least the spike count difference, so library spike trains whose count differs from that of
+    `spk_train` by more than `tau` are not computed and get an infinite distance. `tau` and the output may be
+    infinite, so the kernel is not compiled with fastmath, which assumes there are no infinities.
+
+    Args:
+        spk_train (numpy.ndarray): Spike times of the query spike train.
+        values (numpy.ndarray): Concatenated spike times of the library.
+        offsets (numpy.ndarray): Start of each library spike train in `values`, plus the end of the last one.
+        members (numpy.ndarray): Indices of the library spike trains to compare with.
+        qvals (numpy.ndarray): Array of the one cost factor.
+        tau (float): Largest distance of interest.
+        banded (bool): Whether to use `_distance_banded_py` instead of `_distance_optimized_py`.
+        row (numpy.ndarray): Scratch array of shape at least ``(m + 1, 1)`` for the longest library train.
+        diag (numpy.ndarray): Scratch array of shape ``(1,)``.
+        stamp (numpy.ndarray): Integer scratch array of shape at least ``(m + 1,)``.
+        out (numpy.ndarray): Array of the shape of `members` that receives the distances.
+
+    Returns:
+        int: Number of distances computed.
+    """
+    n = spk_train.shape[0]
+    flat_row = row.reshape(-1)
+    computed = 0
+    for r in range(members.shape[0]):
+        i = members[r]
+        other = values[offsets[i]:offsets[i + 1]]
+        m = other.shape[0]
+        if abs(n - m) > tau:
+            out[r] = np.inf
+            continue
+        computed += 1
+        if n == 0 or m == 0:
+            out[r] = max(n, m)
+        elif banded:
+            _distance_banded_py(spk_train, other, qvals, 0.0, flat_row, stamp, out[r:r + 1])
+        else:
+            _distance_optimized_py(spk_train, other, qvals, 0.0, row, diag)
+            out[r] = row[m, 0]
+    return computed
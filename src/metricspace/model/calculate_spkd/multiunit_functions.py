@@ -0,0 +1,271 @@
+"""metricspace.model.calculate_spkd.multiunit_functions.py
+
+Contains internal kernels for the multi-unit (labeled-line) spike distance. These functions are
+called by the public function in metricspace.model.spkd_multiunit.py.
+
+A multi-unit spike train is a list of spike trains, one per unit. Besides inserting or deleting a spike (cost 1)
+and shifting it (cost ``q * |dt|``), a spike can change its unit label at cost ``k``. Matched spikes of the same
+unit of one train never need to cross, so the dynamic program runs over the spikes of the other train in time
+order and keeps one counter per unit for the first train. Its states form a lattice with
+``prod(n_unit + 1)`` points per layer, instead of one dimension per spike.
+
+Two spikes further apart than ``2 / q`` are never matched, which confines the useful states of each layer to
+a box around the current spike time. Only that box is computed.
+
+The whole pair loop is compiled and parallelized over the rows of the distance matrix with prange, like the
+'numba' backend of spkd.
+
+"""
+import numpy as np
+import numba
+from numba import jit, prange
+from .parallel_functions import _balanced_rows
+
+_UNREACHABLE = 1e300
+
+
+def calculate_spkd_multiunit_py(cspks, qvals, k, n_jobs=1):
+    """
+    Internal function to compute pairwise multi-unit spike train distances for multiple cost values.
+
+    The trials are stored in one flat array, trial by trial and unit by unit within a trial, and the pairs are
+    computed by one numba loop parallelized over the rows of the distance matrix, as the 'numba' backend of
+    :func:`metricspace.spkd` does.
+
+    Parameters
+    ----------
+    cspks : list[list[np.ndarray]]
+        Each element is one trial, a list with the sorted spike times of each unit. Every trial has the same
+        number of units.
+    qvals : np.ndarray
+        Array of time precision values to use in the computation.
+    k : float
+        Cost of changing the unit label of a spike, ``0 < k < 2``.
+    n_jobs : int, optional
+        Number of threads, capped at numba's ``NUMBA_NUM_THREADS``. Defaults to 1.
+
+    Returns
+    -------
+    ndarray
+        A 3D array of shape ``(len(cspks), len(cspks), len(qvals))``.
+
+    """
+    trains = [np.asarray(x, dtype=np.float64).reshape(-1) for trial in cspks for x in trial]
+    offsets = np.zeros(len(trains) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in trains], out=offsets[1:])
+    values = np.concatenate(trains) if trains else np.zeros(0)
+    qvals = np.asarray(qvals, dtype=np.float64)
+    positive = np.flatnonzero(qvals > 0)
+    positive = positive[np.argsort(qvals[positive], kind="stable")]
+    numt = len(cspks)
+    d = np.zeros((numt, numt, len(qvals)))
+
+    threads = numba.get_num_threads()
+    numba.set_num_threads(max(1, min(n_jobs, numba.config.NUMBA_NUM_THREADS)))
+    try:
+        _multiunit_pairs_parallel_py(
+            values, offsets, len(cspks[0]), qvals, positive, float(k), _balanced_rows(numt, True), d
+        )
+    finally:
+        numba.set_num_threads(threads)
+    return d
+
+
+@jit(nopython=True, parallel=True, fastmath=True, cache=True)
+def _multiunit_pairs_parallel_py(values, offsets, num_units, qvals, positive, k, rows, d):
+    """
+    Compute the upper triangle of the multi-unit distances, one row per prange iteration, and mirror it.
+
+    Args:
+        values (numpy.ndarray): Spike times of every unit of every trial, concatenated trial by trial.
+        offsets (numpy.ndarray): Start of unit ``l`` of trial ``t`` at ``offsets[t * num_units + l]``, plus the
+            end of the last one.
+        num_units (int): Number of units of each trial.
+        qvals (numpy.ndarray): 1D array of cost factors.
+        positive (numpy.ndarray): Indices of the positive cost factors, in increasing order of cost.
+        k (float): Relabel cost.
+        rows (numpy.ndarray): Indices of the trials to compute the rows of.
+        d (numpy.ndarray): Array of shape ``(numt, numt, len(qvals))`` that receives the distances.
+    """
+    numt = d.shape[0]
+    for r in prange(rows.shape[0]):
+        xi = rows[r]
+        for xj in range(xi + 1, numt):
+            _multiunit_pair_py(values, offsets, num_units, xi, xj, qvals, positive, k, d[xi, xj])
+            for q in range(qvals.shape[0]):
+                d[xj, xi, q] = d[xi, xj, q]
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _multiunit_pair_py(values, offsets, num_units, ta, tb, qvals, positive, k, out):
+    """
+    Multi-unit distance of one pair of trials for every cost value.
+
+    Args:
+        values (numpy.ndarray): Spike times of every unit of every trial, as in `_multiunit_pairs_parallel_py`.
+        offsets (numpy.ndarray): Start of each unit of each trial in `values`, plus the end of the last one.
+        num_units (int): Number of units of each trial.
+        ta (int): Index of the first trial.
+        tb (int): Index of the second trial.
+        qvals (numpy.ndarray): 1D array of cost factors.
+        positive (numpy.ndarray): Indices of the positive cost factors, in increasing order of cost.
+        k (float): Relabel cost.
+        out (numpy.ndarray): Array of shape ``(len(qvals),)`` that receives the distances.
+    """
+    counts_a = np.diff(offsets[ta * num_units:(ta + 1) * num_units + 1])
+    counts_b = np.diff(offsets[tb * num_units:(tb + 1) * num_units + 1])
+    total_a = counts_a.sum()
+    total_b = counts_b.sum()
+    if total_a == 0 or total_b == 0:
+        out[:] = total_a + total_b
+        return
+    # the distance is symmetric, so put the train with the smaller lattice on the unit-counter side
+    if np.prod(counts_b + 1.0) < np.prod(counts_a + 1.0):
+        ta, tb = tb, ta
+        counts_a, counts_b = counts_b, counts_a
+
+    # at q = 0 only the label changes cost anything: pair spikes of the same unit first, then relabel the rest
+    excess_a = np.maximum(counts_a - counts_b, 0).sum()
+    excess_b = np.maximum(counts_b - counts_a, 0).sum()
+    for iq in range(qvals.shape[0]):
+        if qvals[iq] == 0:
+            out[iq] = excess_a + excess_b - (2 - k) * min(excess_a, excess_b)
+
+    a_off = offsets[ta * num_units:(ta + 1) * num_units + 1] - offsets[ta * num_units]
+    a_times = values[offsets[ta * num_units]:offsets[(ta + 1) * num_units]]
+    b_merged = values[offsets[tb * num_units]:offsets[(tb + 1) * num_units]]
+    order = np.argsort(b_merged, kind="mergesort")
+    b_times = b_merged[order]
+    b_labels = np.repeat(np.arange(num_units), counts_b)[order]
+
+    # cost values whose window covers both trains share the full lattice, the others share the box of the
+    # smallest cost value within a factor of 2
+    span = max(a_times.max(), b_times.max()) - min(a_times.min(), b_times.min())
+    start = 0
+    while start < positive.shape[0]:
+        qmin = qvals[positive[start]]
+        stop = start
+        while stop < positive.shape[0] and (qvals[positive[stop]] < 2 * qmin or qvals[positive[stop]] * span <= 2):
+            stop += 1
+        group = positive[start:stop]
+        lo, hi = _lattice_boxes_py(a_times, a_off, b_times, 2 / qmin)
+        size = 0
+        for j in range(lo.shape[0]):
+            size = max(size, np.prod(hi[j] - lo[j] + 1))
+        prev = np.empty((size, group.shape[0]))
+        cur = np.empty((size, group.shape[0]))
+        dist = _distance_multiunit_py(a_times, a_off, b_times, b_labels, qvals[group], k, lo, hi, prev, cur)
+        for g in range(group.shape[0]):
+            out[group[g]] = dist[g]
+        start = stop
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _lattice_boxes_py(a_times, a_off, b_times, window):
+    """
+    Range of each unit counter that needs to be computed in each layer.
+
+    Deleting a spike can always be postponed until just before the next spike of its unit is matched, or until no
+    spike of the other train is left within `window` of it. So by the end of layer ``j``, every spike of unit
+    ``l`` more than `window` before spike ``j + 1`` of the other train has been counted, and no spike more than
+    `window` after it. Layer ``j`` starts from states of layer ``j - 1``, so its box reaches down to the lower
+    bound of the previous layer.
+    """
+    nb = b_times.shape[0]
+    num_units = a_off.shape[0] - 1
+    lo = np.zeros((nb + 1, num_units), dtype=np.int64)
+    hi = np.empty((nb + 1, num_units), dtype=np.int64)
+    for l in range(num_units):
+        spk_train = a_times[a_off[l]:a_off[l + 1]]
+        lo[1:, l] = np.searchsorted(spk_train, b_times - window, side="left")
+        hi[:nb, l] = np.searchsorted(spk_train, b_times + window, side="right")
+        hi[nb, l] = a_off[l + 1] - a_off[l]
+    return lo, hi
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _distance_multiunit_py(a_times, a_off, b_times, b_labels, qvals, k, lo, hi, prev, cur):
+    """
+    Dynamic program of the multi-unit distance over the boxes of the unit-counter lattice.
+
+    Layer ``j`` holds the cost of aligning the first ``j`` spikes of the merged train `b_times` with the first
+    ``c[l]`` spikes of every unit ``l`` of the other train, for every counter vector ``c`` in the box
+    ``lo[j] <= c <= hi[j]``. Each state is the minimum of deleting spike ``j`` (state ``c`` of the previous layer
+    plus 1), deleting the last counted spike of a unit (state ``c - e_l`` of this layer plus 1), or matching the
+    two (state ``c - e_l`` of the previous layer plus the shift and, across units, the relabel cost `k`).
+    Two layers are kept and swapped.
+
+    Args:
+        a_times (numpy.ndarray): Spike times of the first train, concatenated unit by unit.
+        a_off (numpy.ndarray): Start of each unit in `a_times`, length ``units + 1``.
+        b_times (numpy.ndarray): Sorted spike times of the second train, all units merged.
+        b_labels (numpy.ndarray): Unit of each spike in `b_times`.
+        qvals (numpy.ndarray): Positive cost values, all at least half the largest; the boxes are built for the
+            smallest of them.
+        k (float): Relabel cost.
+        lo (numpy.ndarray): Lower corner of the box of each layer, shape ``(len(b_times) + 1, units)``.
+        hi (numpy.ndarray): Upper corner of the box of each layer, same shape as `lo`.
+        prev (numpy.ndarray): Scratch array of shape at least ``(largest box, len(qvals))``.
+        cur (numpy.ndarray): Scratch array of the same shape as `prev`.
+
+    Returns:
+        numpy.ndarray: 1D array of distances, one per cost value.
+    """
+    num_units = a_off.shape[0] - 1
+    nb = b_times.shape[0]
+    nq = qvals.shape[0]
+    counter = np.empty(num_units, dtype=np.int64)
+    stride = np.empty(num_units, dtype=np.int64)
+    pstride = np.empty(num_units, dtype=np.int64)
+    outside = np.empty(num_units, dtype=np.bool_)
+
+    for j in range(nb + 1):
+        size = 1
+        psize = 1
+        for l in range(num_units):
+            stride[l] = size
+            size *= hi[j, l] - lo[j, l] + 1
+            if j > 0:
+                pstride[l] = psize
+                psize *= hi[j - 1, l] - lo[j - 1, l] + 1
+            counter[l] = lo[j, l]
+
+        for s in range(size):
+            # where state `counter` sits in the previous layer, and which counters fall outside its box
+            pidx = 0
+            nout = 0
+            for l in range(num_units):
+                if j > 0:
+                    outside[l] = counter[l] > hi[j - 1, l]
+                    if outside[l]:
+                        nout += 1
+                    pidx += (counter[l] - lo[j - 1, l]) * pstride[l]
+
+            for iq in range(nq):
+                if j == 0 and s == 0:
+                    cur[s, iq] = 0.0
+                elif j > 0 and nout == 0:
+                    cur[s, iq] = prev[pidx, iq] + 1
+                else:
+                    cur[s, iq] = _UNREACHABLE
+
+            for l in range(num_units):
+                if counter[l] > lo[j, l]:
+                    for iq in range(nq):
+                        cur[s, iq] = min(cur[s, iq], cur[s - stride[l], iq] + 1)
+                if j > 0 and counter[l] >= lo[j - 1, l] + 1 and nout - outside[l] == 0 and (
+                    counter[l] - 1 <= hi[j - 1, l]
+                ):
+                    dt = abs(a_times[a_off[l] + counter[l] - 1] - b_times[j - 1])
+                    relabel = k if l != b_labels[j - 1] else 0.0
+                    for iq in range(nq):
+                        cur[s, iq] = min(cur[s, iq], prev[pidx - pstride[l], iq] + qvals[iq] * dt + relabel)
+
+            for l in range(num_units):
+                counter[l] += 1
+                if counter[l] <= hi[j, l]:
+                    break
+                counter[l] = lo[j, l]
+        prev, cur = cur, prev
+
+    return prev[size - 1, :].copy()
@@ -0,0 +1,289 @@
+"""metricspace.model.calculate_spkd.parallel_functions
+
+Multi-threaded numba backend. The whole pairwise loop is one compiled function parallelized over the rows of the
+distance matrix with prange, so no Python code runs between two pairs. It is the fallback for installs without
+the Rust extension; it computes plain and banded distances, the sliding search stays in spkd_functions.
+
+"""
+import numpy as np
+import numba
+from numba import jit, prange
+from .spkd_functions import _distance_optimized_py, _distance_banded_py
+
+
+def calculate_spkd_numba(values_a, offsets_a, values_b, offsets_b, qvals, same, n_jobs=1, banded=False, monitor=None):
+    """
+    Internal function to compute the distances between every spike train of `a` and every spike train of `b` on
+    `n_jobs` numba threads.
+
+    Spike trains are given in the flat ``(values, offsets)`` layout of :func:`metricspace.spkd`: spike train ``i``
+    is ``values[offsets[i]:offsets[i + 1]]``. When `same` only the upper triangle is computed and then mirrored.
+
+    Parameters
+    ----------
+    values_a, values_b : np.ndarray
+        float64 spike times of all spike trains, concatenated.
+    offsets_a, offsets_b : np.ndarray
+        int64 start of each spike train in `values`, plus the end of the last one.
+    qvals : np.ndarray
+        float64 cost values.
+    same : bool
+        Whether `a` and `b` are the same spike trains.
+    n_jobs : int, optional
+        Number of threads, capped at numba's ``NUMBA_NUM_THREADS``. Defaults to 1.
+    banded : bool, optional
+        Use the banded kernel. Requires sorted spike times. Defaults to False.
+    monitor : SpkdMonitor, optional
+        Receives the progress of the pair loop, and stops it when cancelled. The rows are then computed in about
+        100 chunks, between which the monitor is updated. Defaults to None.
+
+    Returns
+    -------
+    ndarray
+        A 3D array of shape ``(num_a, num_b, len(qvals))``.
+
+    """
+    num_a, num_b, nq = len(offsets_a) - 1, len(offsets_b) - 1, len(qvals)
+    d = np.zeros((num_a, num_b, nq))
+    # the banded kernel runs the cost values whose window spans a pair through the rolling-row kernel, which
+    # with sorted cost values is a prefix of them
+    order = np.argsort(qvals, kind="stable") if banded else np.arange(nq)
+    sorted_q = np.ascontiguousarray(qvals[order], dtype=np.float64)
+    rows = _balanced_rows(num_a, same)
+    pairs_per_row = num_b - 1 - rows if same else np.full(num_a, num_b)
+
+    threads = numba.get_num_threads()
+    numba.set_num_threads(max(1, min(n_jobs, numba.config.NUMBA_NUM_THREADS)))
+    try:
+        if monitor is None:
+            cells = np.zeros(num_a, dtype=np.int64)
+            _pairs_parallel_py(values_a, offsets_a, values_b, offsets_b, sorted_q, same, banded, rows, d, cells)
+        elif monitor._begin(int(pairs_per_row.sum())):
+            cells = np.zeros(num_a, dtype=np.int64)
+            chunk = max(4 * numba.get_num_threads(), -(-num_a // 100))
+            for start in range(0, num_a, chunk):
+                stop = start + chunk
+                _pairs_parallel_py(
+                    values_a, offsets_a, values_b, offsets_b, sorted_q, same, banded, rows[start:stop], d,
+                    cells[start:stop],
+                )
+                if not monitor._update(int(pairs_per_row[:stop].sum()), int(cells.sum()), 0):
+                    break
+            monitor._update(int(pairs_per_row[:stop].sum()), int(cells.sum()), 0, final=True)
+    finally:
+        numba.set_num_threads(threads)
+    if banded:
+        d = d[:, :, np.argsort(order)]
+    return d
+
+
+def _balanced_rows(num_a, same):
+    """
+    Row indices in the order the parallel loop computes them.
+
+    prange hands every thread a contiguous range of iterations. Row ``i`` of an upper triangle holds
+    ``num - 1 - i`` pairs, so rows are interleaved from both ends, ``0, n - 1, 1, n - 2, ...``, to give every
+    range about the same number of pairs.
+
+    Args:
+        num_a (int): Number of rows.
+        same (bool): Whether only the upper triangle is computed.
+
+    Returns:
+        numpy.ndarray: int64 array of the row indices.
+    """
+    if not same:
+        return np.arange(num_a, dtype=np.int64)
+    rows = np.empty(num_a, dtype=np.int64)
+    rows[0::2] = np.arange((num_a + 1) // 2)
+    rows[1::2] = np.arange(num_a - 1, (num_a + 1) // 2 - 1, -1)
+    return rows
+
+
+@jit(nopython=True, parallel=True, fastmath=True, cache=True)
+def _pairs_parallel_py(values_a, offsets_a, values_b, offsets_b, qvals, same, banded, rows, d, cells):
+    """
+    Compute the distances of the given rows, one row per prange iteration.
+
+    Args:
+        values_a (numpy.ndarray): Concatenated spike times of the first spike trains.
+        offsets_a (numpy.ndarray): Start of each first spike train in `values_a`, plus the end of the last one.
+        values_b (numpy.ndarray): Concatenated spike times of the second spike trains.
+        offsets_b (numpy.ndarray): Start of each second spike train in `values_b`, plus the end of the last one.
+        qvals (numpy.ndarray): 1D array of cost factors, sorted when `banded`.
+        same (bool): Whether both sets are the same; only the upper triangle is computed, then mirrored.
+        banded (bool): Use `_distance_banded_py` for the cost factors whose window doesn't span the pair.
+        rows (numpy.ndarray): Indices of the first spike trains to compute the rows of.
+        d (numpy.ndarray): Array of shape ``(num_a, num_b, len(qvals))`` that receives the distances.
+        cells (numpy.ndarray): Array of the shape of `rows` that receives the dynamic program cells of each row.
+    """
+    num_b = offsets_b.shape[0] - 1
+    nq = qvals.shape[0]
+    maxcount = 0
+    for xj in range(num_b):
+        maxcount = max(maxcount, offsets_b[xj + 1] - offsets_b[xj])
+
+    for r in prange(rows.shape[0]):
+        xi = rows[r]
+        spk_train_a = values_a[offsets_a[xi]:offsets_a[xi + 1]]
+        # Scratch buffers of this row, sized for the longest spike train of b
+        row = np.empty((maxcount + 1, nq))
+        diag = np.empty(nq)
+        stamp = np.empty(maxcount + 1, dtype=np.int64)
+        count = 0
+        for xj in range(xi + 1 if same else 0, num_b):
+            spk_train_b = values_b[offsets_b[xj]:offsets_b[xj + 1]]
+            count += _pair_py(spk_train_a, spk_train_b, qvals, banded, row, diag, stamp, d[xi, xj])
+            if same:
+                for q in range(nq):
+                    d[xj, xi, q] = d[xi, xj, q]
+        cells[r] = count
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _pair_py(spk_train_a, spk_train_b, qvals, banded, row, diag, stamp, out):
+    """
+    Compute the distance between two spike trains for every cost factor.
+
+    Args:
+        spk_train_a (numpy.ndarray): Spike times of the first spike train.
+        spk_train_b (numpy.ndarray): Spike times of the second spike train.
+        qvals (numpy.ndarray): 1D array of cost factors, sorted when `banded`.
+        banded (bool): Use `_distance_banded_py` for the cost factors whose window doesn't span the pair.
+        row (numpy.ndarray): Scratch array of shape at least ``(m + 1, len(qvals))``.
+        diag (numpy.ndarray): Scratch array of shape ``(len(qvals),)``.
+        stamp (numpy.ndarray): Integer scratch array of shape at least ``(m + 1,)``.
+        out (numpy.ndarray): Array of shape ``(len(qvals),)`` that receives the distances.
+
+    Returns:
+        int: Number of dynamic program cells computed.
+    """
+    n = spk_train_a.shape[0]
+    m = spk_train_b.shape[0]
+    nq = qvals.shape[0]
+    if n == 0 or m == 0:
+        for q in range(nq):
+            out[q] = max(n, m)
+        return 0
+    if not banded:
+        _distance_optimized_py(spk_train_a, spk_train_b, qvals, 0.0, row, diag)
+        for q in range(nq):
+            out[q] = row[m, q]
+        return n * m * nq
+    span = max(spk_train_a[n - 1], spk_train_b[m - 1]) - min(spk_train_a[0], spk_train_b[0])
+    full = 0
+    while full < nq and qvals[full] * span < 2:
+        full += 1
+    count = 0
+    if full > 0:
+        _distance_optimized_py(spk_train_a, spk_train_b, qvals[:full], 0.0, row, diag)
+        for q in range(full):
+            out[q] = row[m, q]
+        count += n * m * full
+    if full < nq:
+        count += _distance_banded_py(spk_train_a, spk_train_b, qvals[full:], 0.0, row.reshape(-1), stamp, out[full:])
+    return count
+
+
+def calculate_spkd_population(values, offsets, numt, units, qvals, costs, n_jobs=1, banded=False):
+    """
+    Internal function to compute the pairwise distances of the trials of several units in one parallel loop.
+
+    The trains of unit ``u`` are ``u * numt`` to ``(u + 1) * numt - 1`` of the flat layout. Every row of every unit
+    is one work item; items are dealt to the threads in decreasing order of `costs`, alternating the direction on
+    each round, so every thread gets about the same work however different the firing rates of the units are.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        float64 spike times of all spike trains, concatenated.
+    offsets : np.ndarray
+        int64 start of each spike train in `values`, plus the end of the last one.
+    numt : int
+        Number of trials of each unit.
+    units : np.ndarray
+        int64 indices of the units to compute.
+    qvals : np.ndarray
+        float64 cost values.
+    costs : np.ndarray
+        Estimated cost of each row of each unit of `units`, shape ``(len(units), numt)``.
+    n_jobs : int, optional
+        Number of threads, capped at numba's ``NUMBA_NUM_THREADS``. Defaults to 1.
+    banded : bool, optional
+        Use the banded kernel. Requires sorted spike times. Defaults to False.
+
+    Returns
+    -------
+    tuple
+        ``(d, cells)``: the distances, shape ``(numt, numt, len(units) * len(qvals))`` with unit ``units[k]`` at
+        ``d[:, :, k * nq:(k + 1) * nq]``, and the number of dynamic program cells computed.
+
+    """
+    nq = len(qvals)
+    order = np.argsort(qvals, kind="stable") if banded else np.arange(nq)
+    sorted_q = np.ascontiguousarray(qvals[order], dtype=np.float64)
+    threads = max(1, min(n_jobs, numba.config.NUMBA_NUM_THREADS))
+
+    item_unit, item_row = np.divmod(np.argsort(-costs.reshape(-1), kind="stable"), numt)
+    rank = np.arange(len(item_unit))
+    turn, slot = np.divmod(rank, threads)
+    worker = np.where(turn % 2 == 0, slot, threads - 1 - slot)
+    by_worker = np.argsort(worker, kind="stable")
+    bounds = np.searchsorted(worker[by_worker], np.arange(threads + 1))
+
+    d = np.zeros((numt, numt, len(units) * nq))
+    cells = np.zeros(threads, dtype=np.int64)
+    previous = numba.get_num_threads()
+    numba.set_num_threads(threads)
+    try:
+        _population_pairs_py(
+            values, offsets, numt, np.asarray(units, dtype=np.int64) * numt, sorted_q, banded,
+            item_unit[by_worker], item_row[by_worker], bounds, d, cells,
+        )
+    finally:
+        numba.set_num_threads(previous)
+    if banded:
+        d = d.reshape(numt, numt, len(units), nq)[:, :, :, np.argsort(order)].reshape(numt, numt, -1)
+    return d, int(cells.sum())
+
+
+@jit(nopython=True, parallel=True, fastmath=True, cache=True)
+def _population_pairs_py(values, offsets, numt, first, qvals, banded, item_unit, item_row, bounds, d, cells):
+    """
+    Compute the rows of the work items of each thread, one thread per prange iteration.
+
+    Args:
+        values (numpy.ndarray): Concatenated spike times of every spike train.
+        offsets (numpy.ndarray): Start of each spike train in `values`, plus the end of the last one.
+        numt (int): Number of trials of each unit.
+        first (numpy.ndarray): Index of the first spike train of each unit of the call.
+        qvals (numpy.ndarray): 1D array of cost factors, sorted when `banded`.
+        banded (bool): Use `_distance_banded_py` for the cost factors whose window doesn't span the pair.
+        item_unit (numpy.ndarray): Unit of each work item, an index into `first`.
+        item_row (numpy.ndarray): Row of each work item; the pairs with the later trials of the unit are computed.
+        bounds (numpy.ndarray): Work items ``bounds[t]:bounds[t + 1]`` belong to thread ``t``.
+        d (numpy.ndarray): Array of shape ``(numt, numt, len(first) * len(qvals))`` that receives the distances.
+        cells (numpy.ndarray): Array of shape ``(len(bounds) - 1,)`` that receives the cells of each thread.
+    """
+    nq = qvals.shape[0]
+    maxcount = 0
+    for u in range(first.shape[0]):
+        for i in range(first[u], first[u] + numt):
+            maxcount = max(maxcount, offsets[i + 1] - offsets[i])
+
+    for t in prange(bounds.shape[0] - 1):
+        row = np.empty((maxcount + 1, nq))
+        diag = np.empty(nq)
+        stamp = np.empty(maxcount + 1, dtype=np.int64)
+        count = 0
+        for k in range(bounds[t], bounds[t + 1]):
+            u = item_unit[k]
+            xi = item_row[k]
+            col = u * nq
+            spk_train_a = values[offsets[first[u] + xi]:offsets[first[u] + xi + 1]]
+            for xj in range(xi + 1, numt):
+                spk_train_b = values[offsets[first[u] + xj]:offsets[first[u] + xj + 1]]
+                count += _pair_py(spk_train_a, spk_train_b, qvals, banded, row, diag, stamp, d[xi, xj, col:col + nq])
+                for q in range(nq):
+                    d[xj, xi, col + q] = d[xi, xj, col + q]
+        cells[t] = count
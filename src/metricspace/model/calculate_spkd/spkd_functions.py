@@ -10,10 +10,18 @@ spike distance function is being called.
 import numpy as np
 from numba import jit
 
+# larger than any spike time difference or distance; finite, as fastmath kernels assume there are no infinities
+_UNREACHABLE = 1e300
+
 
 # Outer Entrypoint for Python Implementation -----------------------------------------------------------------------------------------------------
 def calculate_spkd_py(
-    cspks: list, qvals: list | np.ndarray, res: float | int | None = 1e-2
+    cspks: list,
+    qvals: list | np.ndarray,
+    res: float | int | None = 1e-2,
+    banded: bool = False,
+    exact: bool = False,
+    monitor=None,
 ):
     """
     Internal function to compute pairwise spike train distances with variable time precision for multiple cost values.
@@ -26,6 +34,13 @@ def calculate_spkd_py(
         List or array of time precision values to use in the computation.
     res : float, optional
         The search resolution of the spike trains. Defaults to 1e-4.
+    banded : bool, optional
+        Use the banded kernel, which skips spike pairs that are too far apart to ever be matched.
+        Requires sorted spike times. Defaults to False.
+    exact : bool, optional
+        Search every offset in [-1, 1] instead of the `res` grid. Defaults to False.
+    monitor : SpkdMonitor, optional
+        Receives the progress of the pair loop, and stops it when cancelled. Defaults to None.
 
     Returns
     -------
@@ -33,107 +48,392 @@ def calculate_spkd_py(
         A 3D array containing pairwise spike train distances for each time precision value.
 
     """
-    # Calculate the count of spikes in each spike train
-    curcounts = [len(x) for x in cspks]
-    numt = len(cspks)
-
-    # Initialize 3D array to store pairwise distances for each time precision
-    d = np.zeros((numt, numt, len(qvals)))
-    offsets = np.arange(-1, 1 + res, res) if res else [0]
-
-    # Iterate over all pairs of spike trains
-    for xi in range(numt - 1):
-        for xj in range(xi + 1, numt):
-            if curcounts[xi] != 0 and curcounts[xj] != 0:
-                spk_train_a = np.array(cspks[xi])
-                spk_train_b = np.array(cspks[xj])
-
-                first_iter = True
-                d_min = np.inf  # protect against unbound local error
-
-                for offset in offsets:
-                    spk_train_a_copy = spk_train_a.copy()
-                    if res:
-                        spk_train_a_copy += offset
-                    outer_diff = np.abs(
-                                        spk_train_a_copy.reshape(-1, 1) - spk_train_b.reshape(1, -1)
-                                    )
-                    sd = qvals.reshape((-1, 1, 1)) * outer_diff
-                    scr = np.zeros((len(qvals), curcounts[xi] + 1, curcounts[xj] + 1))
-                    scr[:, 1:, 0] += np.arange(1, curcounts[xi] + 1)
-                    scr[:, 0, 1:] += np.arange(1, curcounts[xj] + 1).reshape((1, -1))
-
-                    d_current = _compute_spiketrain_distance_py(scr, sd)
-
-                    # keep a running minimum, likely a better way to do this, but this seems the most clear
-                    if first_iter:
-                        d_min = d_current
-                        first_iter = False
-                    else:
-                        d_min = np.minimum(d_min, d_current)
-                d[xi, xj, :] = d_min
+    trains = [np.asarray(x, dtype=np.float64) for x in cspks]
+    return _pair_loop_py(trains, trains, True, np.asarray(qvals, dtype=np.float64), res, banded, exact, monitor)
+
+
+def calculate_spkd_cross_py(
+    cspks_a: list,
+    cspks_b: list,
+    qvals: list | np.ndarray,
+    banded: bool = False,
+    res: float | int | None = None,
+    exact: bool = False,
+    monitor=None,
+):
+    """
+    Internal function to compute the spike train distances between every train of `cspks_a` and every train of
+    `cspks_b`, for multiple cost values.
+
+    When both arguments are the same list object only the upper triangle is computed and then mirrored. With `res`
+    or `exact` the sliding distance is computed, shifting the trains of `cspks_a`, as in calculate_spkd_py.
+
+    Parameters
+    ----------
+    cspks_a, cspks_b : list[np.ndarray or list]
+        Lists where each inner iterable contains spike times (floats or ints) for a single spike train.
+    qvals : list or np.ndarray
+        List or array of time precision values to use in the computation.
+    banded : bool, optional
+        Use the banded kernel. Requires sorted spike times. Defaults to False.
+    res : float, optional
+        Search resolution of the sliding distance. Defaults to None, no sliding.
+    exact : bool, optional
+        Search every offset in [-1, 1] instead of the `res` grid. Defaults to False.
+    monitor : SpkdMonitor, optional
+        Receives the progress of the pair loop, and stops it when cancelled. Defaults to None.
+
+    Returns
+    -------
+    ndarray
+        A 3D array of shape ``(len(cspks_a), len(cspks_b), len(qvals))``.
+
+    """
+    same = cspks_a is cspks_b
+    trains_a = [np.asarray(x, dtype=np.float64) for x in cspks_a]
+    trains_b = trains_a if same else [np.asarray(x, dtype=np.float64) for x in cspks_b]
+    return _pair_loop_py(trains_a, trains_b, same, np.asarray(qvals, dtype=np.float64), res, banded, exact, monitor)
+
+
+def _pair_loop_py(trains_a, trains_b, same, qvals, res, banded, exact, monitor):
+    """
+    Distances between every spike train of `trains_a` and every spike train of `trains_b`.
+
+    Args:
+        trains_a (list[numpy.ndarray]): float64 spike trains.
+        trains_b (list[numpy.ndarray]): float64 spike trains.
+        same (bool): Whether both lists are the same; only the upper triangle is computed, then mirrored.
+        qvals (numpy.ndarray): 1D array of cost factors.
+        res (float or None): Resolution of the offset grid of the sliding distance, or None.
+        banded (bool): Use the banded kernel.
+        exact (bool): Search every offset in [-1, 1] where two spikes coincide.
+        monitor (SpkdMonitor or None): Receives the pair, cell and offset counts, and stops the loop when cancelled.
+
+    Returns:
+        numpy.ndarray: A 3D array of shape ``(len(trains_a), len(trains_b), len(qvals))``.
+    """
+    d = np.zeros((len(trains_a), len(trains_b), len(qvals)))
+    offsets = np.arange(-1, 1 + res, res) if res else None
+
+    # Scratch buffers for the rolling-row kernel, sized once for the longest spike train
+    maxcount = max([len(x) for x in trains_a + trains_b] + [0])
+    row = np.empty((maxcount + 1, len(qvals)))
+    diag = np.empty(len(qvals))
+    stamp = np.empty(maxcount + 1, dtype=np.int64)
+    counters = np.zeros(2, dtype=np.int64)  # dynamic program cells, evaluated offsets
+
+    num_a, num_b = len(trains_a), len(trains_b)
+    if monitor is not None and not monitor._begin(num_a * (num_a - 1) // 2 if same else num_a * num_b):
+        return d
+    done = 0
+    for xi, xj in _pair_indices(num_a, num_b, same):
+        spk_train_a, spk_train_b = trains_a[xi], trains_b[xj]
+        if len(spk_train_a) != 0 and len(spk_train_b) != 0:
+            if exact or offsets is not None:
+                candidates = _exact_offsets_py(spk_train_a, spk_train_b) if exact else offsets
+                _slide_search_py(
+                    spk_train_a, spk_train_b, qvals, candidates, row, diag, stamp, banded, d[xi, xj], counters
+                )
             else:
-                d[xi, xj, :] = max(curcounts[xi], curcounts[xj])
-    return np.maximum(d, np.transpose(d, [1, 0, 2]))
+                d[xi, xj, :] = _compute_spiketrain_distance_py(
+                    spk_train_a, spk_train_b, qvals, 0.0, row, diag, stamp if banded else None, counters
+                )
+        else:
+            d[xi, xj, :] = max(len(spk_train_a), len(spk_train_b))
+        if same:
+            d[xj, xi, :] = d[xi, xj, :]
+        done += 1
+        if monitor is not None and not monitor._update(done, int(counters[0]), int(counters[1])):
+            break
+    if monitor is not None:
+        monitor._update(done, int(counters[0]), int(counters[1]), final=True)
+    return d
+
+
+def _pair_indices(num_a, num_b, same):
+    """ Yield the (xi, xj) pairs to compute, row by row: the upper triangle when `same`, else every pair. """
+    for xi in range(num_a):
+        for xj in range(xi + 1 if same else 0, num_b):
+            yield xi, xj
+
+
+def _exact_offsets_py(spk_train_a, spk_train_b):
+    """
+    Offsets in [-1, 1] where the shifted distance can reach its minimum.
+
+    For a fixed alignment, the cost of shifting `spk_train_a` by ``s`` is a convex piecewise-linear function of
+    ``s`` whose breakpoints are the offsets that make two matched spikes coincide, ``b[j] - a[i]``. The minimum
+    over all offsets in the window is therefore reached at one of those breakpoints or at an end of the window.
+
+    Args:
+        spk_train_a (numpy.ndarray): Spike times of the spike train that is shifted.
+        spk_train_b (numpy.ndarray): Spike times of the other spike train.
+
+    Returns:
+        numpy.ndarray: Sorted unique candidate offsets.
+    """
+    shifts = np.subtract.outer(spk_train_b, spk_train_a).ravel()
+    shifts = shifts[(shifts > -1) & (shifts < 1)]
+    return np.unique(np.concatenate(([-1.0, 1.0], shifts)))
 
 
-def _compute_spiketrain_distance_py(scr, sd):
+def _compute_spiketrain_distance_py(spk_train_a, spk_train_b, qvals, offset, row, diag, stamp=None, counters=None):
     """
     Compute spike-time distance.
 
-    This function calculates the spike-time distance using the `iter_scr_numba` function to update the `scr` array
-    and then return the final values in the last column of the last 2D slice of the `scr` array.
+    This function calls `_distance_optimized_py` to run the recurrence over the two spike trains
+    and returns a copy of the final values in the last column of the `row` buffer. If `stamp` is given,
+    `_distance_banded_py` is used instead, with `row` as its flat scratch buffer.
 
     Args:
-        scr (numpy.ndarray): A 3D array that gets updated in the process. Each 2D slice of the array corresponds
-                             to a different cost factor, and the elements within each slice represent the accumulated
-                             cost of aligning the two spike trains up to that point.
-        sd (numpy.ndarray): A 3D array used in the computation of the quantities. Each 2D slice of this array represents
-                            the cost of aligning each pair of spikes from the two spike trains for a different cost factor.
+        spk_train_a (numpy.ndarray): Spike times of the first spike train.
+        spk_train_b (numpy.ndarray): Spike times of the second spike train.
+        qvals (numpy.ndarray): 1D array of cost factors.
+        offset (float): Time shift added to every spike of `spk_train_a`.
+        row (numpy.ndarray): Scratch array of shape at least ``(len(spk_train_b) + 1, len(qvals))``.
+        diag (numpy.ndarray): Scratch array of shape ``(len(qvals),)``.
+        stamp (numpy.ndarray, optional): Integer scratch array of shape at least ``(len(spk_train_b) + 1,)``,
+                                         only given for the banded kernel.
+        counters (numpy.ndarray, optional): Integer array whose first element is incremented by the number of
+                                            dynamic program cells computed.
 
     Returns:
         numpy.ndarray: A 1D array representing the spike-time distances.
     """
-    # Need to separate this iteration for compatibility with numba
-    scr = _distance_optimized_py(scr, sd)
-
-    # The last column represents the final values of the accumulated cost of aligning the two spike trains
-    d = np.squeeze(scr[:, -1, -1]).astype("float32")
+    cells = 0
+    if stamp is not None:
+        # Cost factors whose 2/q window spans both spike trains have nothing to skip, so they go
+        # through the rolling-row kernel together; the rest are computed one band at a time.
+        span = max(spk_train_a[-1] + offset, spk_train_b[-1]) - min(spk_train_a[0] + offset, spk_train_b[0])
+        full = qvals * span < 2
+        d = np.empty(len(qvals))
+        if np.any(full):
+            _distance_optimized_py(spk_train_a, spk_train_b, qvals[full], offset, row, diag)
+            d[full] = row[len(spk_train_b), :np.count_nonzero(full)]
+            cells += len(spk_train_a) * len(spk_train_b) * np.count_nonzero(full)
+        if not np.all(full):
+            band_out = np.empty(len(qvals) - np.count_nonzero(full))
+            cells += _distance_banded_py(
+                spk_train_a, spk_train_b, qvals[~full], offset, row.reshape(-1), stamp, band_out
+            )
+            d[~full] = band_out
+    else:
+        # Need to separate this iteration for compatibility with numba
+        _distance_optimized_py(spk_train_a, spk_train_b, qvals, offset, row, diag)
+        cells = len(spk_train_a) * len(spk_train_b) * len(qvals)
 
+        # The last column represents the final values of the accumulated cost of aligning the two spike trains
+        d = row[len(spk_train_b)].copy()
+    if counters is not None:
+        counters[0] += cells
     return d
 
 
-@jit(nopython=True, fastmath=True)
-def _distance_optimized_py(scr, sd):
+@jit(nopython=True, fastmath=True, cache=True)
+def _distance_optimized_py(spk_train_a, spk_train_b, qvals, offset, row, diag):
+    """
+    Run the spike-time distance recurrence with a single rolling row.
+
+    The full computation fills a ``(len(qvals), n + 1, m + 1)`` table where each element is the minimum of
+    the element above + 1, the element to the left + 1, and the element up-left + the cost of moving a spike.
+    Only the previous row is ever read, so this function keeps one row per cost factor in `row` and the
+    up-left element in `diag`, and computes the spike time differences on the fly. Working memory is
+    O(len(qvals) * m) instead of O(len(qvals) * n * m).
+
+    Args:
+        spk_train_a (numpy.ndarray): Spike times of the first spike train, length n.
+        spk_train_b (numpy.ndarray): Spike times of the second spike train, length m.
+        qvals (numpy.ndarray): 1D array of cost factors.
+        offset (float): Time shift added to every spike of `spk_train_a`.
+        row (numpy.ndarray): Scratch array updated in place, shape at least ``(m + 1, len(qvals))``.
+                             On return ``row[m]`` holds the distance for each cost factor.
+        diag (numpy.ndarray): Scratch array of shape ``(len(qvals),)``.
+
+    Returns:
+        numpy.ndarray: The updated row array.
+    """
+    n = spk_train_a.shape[0]
+    m = spk_train_b.shape[0]
+    nq = qvals.shape[0]
+    for xjj in range(m + 1):
+        for q in range(nq):
+            row[xjj, q] = xjj
+
+    # Iterating over both spike trains, with the cost factors innermost
+    for xii in range(1, n + 1):
+        t_a = spk_train_a[xii - 1] + offset
+        for q in range(nq):
+            diag[q] = row[0, q]
+            row[0, q] = xii
+        for xjj in range(1, m + 1):
+            dt = abs(t_a - spk_train_b[xjj - 1])
+            for q in range(nq):
+                # Compute the three quantities
+                a = row[xjj, q] + 1
+                b = row[xjj - 1, q] + 1
+                c = diag[q] + qvals[q] * dt
+                diag[q] = row[xjj, q]
+
+                # Update the row with the minimum of the three quantities
+                row[xjj, q] = min(a, b, c)
+
+    return row
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _distance_banded_py(spk_train_a, spk_train_b, qvals, offset, row, stamp, out):
     """
-    Perform an iteration over 2D slices of the 3D scr and sd arrays.
+    Run the spike-time distance recurrence only inside the band of spike pairs that can be matched.
 
-    The scr array is a 3D array storing cost values at different steps of the computation, and the sd array
-    is a 3D array that stores pairwise differences between two spike trains multiplied by a cost factor.
+    Moving a spike by ``|dt|`` costs ``q * |dt|``, so when ``q * |dt| >= 2`` deleting one spike and inserting
+    the other is never more expensive. For each cost factor, spike ``b[j]`` can therefore only be matched with
+    ``a[i]`` when ``|a[i] - b[j]| < 2 / q``. Because both spike trains are sorted, that window is a band
+    ``[lo, hi)`` of the second spike train which only moves forward as ``i`` grows. Cells outside the band
+    are resolved in closed form:
 
-    This function iterates over the second and third dimensions of the 3D scr and sd arrays and updates each
-    element in the scr array to the minimum value of three quantities computed from the scr and sd arrays.
+        - left of the band, ``a[i]`` can't be matched, so the value is the cell above + 1. Each column keeps
+          the row it was last written in (`stamp`) and adds the rows elapsed since then when it is read.
+        - right of the band, ``b[j]`` can't be matched, so the value is the last band cell + 1 per column.
+
+    The result is exact, and for large q the work drops from O(n * m) to about O(n + m) per cost factor.
 
     Args:
-        scr (numpy.ndarray): 2D slice of the array corresponding to the accumulated cost of aligning two spike trains
-                             to a different cost factor, and the elements within each slice represent the accumulated
-                             cost of aligning the two spike trains up to that point.
-        sd (numpy.ndarray): A 3D array used in the computation of the quantities.
-                            Each 2D slice of this array represents sums of the cost of aligning each pair of spikes
-                            from the two spike trains for a different cost factor.
+        spk_train_a (numpy.ndarray): Sorted spike times of the first spike train, length n.
+        spk_train_b (numpy.ndarray): Sorted spike times of the second spike train, length m.
+        qvals (numpy.ndarray): 1D array of cost factors.
+        offset (float): Time shift added to every spike of `spk_train_a`.
+        row (numpy.ndarray): Scratch array of shape at least ``(m + 1,)``.
+        stamp (numpy.ndarray): Integer scratch array of shape at least ``(m + 1,)``.
+        out (numpy.ndarray): Array of shape ``(len(qvals),)`` that receives the distances.
 
     Returns:
-        numpy.ndarray: The updated scr array.
+        int: Number of band cells computed, over all cost factors.
+    """
+    n = spk_train_a.shape[0]
+    m = spk_train_b.shape[0]
+    cells = 0
+    for iq in range(qvals.shape[0]):
+        q = qvals[iq]
+        window = 2.0 / q if q > 2.0 / _UNREACHABLE else _UNREACHABLE  # every pair can be matched at q = 0
+        for xjj in range(m + 1):
+            row[xjj] = xjj
+            stamp[xjj] = 0
+
+        # columns <= prev_hi hold (value, row written) pairs for the previous row;
+        # columns > prev_hi are right of its band and equal anchor + 1 per column
+        prev_hi = m
+        anchor = 0.0
+        lo = 0
+        hi = 0
+        for xii in range(1, n + 1):
+            t_a = spk_train_a[xii - 1] + offset
+            while lo < m and spk_train_b[lo] <= t_a - window:
+                lo += 1
+            while hi < m and spk_train_b[hi] < t_a + window:
+                hi += 1
+            band_start = lo + 1
+            band_end = hi
+
+            # columns that move from right of the previous band straight to left of this one
+            for xjj in range(prev_hi + 1, band_start):
+                row[xjj] = anchor + (xjj - prev_hi) + 1
+                stamp[xjj] = xii
+
+            edge = band_start - 1
+            if edge <= prev_hi:
+                diag = row[edge] + (xii - 1 - stamp[edge])
+            else:
+                diag = anchor + (edge - prev_hi)
+            left = diag + 1
+            cells += band_end + 1 - band_start
+            for xjj in range(band_start, band_end + 1):
+                if xjj <= prev_hi:
+                    up = row[xjj] + (xii - 1 - stamp[xjj])
+                else:
+                    up = anchor + (xjj - prev_hi)
+                c = diag + q * abs(t_a - spk_train_b[xjj - 1])
+                val = min(up + 1, left + 1, c)
+                row[xjj] = val
+                stamp[xjj] = xii
+                diag = up
+                left = val
+            anchor = left
+            prev_hi = band_end
+
+        if m <= prev_hi:
+            out[iq] = row[m] + (n - stamp[m])
+        else:
+            out[iq] = anchor + (m - prev_hi)
+    return cells
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _slide_search_py(spk_train_a, spk_train_b, qvals, offsets, row, diag, stamp, banded, best, counters):
     """
-    # Iterating over the second and third dimensions of scr and sd
-    for xii in range(1, sd.shape[1] + 1):
-        for xjj in range(1, sd.shape[2] + 1):
-            # Compute the three quantities
-            a = scr[:, xii - 1, xjj] + 1
-            b = scr[:, xii, xjj - 1] + 1
-            c = scr[:, xii - 1, xjj - 1] + sd[:, xii - 1, xjj - 1]
+    Minimum spike-time distance over a sorted set of offsets of `spk_train_a`, for every cost factor.
+
+    Offsets that can't beat the current minimum for any cost factor are skipped without running the recurrence.
+    Two lower bounds are used:
+
+        - the distance is never below the spike count difference ``|n - m|``; once every cost factor reaches
+          it the search stops.
+        - shifting by ``ds`` changes the cost of any alignment by at most ``q * min(n, m) * |ds|``, so the
+          distance at offset ``s`` is at least ``D(s_last) - q * min(n, m) * |s - s_last|``.
+
+    Args:
+        spk_train_a (numpy.ndarray): Spike times of the spike train that is shifted, length n.
+        spk_train_b (numpy.ndarray): Spike times of the other spike train, length m.
+        qvals (numpy.ndarray): 1D array of cost factors.
+        offsets (numpy.ndarray): Sorted offsets to search.
+        row (numpy.ndarray): Scratch array of shape at least ``(m + 1, len(qvals))``.
+        diag (numpy.ndarray): Scratch array of shape ``(len(qvals),)``.
+        stamp (numpy.ndarray): Integer scratch array of shape at least ``(m + 1,)``.
+        banded (bool): Whether to use `_distance_banded_py` instead of `_distance_optimized_py`.
+        best (numpy.ndarray): Array of shape ``(len(qvals),)`` that receives the minimum distances.
+        counters (numpy.ndarray): Integer array of 2 elements, incremented by the number of dynamic program cells
+            computed and of offsets evaluated.
+
+    Returns:
+        int: Number of offsets for which the recurrence was run.
+    """
+    n = spk_train_a.shape[0]
+    m = spk_train_b.shape[0]
+    nq = qvals.shape[0]
+    floor = abs(n - m)
+    lipschitz = min(n, m)
+    current = np.empty(nq)
+    flat_row = row.reshape(-1)
+    for iq in range(nq):
+        best[iq] = _UNREACHABLE
+
+    evaluated = 0
+    last = 0.0
+    for offset in offsets:
+        if evaluated > 0:
+            improvable = False
+            for iq in range(nq):
+                if max(floor, current[iq] - qvals[iq] * lipschitz * abs(offset - last)) < best[iq]:
+                    improvable = True
+                    break
+            if not improvable:
+                continue
 
-            # Update the scr array with the minimum of the three quantities
-            scr[:, xii, xjj] = np.minimum(a, np.minimum(b, c))
+        if banded:
+            counters[0] += _distance_banded_py(spk_train_a, spk_train_b, qvals, offset, flat_row, stamp, current)
+        else:
+            _distance_optimized_py(spk_train_a, spk_train_b, qvals, offset, row, diag)
+            for iq in range(nq):
+                current[iq] = row[m, iq]
+            counters[0] += n * m * nq
+        counters[1] += 1
+        evaluated += 1
+        last = offset
 
-    return scr
+        done = True
+        for iq in range(nq):
+            best[iq] = min(best[iq], current[iq])
+            if best[iq] > floor:
+                done = False
+        if done:
+            break
+    return evaluated
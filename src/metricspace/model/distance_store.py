@@ -0,0 +1,228 @@
+import os
+import json
+import numpy as np
+from .spkd import spkd_cross, _resolve_n_jobs
+from .backends import _resolve_backend
+
+
+class DistanceStore:
+    """
+    Pairwise spike train distances kept in a memory-mapped file on disk.
+
+    Created by :func:`spkd_blocked`. The store is a directory holding ``meta.json`` and ``distances.npy``. Distances
+    are stored cost-major, so everything needed for one cost value is contiguous on disk: either the condensed
+    upper triangle, shape ``(nq, numt * (numt - 1) // 2)``, or the full square matrix, shape ``(nq, numt, numt)``.
+    :func:`metricspace.distclust` reads a store column block by column block without loading it fully.
+
+    Attributes
+    ----------
+    path : str
+        Directory of the store.
+    numt : int
+        Number of spike trains.
+    qvals : np.ndarray
+        Cost values the distances were computed for.
+    condensed : bool
+        Whether only the upper triangle is stored.
+    dtype : np.dtype
+        Floating point type of the stored distances.
+
+    """
+
+    def __init__(self, path, numt, qvals, condensed, data):
+        self.path = path
+        self.numt = numt
+        self.qvals = qvals
+        self.condensed = condensed
+        self.data = data
+
+    @classmethod
+    def create(cls, path, numt, qvals, condensed=True, dtype=np.float32):
+        """ Create an empty store of `numt` spike trains in directory `path`, overwriting an existing store. """
+        qvals = np.asarray(qvals, dtype=np.float64).reshape(-1)
+        dtype = np.dtype(dtype)
+        if dtype.kind != "f":
+            raise ValueError(f"dtype must be a floating point type, got {dtype}.")
+        os.makedirs(path, exist_ok=True)
+        shape = (len(qvals), numt * (numt - 1) // 2) if condensed else (len(qvals), numt, numt)
+        data = np.lib.format.open_memmap(os.path.join(path, "distances.npy"), mode="w+", dtype=dtype, shape=shape)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"numt": numt, "qvals": qvals.tolist(), "condensed": condensed}, f)
+        return cls(path, numt, qvals, condensed, data)
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """ Open an existing store. Use ``mode="r+"`` to write to it. """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        data = np.load(os.path.join(path, "distances.npy"), mmap_mode=mode)
+        return cls(path, meta["numt"], np.asarray(meta["qvals"]), meta["condensed"], data)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def shape(self):
+        """ Shape of the distance tensor the store represents, ``(numt, numt, nq)`` as returned by :func:`spkd`. """
+        return self.numt, self.numt, len(self.qvals)
+
+    def _condensed_index(self, rows, cols):
+        lo, hi = np.minimum(rows, cols), np.maximum(rows, cols)
+        return self.numt * lo - lo * (lo + 1) // 2 + (hi - lo - 1)
+
+    def columns(self, cols, iq=None):
+        """
+        Read columns of the distance matrix.
+
+        Parameters
+        ----------
+        cols : array-like of int
+            Column (spike train) indices.
+        iq : int, optional
+            Index of the cost value. By default every cost value is read.
+
+        Returns
+        -------
+        ndarray
+            A float64 array of shape ``(numt, len(cols))``, or ``(numt, len(cols), nq)`` if `iq` is None.
+        """
+        cols = np.asarray(cols, dtype=np.int64).reshape(-1)
+        data = self.data if iq is None else self.data[iq][None]
+        if not self.condensed:
+            block = data[:, :, cols]
+        else:
+            rows = np.arange(self.numt)[:, None]
+            diag = rows == cols[None, :]
+            index = self._condensed_index(rows, cols[None, :])
+            index[diag] = 0
+            block = data[:, index]
+            block[:, diag] = 0
+        block = np.moveaxis(np.asarray(block, dtype=np.float64), 0, 2)
+        return block[:, :, 0] if iq is not None else block
+
+    def square(self, iq):
+        """ The full ``(numt, numt)`` float64 distance matrix for one cost value. """
+        return self.columns(np.arange(self.numt), iq)
+
+    def to_array(self):
+        """ Load the whole store into memory as a ``(numt, numt, nq)`` float64 array. """
+        return self.columns(np.arange(self.numt))
+
+    def write_block(self, row_start, col_start, block):
+        """
+        Write a tile of distances.
+
+        Parameters
+        ----------
+        row_start, col_start : int
+            Index of the first row and column of the tile.
+        block : np.ndarray
+            Distances of shape ``(rows, cols, nq)``. Entries on or below the diagonal are ignored by condensed
+            stores; square stores also write the mirrored tile.
+        """
+        nrow, ncol = block.shape[:2]
+        if not self.condensed:
+            self.data[:, row_start:row_start + nrow, col_start:col_start + ncol] = block.transpose(2, 0, 1)
+            self.data[:, col_start:col_start + ncol, row_start:row_start + nrow] = block.transpose(2, 1, 0)
+            return
+        for ii in range(nrow):
+            i = row_start + ii
+            j0 = max(col_start, i + 1)
+            if j0 >= col_start + ncol:
+                continue
+            start = self._condensed_index(i, j0)
+            self.data[:, start:start + col_start + ncol - j0] = block[ii, j0 - col_start:, :].T
+
+    def flush(self):
+        """ Write pending changes to disk. """
+        self.data.flush()
+
+
+def spkd_blocked(
+    cspks: list,
+    qvals: list | np.ndarray,
+    path: str,
+    block_size: int = 256,
+    condensed: bool = True,
+    dtype=np.float32,
+    use_rs: bool | None = None,
+    n_jobs: int | None = None,
+    banded: bool = False,
+):
+    """
+    Compute pairwise spike train distances tile by tile into a memory-mapped store on disk.
+
+    Gives the same distances as :func:`spkd`, but peak memory is bounded by one ``block_size x block_size x nq``
+    tile instead of the dense ``N x N x nq`` tensor and its symmetrized copy.
+
+    Parameters
+    ----------
+    cspks : list[np.ndarray or list]
+        List where each inner iterable contains spike times (floats or ints) for a single spike train.
+    qvals : list or np.ndarray
+        List or array of time precision values (floats or ints) to use in the computation.
+    path : str
+        Directory to write the store to. An existing store there is overwritten.
+    block_size : int, optional
+        Number of spike trains per tile side. Defaults to 256.
+    condensed : bool, optional
+        Store only the upper triangle, halving the file size. Defaults to True.
+    dtype : np.dtype, optional
+        Floating point type of the stored distances. Defaults to float32, which halves the file size at a
+        relative rounding error of about 6e-8.
+    use_rs : bool, optional
+        True runs the Rust implementation, False one of the numba backends, None the fastest available one, as in
+        :func:`spkd`. Defaults to None.
+    n_jobs : int, optional
+        Number of worker threads, as in :func:`spkd`. Defaults to None.
+    banded : bool, optional
+        Whether to use the exact banded kernel, as in :func:`spkd`. Defaults to False.
+
+    Returns
+    -------
+    DistanceStore
+        The store, which can be passed directly to :func:`metricspace.distclust`.
+
+    Raises
+    ------
+    ValueError
+        If cspks is not a list, if it contains less than 2 spike trains, or if block_size is not positive.
+
+    """
+    if not isinstance(cspks, list):
+        raise ValueError("cspks must be a list.")
+    if len(cspks) < 2:
+        raise ValueError("cspks must contain at least 2 spike trains for comparisons.")
+    if block_size < 1:
+        raise ValueError("block_size must be a positive integer.")
+    qvals = np.asarray(qvals, dtype=np.float64).reshape(-1)
+    cspks = [np.asarray(x, dtype=np.float64) for x in cspks]
+    numt = len(cspks)
+    n_jobs = _resolve_n_jobs(n_jobs)
+
+    store = DistanceStore.create(path, numt, qvals, condensed, dtype)
+    for row_start, col_start, block in _iterate_tiles(cspks, qvals, block_size, use_rs, n_jobs, banded):
+        store.write_block(row_start, col_start, block)
+    store.flush()
+    return store
+
+
+def _iterate_tiles(cspks, qvals, block_size, use_rs, n_jobs, banded, backend=None):
+    """
+    Yield the upper-triangle tiles of the distance tensor as ``(row_start, col_start, block)``.
+
+    `cspks` is a list of float64 arrays, `qvals` a float64 array and `n_jobs` a resolved thread count. Blocks
+    have shape ``(rows, cols, nq)``; diagonal tiles are computed once and are symmetric. The backend, unless given,
+    is chosen once for the whole tensor, so every tile is computed the same way.
+    """
+    counts = np.array([len(x) for x in cspks], dtype=np.int64)
+    backend = _resolve_backend(backend, use_rs, counts, None, len(qvals), n_jobs)
+    numt = len(cspks)
+    for row_start in range(0, numt, block_size):
+        tile_a = cspks[row_start:row_start + block_size]
+        for col_start in range(row_start, numt, block_size):
+            # diagonal tiles pass the same list so only their upper triangle is computed
+            tile_b = tile_a if col_start == row_start else cspks[col_start:col_start + block_size]
+            block = spkd_cross(tile_a, tile_b, qvals, None, n_jobs, banded, backend=backend)
+            yield row_start, col_start, block
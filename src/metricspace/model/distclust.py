@@ -5,35 +5,39 @@ Translation by Flynn O'Connell, 2023.
 (c) 2000 by Daniel Reich. All rights reserved.
 """
 import numpy as np
+from .distance_store import DistanceStore
 
 
-def _validate_distclust_input(dists, nsam, ifresamp, iftrump):
-    """ Validate input for distclust function. """
+def _validate_distclust_input(dists, nsam, ifresamp, iftrump, numt):
+    """ Validate input for distclust function. `dists` is None for a DistanceStore. """
     assert (
         iftrump != 1 or ifresamp != 2
     ), "Cannot bootstrap resample when 0-distances trump."
-    assert (
-        dists.shape[0] == dists.shape[1]
-    ), f"Input matrix should be square, given matrix has dimensions ({dists.shape[0]}, {dists.shape[1]})."
-    assert np.all(np.diag(dists) == 0), "Input matrix should have 0s on the diagonal."
+    if dists is not None:
+        assert (
+            dists.ndim in (2, 3) and dists.shape[0] == dists.shape[1]
+        ), f"Input matrix should be square, given matrix has dimensions {dists.shape}."
+        assert np.all(np.diagonal(dists, axis1=0, axis2=1) == 0), "Input matrix should have 0s on the diagonal."
     assert np.all(
         nsam > 0
     ), "nsam should be a list or 1D array of positive integers representing the number samples for each class."
     assert (
-        np.sum(nsam) == dists.shape[0] == dists.shape[1]
-    ), f"Sum of nsam ({np.sum(nsam)}) should be the same as input matrix dimensions ({dists.shape[0]})."
+        np.sum(nsam) == numt
+    ), f"Sum of nsam ({np.sum(nsam)}) should be the same as input matrix dimensions ({numt})."
 
 
-def distclust(dists, nsam, expo=-2, ifresamp=0, iftrump=1):
+def distclust(dists, nsam, expo=-2, ifresamp=0, iftrump=1, block_size=None):
     """
     Distance clustering. Classificatiion algorithm that returns a `KxK` confusion matrix where `K`
             is the number of classes.
 
     Parameters
     ----------
-    dists : numpy.ndarray
+    dists : numpy.ndarray or DistanceStore
         A 2D symmetric matrix of pairwise distances with 0's on the diagonal. Its size should be ``sum(nsam) x sum(nsam)``.
-        This will be the output of the spkd function.
+        This will be the output of the spkd function: either one cost value ``d[:, :, i]``, or the whole
+        ``sum(nsam) x sum(nsam) x nq`` array to classify every cost value at once. A DistanceStore from
+        spkd_blocked is read `block_size` columns at a time.
     nsam : list or numpy.ndarray
         A list or 1D array where each entry is the number of trials in each condition.
     expo : float or str, optional
@@ -45,11 +49,15 @@ def distclust(dists, nsam, expo=-2, ifresamp=0, iftrump=1):
     iftrump : int, optional
         Determines whether 0-distances should trump other values. Options are 0 - 0-distances do not trump other values,
         1 - 0-distances trump other values.
+    block_size : int, optional
+        Number of columns of `dists` processed at a time, for all cost values together. Bounds the working memory
+        to ``sum(nsam) x block_size x nq``. Defaults to about 4 million elements per block.
 
     Returns
     -------
     numpy.ndarray
-        A confusion matrix of size `len(nsam)` x `len(nsam)`.
+        A confusion matrix of size `len(nsam)` x `len(nsam)`. For a 3D array or a DistanceStore, a stack of them of
+        size `nq` x `len(nsam)` x `len(nsam)`, using the same resampling for every cost value.
 
     Raises
     ------
@@ -97,113 +105,109 @@ def distclust(dists, nsam, expo=-2, ifresamp=0, iftrump=1):
         >>> print(confusion_matrix.shape, len(nsam)) # these should all be the same!
         ((3, 3), 3)
     """
-    if not isinstance(dists, np.ndarray):
-        dists = np.array(dists)
     if not isinstance(nsam, np.ndarray):
         nsam = np.array(nsam)
-    _validate_distclust_input(dists, nsam, ifresamp, iftrump)
+    if isinstance(dists, DistanceStore):
+        _validate_distclust_input(None, nsam, ifresamp, iftrump, dists.numt)
+        numt = dists.numt
+    else:
+        if not isinstance(dists, np.ndarray):
+            dists = np.array(dists)
+        _validate_distclust_input(dists, nsam, ifresamp, iftrump, dists.shape[0])
+        numt = dists.shape[0]
 
     if expo == 0:
         expo = "median"
     if not isinstance(expo, str) and expo < 0:
         iftrump = 1
 
-    ncla = len(nsam)  # number of Classes/Tastants
-    anear = np.zeros((ncla, ncla))
+    ndx = _resample_indices(nsam, ifresamp, numt)
+    if isinstance(dists, DistanceStore):
+        return _confusion(dists.columns, len(dists.qvals), nsam, expo, iftrump, ndx, block_size)
+    if dists.ndim == 2:
+        return _confusion(lambda cols: dists[:, cols, None], 1, nsam, expo, iftrump, ndx, block_size)[0]
+    return _confusion(lambda cols: dists[:, cols, :], dists.shape[2], nsam, expo, iftrump, ndx, block_size)
+
+
+def _resample_indices(nsam, ifresamp, numt):
+    """ Row/column order of the resampled distance matrix, or None without resampling. """
     if ifresamp == 1:  # relabel resampling
-        ind = np.random.permutation(dists.shape[1])
-        dists = dists[ind, :][:, ind]
-    elif ifresamp == 2:  # a bootstrap resampling
-        ndx = []
+        return np.random.permutation(numt)
+    elif ifresamp == 2:  # a bootstrap resampling, with replacement within each class
         nsam2 = np.concatenate([[0], np.cumsum(nsam[:-1])])
-        for isam in range(ncla):
-            ndx.extend(
-                nsam2[isam]
-                + np.ceil(nsam[isam] * np.random.rand(nsam[isam])).astype(int)
-            )
-        dists = dists[ndx, :][:, ndx]
-    samend = np.cumsum(nsam)
-    samstart = np.concatenate([[0], samend[:-1]]) + 1
-
-    av = np.zeros(
-        (ncla, dists.shape[1])
-    )  # average distance between trials of the same class
-    if iftrump == 0:
-        for i in range(ncla):
-            if isinstance(expo, str):
-                av[i, :] = np.median(dists[samstart[i] : samend[i], :], axis=0)
-                # this ensures self-distances (diagonals) are not included in the calculation
-                for j in range(samstart[i], samend[i]):
-                    av[i, j] = np.median(
-                        np.concatenate(
-                            [dists[samstart[i] : j, j], dists[j + 1 : samend[i], j]]
-                        )
-                    )
-            else:
-                av[i, :] = (
-                    np.sum(dists[samstart[i] : samend[i], :] ** expo) / nsam[i]
-                ) ** (1 / expo)
-                # this ensures self-distances (diagonals) are not included in the calculation
-                for j in range(samstart[i], samend[i]):
-                    # compute an average of values in subset of rows/columns excluding the diagonal
-                    # and average distances from spike-train i to j, except if its negative
-                    av[i, j] = (
-                        np.sum(
-                            np.concatenate(
-                                [dists[samstart[i] : j, j], dists[j + 1 : samend[i], j]]
-                            )
-                            ** expo
-                        )
-                        / (nsam[i] - 1)
-                    ) ** (1 / expo)
+        return np.concatenate(
+            [nsam2[isam] + np.random.randint(0, nsam[isam], nsam[isam]) for isam in range(len(nsam))]
+        )
+    return None
+
+
+def _class_averages(block, cols, samstart, nsam, expo, iftrump):
+    """
+    Average distance from each class to the spike trains in one block of columns, for every cost value.
+
+    Classes are contiguous runs of rows, so per-class sums are one ``np.add.reduceat`` over the rows.
+
+    Args:
+        block (np.ndarray): Columns `cols` of the (resampled) distance matrix, shape (N, B, nq). Overwritten.
+        cols (np.ndarray): Column indices of the block.
+        samstart (np.ndarray): First row of each class.
+        nsam (np.ndarray): Number of trials in each class.
+        expo (float or str): Exponent of the weighted mean, or 'median'.
+        iftrump (int): Whether 0-distances trump other values.
+
+    Returns:
+        np.ndarray: Class averages of shape (K, B, nq). With iftrump, entries with 0-distances hold minus the
+            fraction of 0-distances instead.
+    """
+    # self-distances (diagonals) are not included in the calculation
+    block[cols, np.arange(len(cols)), :] = np.nan
+    icla = np.searchsorted(samstart, cols, side="right") - 1
+    nsm = (nsam[:, None] - (icla[None, :] == np.arange(len(nsam))[:, None]))[:, :, None]
+
+    if isinstance(expo, str):
+        # pad every class to the largest one with NaNs, then take the median down the padded axis
+        rank = np.arange(block.shape[0]) - np.repeat(samstart, nsam)
+        padded = np.full((len(nsam), np.max(nsam)) + block.shape[1:], np.nan)
+        padded[np.repeat(np.arange(len(nsam)), nsam), rank] = block
+        with np.errstate(all="ignore"):
+            md = np.nanmedian(padded, axis=1)
     else:
-        dists[np.diag_indices_from(dists)] = np.nan
-        for i in range(ncla):
-            nsm = nsam[i] * np.ones(dists.shape[1])
-            nsm[samstart[i] - 1 : samend[i]] = (
-                nsam[i] - 1
-            )  # -1 because python is 0-indexed
-            temp = dists[
-                samstart[i] - 1 : samend[i], :
-            ]  # -1 because python is 0-indexed
-            nz = temp < np.finfo(float).eps
-            temp = np.zeros_like(temp)
-            temp[nz] = 1
-            av[i, :] = -np.sum(temp, axis=0) / nsm  # -fraction of zeros in each column
-            nz = av[i, :] == 0
-            nz_indices = np.where(nz)[
-                0
-            ]  # Get the indices where nz is True, columns with no zero values
-            ident = np.where(
-                (nz_indices >= samstart[i] - 1) & (nz_indices < samend[i])
-            )[0]
-            temp = dists[samstart[i] - 1 : samend[i], :][
-                :, nz
-            ]  # non-zero columns are not all ones
-            if isinstance(expo, str):
-                md = np.median(temp, axis=0)
-                temp = np.sort(temp[:, ident])
-                md[ident] = np.median(temp[: nsam[i] - 1, :])
-            else:
-                # weighted mean distance, train to other classes
-                md = (np.sum(temp**expo, axis=0) / nsam[i]) ** (1 / expo)
-                temp = np.sort(
-                    temp[:, ident], axis=0
-                )  # compared to matlabs boolean indexing syntax
-                md[ident] = (
-                    np.sum(temp[: nsam[i] - 1, :] ** expo, axis=0) / (nsam[i] - 1)
-                ) ** (1 / expo)
-            av[i, nz] = md
-    a = np.min(
-        av, axis=0
-    )  # minimum distance between trials of different classes (down columns) - 1 x nspikes
-    for i in range(dists.shape[1]):
-        icla = np.max(
-            np.where(samstart <= i + 1)
-        )  # find the class of the spike-train[i]
-        indx = np.where(av[:, i] == a[i])[
-            0
-        ]  # find the class of the nearest spike-train to spike-train[i]
-        if len(indx) > 0:
-            anear[icla, indx[0]] += 1 / len(indx)
+        # weighted mean distance, train to each class
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = np.where(np.isnan(block), 0.0, block**expo)
+            md = (np.add.reduceat(weights, samstart, axis=0) / nsm) ** (1 / expo)
+    if iftrump == 1:
+        zeros = np.add.reduceat((block < np.finfo(float).eps).astype(np.int64), samstart, axis=0)
+        return np.where(zeros > 0, -zeros / nsm, md)  # -fraction of zeros in each column
+    return md
+
+
+def _confusion(get_columns, nq, nsam, expo, iftrump, ndx, block_size):
+    """
+    Confusion matrices of every cost value, reading `block_size` columns at a time through `get_columns`, which
+    returns an (N, B, nq) block for an array of column indices.
+    """
+    samend = np.cumsum(nsam)
+    samstart = samend - nsam
+    numt = samend[-1]
+    if block_size is None:
+        block_size = max(1, 2**22 // (numt * nq))
+    av = np.zeros((len(nsam), numt, nq))  # average distance between each class and each trial
+    for start in range(0, numt, block_size):
+        cols = np.arange(start, min(start + block_size, numt))
+        if ndx is None:
+            block = np.array(get_columns(cols), dtype=np.float64)
+        else:
+            block = np.array(get_columns(ndx[cols])[ndx], dtype=np.float64)
+        av[:, cols, :] = _class_averages(block, cols, samstart, nsam, expo, iftrump)
+
+    a = np.min(av, axis=0)  # minimum distance to any class (down columns)
+    nearest = av == a
+    counts = np.sum(nearest, axis=0)
+    found = counts > 0
+    icla = np.broadcast_to(np.searchsorted(samend, np.arange(numt), side="right")[:, None], found.shape)
+    iq = np.broadcast_to(np.arange(nq)[None, :], found.shape)
+    anear = np.zeros((nq, len(nsam), len(nsam)))
+    # ties are split between the nearest classes, and credited to the first of them
+    np.add.at(anear, (iq[found], icla[found], np.argmax(nearest, axis=0)[found]), 1 / counts[found])
     return anear.astype(int)
@@ -0,0 +1,209 @@
+import numpy as np
+from .distclust import _validate_distclust_input
+from ..entropy import tblxinfo
+
+# Relative distance below which an updated class average is summed again, far above the rounding of the update
+_TIE_RTOL = 1e-9
+
+
+def distclust_jackknife(dists, nsam, expo=-2, iftrump=1, info=False):
+    """
+    Trial-level leave-one-out jackknife of distclust.
+
+    Gives the confusion matrices of ``distclust`` run on every subset of the trials without one of them, for every
+    cost value, at about the cost of a single ``distclust`` call.
+
+    Parameters
+    ----------
+    dists : numpy.ndarray
+        The output of the spkd function, ``sum(nsam) x sum(nsam) x nq``, or a single ``sum(nsam) x sum(nsam)``
+        cost value of it.
+    nsam : list or numpy.ndarray
+        A list or 1D array where each entry is the number of trials in each condition. Every class needs at least
+        2 trials.
+    expo : float, optional
+        The exponent value for calculating the weighted mean distance, as in distclust. Default is -2. The median
+        is not supported.
+    iftrump : int, optional
+        Determines whether 0-distances should trump other values, as in distclust.
+    info : bool, optional
+        Return the transinformation of each confusion matrix (tblxinfo of the normalized matrix) instead of the
+        matrices. Defaults to False.
+
+    Returns
+    -------
+    numpy.ndarray
+        Confusion matrices of shape ``(sum(nsam), nq, K, K)``, entry ``t`` classifying every trial but ``t``, or
+        transinformation of shape ``(sum(nsam), nq)`` with `info`. The `nq` axis is dropped for a 2D `dists`.
+
+    Raises
+    ------
+    ValueError
+        If expo is 0 or 'median', if a class has fewer than 2 trials, or if the input is invalid as in distclust.
+
+    Notes
+    -----
+    The weighted mean of distclust only needs, for every column, the sum of ``dists ** expo`` and the number of
+    0-distances over the trials of each class. Leaving trial ``t`` out subtracts row ``t`` from the sums of its
+    own class, and leaves the averages to every other class unchanged. The nearest of those other classes is found
+    once per class, so reclassifying the remaining trials only compares them with the updated class: ``N`` leave-
+    one-out confusion matrices take ``O(N^2 nq)`` operations, like one distclust call, instead of ``O(N^3 nq)``.
+
+    Updating a sum by subtraction rounds differently from adding up the remaining trials, which would break exact
+    ties, common with spike count distances at ``q = 0``. Averages within a relative ``1e-9`` of the nearest other
+    class are therefore summed again in the order of distclust, so the result is that of a rerun of distclust.
+
+    Examples
+    --------
+        >>> loo = ms.distclust_jackknife(d, nsam, info=True)  # (N, nq)
+        >>> observed = np.array([ms.tblxinfo(c / c.sum()) for c in ms.distclust(d, nsam)])
+        >>> n = len(loo)
+        >>> jackknifed = n * observed - (n - 1) * loo.mean(axis=0)
+        >>> std_error = np.sqrt((n - 1) * np.var(loo, axis=0))
+    """
+    if isinstance(expo, str) or expo == 0:
+        raise ValueError("distclust_jackknife supports the weighted mean only, not the median.")
+    dists = np.asarray(dists)
+    nsam = np.asarray(nsam)
+    _validate_distclust_input(dists, nsam, 0, iftrump, dists.shape[0])
+    if np.any(nsam < 2):
+        raise ValueError("Every class needs at least 2 trials to leave one out.")
+    if expo < 0:
+        iftrump = 1
+    squeeze = dists.ndim == 2
+    d3 = dists[:, :, None] if squeeze else dists
+    anear = _jackknife_confusions(d3, nsam, expo, iftrump)
+
+    if info:
+        anear = tblxinfo(anear / np.sum(anear, axis=(-2, -1), keepdims=True))
+    return anear[:, 0] if squeeze else anear
+
+
+def _jackknife_confusions(d3, nsam, expo, iftrump):
+    """
+    Leave-one-out confusion matrices of the weighted-mean distclust, from class sums updated one trial at a time.
+
+    Args:
+        d3 (np.ndarray): Distances of shape (N, N, nq).
+        nsam (np.ndarray): Number of trials in each class, at least 2.
+        expo (float): Exponent of the weighted mean.
+        iftrump (int): Whether 0-distances trump other values.
+
+    Returns:
+        np.ndarray: Confusion matrices of shape (N, nq, K, K).
+    """
+    numt, nq = d3.shape[0], d3.shape[2]
+    ncla = len(nsam)
+    cls = np.repeat(np.arange(ncla), nsam)
+    samstart = np.cumsum(nsam) - nsam
+    diag = np.arange(numt)
+    with np.errstate(divide="ignore"):
+        powered = d3.astype(np.float64) ** expo
+    powered[diag, diag, :] = 0  # self-distances are not included
+    powered[np.isinf(powered)] = 0  # 0-distances with a negative exponent, these columns are trumped
+    sums = np.add.reduceat(powered, samstart, axis=0)
+    zeros = nzero = None
+    if iftrump == 1:
+        zeros = (d3 < np.finfo(float).eps).astype(np.int64)
+        zeros[diag, diag, :] = 0
+        nzero = np.add.reduceat(zeros, samstart, axis=0)
+
+    nsm = (nsam[:, None] - (cls[None, :] == np.arange(ncla)[:, None]))[:, :, None]
+    others = _nearest_others(_averages(sums, nzero, nsm, expo, iftrump))
+
+    anear = np.zeros((numt, nq, ncla, ncla), dtype=int)
+    chunk = max(1, 2**22 // (numt * nq))
+    for start in range(0, numt, chunk):
+        left_out = np.arange(start, min(start + chunk, numt))
+        own = cls[left_out]
+        # averages of every trial to the class of the left-out trial, without it
+        nsm_own = (nsam[own][:, None] - 1 - (cls[None, :] == own[:, None]))[:, :, None]
+        nzero_own = None if nzero is None else nzero[own] - zeros[left_out]
+        av = _averages(sums[own] - powered[left_out], nzero_own, nsm_own, expo, iftrump)
+        a, counts, first = (x[own] for x in others)
+        # near-ties are summed again in the order of distclust, so exact ties stay ties
+        close = np.isclose(av, a, rtol=_TIE_RTOL, atol=0)
+        if np.any(close):
+            it, j, iq = np.nonzero(close)
+            exact = _class_sums_without(powered, samstart, nsam, own[it], left_out[it], j, iq)
+            av[close] = _averages(
+                exact,
+                None if nzero_own is None else nzero_own[close],
+                np.broadcast_to(nsm_own, av.shape)[close],
+                expo,
+                iftrump,
+            )
+        below = av < a
+        tied = av == a
+        counts = np.where(below, 1, counts + tied)
+        nearest = np.where(below, own[:, None, None], np.where(tied, np.minimum(own[:, None, None], first), first))
+        # a NaN average, e.g. to a class left with only the trial itself, drops the trial as in distclust
+        found = ~np.isnan(av) & ~np.isnan(a)
+        found[np.arange(len(left_out)), left_out, :] = False
+        it, j, iq = np.nonzero(found)
+        flat = ((it * nq + iq) * ncla + cls[j]) * ncla + nearest[found]
+        # ties are split between the nearest classes, and credited to the first of them
+        counted = np.bincount(flat, weights=1 / counts[found], minlength=len(left_out) * nq * ncla * ncla)
+        anear[left_out] = counted.reshape(len(left_out), nq, ncla, ncla).astype(int)
+    return anear
+
+
+def _averages(sums, nzero, nsm, expo, iftrump):
+    """ Class averages from the class sums, with -fraction of zeros in trumped entries, as in distclust. """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        av = (sums / nsm) ** (1 / expo)
+        if iftrump == 1:
+            av = np.where(nzero > 0, -nzero / nsm, av)
+    return av
+
+
+def _class_sums_without(powered, samstart, nsam, own, left_out, j, iq):
+    """
+    Sums of the powered distances over the class of a left-out trial without it, added by ``np.add.reduceat`` over
+    the remaining rows like the class sums of distclust on the matrix without that trial.
+
+    Args:
+        powered (np.ndarray): Powered distances of shape (N, N, nq), 0 on the diagonal.
+        samstart (np.ndarray): First row of each class.
+        nsam (np.ndarray): Number of trials in each class.
+        own (np.ndarray): Class of the left-out trial of each entry.
+        left_out (np.ndarray): Left-out trial of each entry.
+        j (np.ndarray): Column of each entry.
+        iq (np.ndarray): Cost value of each entry.
+
+    Returns:
+        np.ndarray: The sum of each entry.
+    """
+    out = np.zeros(len(own))
+    for c in np.unique(own):
+        sel = np.nonzero(own == c)[0]
+        rows = np.arange(samstart[c], samstart[c] + nsam[c] - 1)[:, None]
+        rows = rows + (rows >= left_out[sel])  # skip the left-out trial
+        out[sel] = np.add.reduceat(powered[rows, j[sel], iq[sel]], [0], axis=0)[0]
+    return out
+
+
+def _nearest_others(av):
+    """
+    For every class, the nearest of the other classes to every column.
+
+    Args:
+        av (np.ndarray): Class averages of shape (K, N, nq).
+
+    Returns:
+        tuple of np.ndarray: ``(a, counts, first)``, each of shape (K, N, nq). Entry ``c`` holds the smallest
+            average over the classes other than ``c``, the number of those classes at it and the first of them.
+            NaN averages propagate to `a`, as in distclust.
+    """
+    ncla = av.shape[0]
+    a = np.full(av.shape, np.inf)
+    counts = np.zeros(av.shape, dtype=np.int64)
+    first = np.zeros(av.shape, dtype=np.int64)
+    for c in range(ncla if ncla > 1 else 0):
+        rest = np.delete(av, c, axis=0)
+        a[c] = np.min(rest, axis=0)
+        nearest = rest == a[c]
+        counts[c] = np.sum(nearest, axis=0)
+        first[c] = np.argmax(nearest, axis=0)
+        first[c] += first[c] >= c  # index among all classes
+    return a, counts, first
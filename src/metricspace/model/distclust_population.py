@@ -0,0 +1,139 @@
+import numpy as np
+from .spkd import _to_csr, _validate_csr, _resolve_n_jobs
+from .distclust import _confusion
+from .backends import _PROFILE
+from .monitor import _stage
+
+
+def distclust_population(
+    cspks: list,
+    labels,
+    qvals: list | np.ndarray,
+    expo: float | str = -2,
+    iftrump: int = 1,
+    n_jobs: int | None = None,
+    banded: bool = False,
+    batch_size: int | None = None,
+    monitor=None,
+):
+    """
+    Compute the distclust confusion matrices of many units recorded over the same trials, in one batch.
+
+    Gives ``distclust(spkd(cspks[u], qvals)[:, :, iq], nsam)`` for every unit ``u`` and cost value, with the trials
+    of each class made contiguous first. The pairwise distances of all units are computed by one parallel numba
+    loop, so the conversion, setup and thread start-up are paid once for the population instead of once per unit.
+
+    Parameters
+    ----------
+    cspks : list[list[np.ndarray or list] or tuple(np.ndarray, np.ndarray)]
+        Spike trains grouped by unit: one entry per unit, holding the spike trains of its trials as a list or in
+        the flat ``(values, offsets)`` layout of :func:`spkd`. Every unit has the same trials, in the same order.
+    labels : array-like
+        Class label of each trial, in any order.
+    qvals : list or np.ndarray
+        List or array of cost values (floats or ints).
+    expo : float or str, optional
+        The exponent value for calculating the weighted mean distance, or 'median', as in distclust.
+        Default is -2.
+    iftrump : int, optional
+        Determines whether 0-distances should trump other values, as in distclust.
+    n_jobs : int, optional
+        Number of worker threads, as in :func:`spkd`. Defaults to None.
+    banded : bool, optional
+        Whether to use the exact banded kernel, as in :func:`spkd`. Spike times must be sorted. Defaults to False.
+    batch_size : int, optional
+        Number of units whose distances are computed in one parallel loop and held in memory together, as a
+        ``numt x numt x (batch_size * nq)`` tensor. Defaults to about 32 million distances per batch.
+    monitor : SpkdMonitor, optional
+        Receives the progress after each batch, and stops the call between batches when cancelled, as in
+        :func:`spkd`. Defaults to None.
+
+    Returns
+    -------
+    numpy.ndarray
+        Confusion matrices of shape ``(units, nq, K, K)``, classes in the order of ``np.unique(labels)``.
+
+    Raises
+    ------
+    ValueError
+        If cspks is not a non-empty list of units, if the units don't all have one spike train per label, or if
+        there are less than 2 trials.
+    SpkdCancelled
+        If the monitor was cancelled.
+
+    Notes
+    -----
+    Every row of the distance matrix of every unit is one work item of the parallel loop, with an estimated cost
+    from its spike counts. Items are dealt to the threads from the most to the least expensive, so a few units
+    with high firing rates don't leave most threads idle at the end of the loop.
+
+    The distances of a batch are stacked along the cost value axis, unit after unit, and classified by one
+    distclust pass, which treats every ``(unit, cost value)`` pair independently.
+
+    Examples
+    --------
+        >>> # units[u][i]: spike times of unit u on trial i
+        >>> confusion = ms.distclust_population(units, labels, 2 ** np.arange(-2, 6.5, 0.5), n_jobs=-1)
+        >>> info = ms.tblxinfo(confusion / confusion.sum(axis=(-2, -1), keepdims=True))  # (units, nq)
+
+    """
+    from .calculate_spkd.parallel_functions import calculate_spkd_population
+
+    if not isinstance(cspks, list) or len(cspks) == 0:
+        raise ValueError("cspks must be a non-empty list of units.")
+    labels = np.asarray(labels)
+    numt = len(labels)
+    if numt < 2:
+        raise ValueError("There must be at least 2 trials for comparisons.")
+    if expo == 0:
+        expo = "median"
+    if not isinstance(expo, str) and expo < 0:
+        iftrump = 1
+    classes, inverse, nsam = np.unique(labels, return_inverse=True, return_counts=True)
+    order = np.argsort(inverse, kind="stable")  # classes must be contiguous, as in distclust
+    qvals = np.asarray(qvals, dtype=np.float64).reshape(-1)
+    nunits, nq, ncla = len(cspks), len(qvals), len(classes)
+
+    with _stage(monitor, "prepare"):
+        trains = []
+        for u, unit in enumerate(cspks):
+            if isinstance(unit, tuple):
+                values, offsets = _validate_csr(unit)
+                unit = [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            elif not isinstance(unit, list):
+                raise ValueError("Each unit must be a list or a (values, offsets) tuple of spike trains.")
+            if len(unit) != numt:
+                raise ValueError(f"Unit {u} has {len(unit)} spike trains for {numt} labels.")
+            trains += [unit[i] for i in order]
+        values, offsets = _to_csr(trains)
+        counts = np.diff(offsets).reshape(nunits, numt).astype(np.float64)
+        # estimated cost of each row: its pairs with the later trials, and their dynamic program cells
+        later = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1] - counts
+        _, per_pair, per_cell = _PROFILE["numba"]
+        costs = per_pair * (numt - 1 - np.arange(numt)) + per_cell * counts * later * nq
+
+    if batch_size is None:
+        batch_size = max(1, 2**25 // (numt * numt * nq))
+    n_jobs = _resolve_n_jobs(n_jobs)
+    anear = np.zeros((nunits, nq, ncla, ncla), dtype=int)
+    pairs_per_unit = numt * (numt - 1) // 2
+    if monitor is None or monitor._begin(nunits * pairs_per_unit):
+        done = cells = 0
+        for start in range(0, nunits, batch_size):
+            units = np.arange(start, min(start + batch_size, nunits))
+            with _stage(monitor, "pairs"):
+                d, batch_cells = calculate_spkd_population(
+                    values, offsets, numt, units, qvals, costs[units], n_jobs, banded
+                )
+            anear[units] = _confusion(
+                lambda cols: d[:, cols, :], len(units) * nq, nsam, expo, iftrump, None, None
+            ).reshape(len(units), nq, ncla, ncla)
+            done += len(units) * pairs_per_unit
+            cells += batch_cells
+            if monitor is not None and not monitor._update(done, cells, 0):
+                break
+        if monitor is not None:
+            monitor._update(done, cells, 0, final=True)
+    if monitor is not None:
+        monitor._check()
+    return anear
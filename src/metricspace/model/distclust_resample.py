@@ -0,0 +1,288 @@
+import numpy as np
+from .distclust import _validate_distclust_input, _confusion
+from ..entropy import tblxinfo
+
+# Relative distance below which class averages are summed again in the order of distclust, far above the rounding
+# of the matrix products
+_TIE_RTOL = 1e-9
+
+
+def distclust_resample(
+    dists,
+    nsam,
+    n_resamples,
+    method="relabel",
+    expo=-2,
+    iftrump=1,
+    seed=None,
+    first=0,
+    info=False,
+):
+    """
+    Batch resampling of distclust, for null distributions (relabel) and confidence intervals (bootstrap).
+
+    Gives the confusion matrices of `n_resamples` calls of ``distclust(dists, nsam, expo, ifresamp, iftrump)`` at
+    once, for every cost value.
+
+    Parameters
+    ----------
+    dists : numpy.ndarray
+        The output of the spkd function, ``sum(nsam) x sum(nsam) x nq``, or a single ``sum(nsam) x sum(nsam)``
+        cost value of it.
+    nsam : list or numpy.ndarray
+        A list or 1D array where each entry is the number of trials in each condition.
+    n_resamples : int
+        Number of resamples.
+    method : str, optional
+        'relabel' shuffles the class labels (``ifresamp=1``); 'bootstrap' resamples trials with replacement within
+        each class (``ifresamp=2``). Defaults to 'relabel'.
+    expo : float or str, optional
+        The exponent value for calculating the weighted mean distance, as in distclust. Default is -2.
+    iftrump : int, optional
+        Determines whether 0-distances should trump other values, as in distclust.
+    seed : None, int or numpy.random.SeedSequence, optional
+        Seed of the resampling. Resample ``r`` draws from its own generator, child ``first + r`` of `seed`, so the
+        result doesn't depend on how the resamples are split into calls.
+    first : int, optional
+        Index of the first resample. Calls with the same seed and consecutive ranges of resamples, e.g. on
+        different machines, together give the same result as one call over all of them. Defaults to 0.
+    info : bool, optional
+        Return the transinformation of each confusion matrix (tblxinfo of the normalized matrix) instead of the
+        matrices. Defaults to False.
+
+    Returns
+    -------
+    numpy.ndarray
+        Confusion matrices of shape ``(n_resamples, nq, K, K)``, or transinformation of shape
+        ``(n_resamples, nq)`` with `info`. The `nq` axis is dropped for a 2D `dists`.
+
+    Raises
+    ------
+    ValueError
+        If method is not 'relabel' or 'bootstrap', or if the input is invalid as in distclust.
+
+    Notes
+    -----
+    Resamples are applied as label weights rather than by re-indexing the matrix: the class sums of
+    ``dists ** expo`` for a whole batch of resamples are one matrix product of a ``(resamples * K, N)`` weight
+    matrix (one-hot labels for a relabelling, draw counts for a bootstrap) with the ``(N, N * nq)`` powered
+    distances. The median (``expo='median'``) has no such form and is computed one resample at a time.
+
+    A bootstrap draws some trials several times; as in distclust, the 0-distances between the copies of a trial
+    count as trumping 0-distances. Matrix products add the distances in another order than distclust, which can
+    break exact ties, common with spike count distances at ``q = 0``; class averages within a relative ``1e-9``
+    of the nearest class are therefore summed again in the order of distclust, so every resample gives the
+    confusion matrices of distclust on the same draw.
+
+    Examples
+    --------
+        >>> null = ms.distclust_resample(d, nsam, 1000, seed=0, info=True)  # (1000, nq)
+        >>> observed = np.array([ms.tblxinfo(c / c.sum()) for c in ms.distclust(d, nsam)])
+        >>> p_values = (1 + np.sum(null >= observed, axis=0)) / (1 + len(null))
+    """
+    if method not in ("relabel", "bootstrap"):
+        raise ValueError(f"method must be 'relabel' or 'bootstrap', got {method}.")
+    ifresamp = 1 if method == "relabel" else 2
+    dists = np.asarray(dists)
+    nsam = np.asarray(nsam)
+    _validate_distclust_input(dists, nsam, ifresamp, iftrump, dists.shape[0])
+    squeeze = dists.ndim == 2
+    d3 = dists[:, :, None] if squeeze else dists
+    numt, nq = d3.shape[0], d3.shape[2]
+
+    if expo == 0:
+        expo = "median"
+    if not isinstance(expo, str) and expo < 0:
+        iftrump = 1
+
+    draws = _draw_resamples(seed, first, n_resamples, nsam, ifresamp)
+
+    if isinstance(expo, str):
+        anear = np.stack(
+            [_confusion(lambda cols: d3[:, cols, :], nq, nsam, expo, iftrump, ndx, None) for ndx in draws]
+        )
+    else:
+        anear = _resampled_confusions(d3, nsam, expo, iftrump, ifresamp, draws)
+
+    if info:
+        anear = tblxinfo(anear / np.sum(anear, axis=(-2, -1), keepdims=True))
+    return anear[:, 0] if squeeze else anear
+
+
+def _draw_resamples(seed, first, n_resamples, nsam, ifresamp):
+    """ Row/column order of resamples ``first, ..., first + n_resamples - 1``, each from its own child of `seed`. """
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    rngs = [
+        np.random.default_rng(np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (first + r,)))
+        for r in range(n_resamples)
+    ]
+    draws = [_draw_indices(rng, nsam, ifresamp) for rng in rngs]
+    return np.array(draws, dtype=np.int64).reshape(n_resamples, np.sum(nsam))
+
+
+def _draw_indices(rng, nsam, ifresamp):
+    """ Row/column order of one resampled distance matrix, as drawn by distclust. """
+    if ifresamp == 1:
+        return rng.permutation(np.sum(nsam))
+    starts = np.concatenate([[0], np.cumsum(nsam[:-1])])
+    return np.repeat(starts, nsam) + np.floor(rng.random(np.sum(nsam)) * np.repeat(nsam, nsam)).astype(np.int64)
+
+
+def _resampled_confusions(d3, nsam, expo, iftrump, ifresamp, draws):
+    """
+    Confusion matrices of many resamples of the weighted-mean distclust, from matrix products of label weights.
+
+    Args:
+        d3 (np.ndarray): Distances of shape (N, N, nq).
+        nsam (np.ndarray): Number of trials in each class.
+        expo (float): Exponent of the weighted mean.
+        iftrump (int): Whether 0-distances trump other values.
+        ifresamp (int): 1 for relabel, 2 for bootstrap resampling.
+        draws (np.ndarray): Row/column order of each resample, shape (R, N).
+
+    Returns:
+        np.ndarray: Confusion matrices of shape (R, nq, K, K).
+    """
+    numt, nq = d3.shape[0], d3.shape[2]
+    ncla = len(nsam)
+    diag = np.arange(numt)
+    with np.errstate(divide="ignore"):
+        powered = d3.astype(np.float64) ** expo
+    powered[diag, diag, :] = 0  # self-distances are not included
+    powered[np.isinf(powered)] = 0  # 0-distances with a negative exponent, these columns are trumped
+    flat = powered.reshape(numt, numt * nq)
+    if iftrump == 1:
+        # self-distances count here, and are taken out for the position of each column below, so the copies of a
+        # trial drawn more than once by a bootstrap are 0-distances to each other
+        zeros = (d3 < np.finfo(float).eps).astype(np.float64).reshape(numt, numt * nq)
+
+    labels, columns = _resample_labels(draws, nsam, ifresamp)
+    # class of each original column: its new label for a relabelling, its own class for a bootstrap
+    column_labels = labels if ifresamp == 1 else np.broadcast_to(np.repeat(np.arange(ncla), nsam), labels.shape)
+    samstart = np.cumsum(nsam) - nsam
+    anear = np.zeros((len(draws), nq, ncla, ncla), dtype=int)
+    chunk = max(1, 2**22 // (ncla * numt * nq))
+    for start in range(0, len(draws), chunk):
+        stop = min(start + chunk, len(draws))
+        w = _label_weights(labels[start:stop], columns[start:stop], ncla).reshape(-1, numt)
+        sums = (w @ flat).reshape(stop - start, ncla, numt, nq)
+        nzero = None
+        if iftrump == 1:
+            nzero = (w @ zeros).reshape(sums.shape)
+            batch = np.arange(stop - start)[:, None]
+            nzero[batch, column_labels[start:stop], np.arange(numt)[None, :], :] -= 1
+
+        def resum(ires, k, pos, iq, start=start):
+            return _draw_sums(powered, draws[start + ires], columns[start + ires, pos], k, iq, samstart, nsam)
+
+        anear[start:stop] = _confusions_from_sums(
+            sums, nzero, labels[start:stop], columns[start:stop], nsam, expo, iftrump, resum
+        )
+    return anear
+
+
+def _draw_sums(powered, rows, cols, k, iq, samstart, nsam):
+    """
+    Sums of the powered distances over the rows of class `k` of resampled matrices, added by ``np.add.reduceat``
+    over the rows as distclust does.
+
+    Args:
+        powered (np.ndarray): Powered distances of shape (N, N, nq), 0 on the diagonal.
+        rows (np.ndarray): Row/column order of the resample of each entry, shape (E, N).
+        cols (np.ndarray): Original column of each entry.
+        k (np.ndarray): Class of each entry.
+        iq (np.ndarray): Cost value of each entry.
+        samstart (np.ndarray): First row of each class.
+        nsam (np.ndarray): Number of trials in each class.
+
+    Returns:
+        np.ndarray: The sum of each entry.
+    """
+    out = np.zeros(len(k))
+    for c in np.unique(k):
+        sel = np.nonzero(k == c)[0]
+        rank = np.arange(samstart[c], samstart[c] + nsam[c])[:, None]
+        out[sel] = np.add.reduceat(powered[rows[sel].T[rank], cols[sel], iq[sel]], [0], axis=0)[0]
+    return out
+
+
+def _resample_labels(draws, nsam, ifresamp):
+    """
+    Class labels and columns of each resample, applied to the original trials.
+
+    Args:
+        draws (np.ndarray): Row/column order of each resample, shape (R, N).
+        nsam (np.ndarray): Number of trials in each class.
+        ifresamp (int): 1 for relabel, 2 for bootstrap resampling.
+
+    Returns:
+        tuple of np.ndarray: ``(labels, columns)``, both of shape (R, N). Position ``j`` of resample ``r`` is the
+            original column ``columns[r, j]``, of class ``labels[r, j]``. For a relabelling the columns stay in
+            place and the trials get new labels; a bootstrap keeps the labels and repeats columns.
+    """
+    cls_pos = np.repeat(np.arange(len(nsam)), nsam)  # class of each position of a resampled matrix
+    if ifresamp == 1:
+        labels = np.empty_like(draws)
+        np.put_along_axis(labels, draws, cls_pos[None, :], axis=1)
+        return labels, np.broadcast_to(np.arange(draws.shape[1]), draws.shape)
+    return np.broadcast_to(cls_pos, draws.shape), draws
+
+
+def _label_weights(labels, columns, ncla):
+    """
+    Weight of each original trial in each class sum, shape (R, K, N): how many times the trial is drawn into the
+    class, i.e. the one-hot labels for a relabelling.
+    """
+    weights = np.zeros((labels.shape[0], ncla, labels.shape[1]))
+    np.add.at(weights, (np.arange(labels.shape[0])[:, None], labels, columns), 1.0)
+    return weights
+
+
+def _confusions_from_sums(sums, nzero, labels, columns, nsam, expo, iftrump, resum):
+    """
+    Confusion matrices from the class sums of the powered distances.
+
+    Args:
+        sums (np.ndarray): Sum of ``dists ** expo`` over the trials of each class, without self-distances, for each
+            original column; shape (R, K, N, nq).
+        nzero (np.ndarray or None): Number of 0-distances in the same sums, or None without iftrump.
+        labels (np.ndarray): Class of each position, shape (R, N').
+        columns (np.ndarray): Original column of each position, shape (R, N').
+        nsam (np.ndarray): Number of trials in each class.
+        expo (float): Exponent of the weighted mean.
+        iftrump (int): Whether 0-distances trump other values.
+        resum (callable): Called as ``resum(ires, k, pos, iq)`` with arrays of entries of `sums` whose class
+            averages are within a relative `_TIE_RTOL` of another class at the smallest average, returns their
+            sums added in the order of distclust.
+
+    Returns:
+        np.ndarray: Confusion matrices of shape (R, nq, K, K).
+    """
+    ncla = len(nsam)
+    sums = np.take_along_axis(sums, columns[:, None, :, None], axis=2)
+    nsm = (nsam[None, :, None] - (labels[:, None, :] == np.arange(ncla)[None, :, None]))[..., None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        av = (sums / nsm) ** (1 / expo)
+        if iftrump == 1:
+            nzero = np.take_along_axis(nzero, columns[:, None, :, None], axis=2)
+            av = np.where(nzero > 0, -nzero / nsm, av)  # -fraction of zeros in each column
+
+    close = np.isclose(av, np.min(av, axis=1, keepdims=True), rtol=_TIE_RTOL, atol=0)
+    close &= np.sum(close, axis=1, keepdims=True) > 1
+    if iftrump == 1:
+        close &= nzero == 0  # fractions of zeros are exact
+    if np.any(close):
+        ires, k, pos, iq = np.nonzero(close)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            av[close] = (resum(ires, k, pos, iq) / np.broadcast_to(nsm, av.shape)[close]) ** (1 / expo)
+
+    a = np.min(av, axis=1, keepdims=True)
+    nearest = av == a
+    counts = np.sum(nearest, axis=1)
+    found = counts > 0
+    ires, _, iq = np.nonzero(found)
+    icla = np.broadcast_to(labels[:, :, None], found.shape)[found]
+    anear = np.zeros((sums.shape[0], sums.shape[3], ncla, ncla))
+    # ties are split between the nearest classes, and credited to the first of them
+    np.add.at(anear, (ires, iq, icla, np.argmax(nearest, axis=1)[found]), 1 / counts[found])
+    return anear.astype(int)
@@ -0,0 +1,466 @@
+import os
+import uuid
+import shutil
+import weakref
+import tempfile
+import functools
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+from .spkd import spkd_cross, _to_csr, _validate_csr, _resolve_n_jobs
+from .backends import _resolve_backend, _work
+from .monitor import SpkdCancelled
+
+
+class SharedArray:
+    """
+    Reference to an array in the shared memory of a :class:`SpkdExecutor`.
+
+    Returned by :meth:`SpkdExecutor.share` and :attr:`SpkdFuture.shared`. It pickles as a file path, so passing it
+    to :meth:`SpkdExecutor.submit` sends no array data; the worker maps the array instead.
+
+    Attributes
+    ----------
+    path : str
+        ``.npy`` file holding the array.
+    shape : tuple of int
+        Shape of the array.
+    dtype : np.dtype
+        Type of the array.
+
+    """
+
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def __repr__(self):
+        return f"SharedArray({self.path!r}, shape={self.shape}, dtype={self.dtype})"
+
+    def open(self, mode="r"):
+        """ Map the array, read-only by default; ``mode="r+"`` writes through to every process. """
+        return _open_shared(self.path, mode)
+
+    def release(self):
+        """
+        Delete the shared file. Arrays already mapped stay valid on POSIX systems, and their memory is freed when
+        the last of them is dropped; the workers drop theirs at their next task.
+        """
+        with _mapped_lock:
+            _mapped.pop((self.path, "r"), None)
+            _mapped.pop((self.path, "r+"), None)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# maps of the shared files opened by this process, by path and mode
+_mapped = {}
+_mapped_lock = threading.Lock()
+
+
+def _open_shared(path, mode):
+    """ Memory-map a shared ``.npy`` file, once per process and mode, dropping the maps of deleted files. """
+    with _mapped_lock:
+        for key in [key for key in _mapped if not os.path.exists(key[0])]:
+            del _mapped[key]
+        if (path, mode) not in _mapped:
+            _mapped[path, mode] = np.load(path, mmap_mode=mode)
+        return _mapped[path, mode]
+
+
+class SpkdFuture(Future):
+    """
+    Future of a pairwise distance job of a :class:`SpkdExecutor`.
+
+    Returned by :meth:`SpkdExecutor.submit_spkd`. Works with ``concurrent.futures.wait`` and ``as_completed`` like
+    any future. Its result is the ``(numt, numt, nq)`` float64 distance tensor, mapped from shared memory.
+
+    Attributes
+    ----------
+    pairs_done : int
+        Spike train pairs of the finished tiles.
+    pairs_total : int
+        Spike train pairs of the job.
+    shared : SharedArray
+        The distance tensor, to pass to later jobs without copying it. Filled in tile by tile, complete once the
+        future is done.
+
+    Notes
+    -----
+    :meth:`cancel` drops the tiles not started yet; the running ones finish first. The future is then done and
+    :meth:`result` raises :class:`SpkdCancelled`, as a cancelled :func:`spkd` call does.
+
+    The shared copies of the spike trains are deleted when the job is done. The distance tensor is kept for later
+    jobs until :meth:`release` or :meth:`SpkdExecutor.shutdown`.
+
+    """
+
+    def __init__(self, pairs, cells, shared, monitor, inputs=()):
+        super().__init__()
+        self.set_running_or_notify_cancel()
+        self.pairs_done = 0
+        self.pairs_total = int(sum(pairs))
+        self.shared = shared
+        self._inputs = inputs
+        self._tiles = []
+        self._pairs = pairs
+        self._cells = cells
+        self._cells_done = 0
+        self._remaining = len(pairs)
+        self._skipped = 0
+        self._error = None
+        self._cancel_requested = False
+        self._dropped = False
+        self._monitor = monitor
+        self._lock = threading.RLock()
+        if monitor is not None and not monitor._begin(self.pairs_total):
+            self._cancel_requested = True
+
+    @property
+    def fraction(self):
+        """ Fraction of the pairs computed so far. """
+        return self.pairs_done / self.pairs_total if self.pairs_total else 0.0
+
+    def cancel(self):
+        """ Stop the job after the running tiles. Returns False if it was already done. """
+        with self._lock:
+            if self.done():
+                return False
+            self._cancel_requested = True
+        self._drop_pending()
+        return True
+
+    def cancelled(self):
+        return self._cancel_requested and self.done()
+
+    def release(self):
+        """
+        Delete the shared distance tensor, cancelling the job if it is not done. The result, once returned, stays
+        valid on POSIX systems; :attr:`shared` can no longer be passed to other jobs.
+        """
+        self.cancel()
+        self.shared.release()
+
+    def _attach(self, futures):
+        """ Follow the futures of the tiles, in the order of `pairs`. """
+        self._tiles = futures
+        for i, future in enumerate(futures):
+            future.add_done_callback(functools.partial(self._tile_done, i))
+        if self._cancel_requested:
+            self._drop_pending()
+
+    def _drop_pending(self):
+        # cancelling a tile runs its callback in this thread, so the flag keeps the callbacks from recursing
+        self._dropped = True
+        for future in self._tiles:
+            future.cancel()
+
+    def _tile_done(self, i, future):
+        """ Account for a finished, failed or cancelled tile, and finish the job after the last one. """
+        with self._lock:
+            if future.cancelled():
+                self._skipped += 1
+            elif future.exception() is not None:
+                self._error = self._error or future.exception()
+                self._cancel_requested = True
+            else:
+                self.pairs_done += self._pairs[i]
+                self._cells_done += self._cells[i]
+            self._remaining -= 1
+            last = self._remaining == 0
+            if self._monitor is not None and not self._monitor._update(self.pairs_done, self._cells_done, 0, last):
+                self._cancel_requested = True
+            stop = self._cancel_requested and not self._dropped and not last
+        if stop:
+            self._drop_pending()
+        if last:
+            self._finish()
+
+    def _finish(self):
+        for shared in self._inputs:
+            shared.release()
+        if self._error is not None:
+            self.set_exception(self._error)
+            return
+        if self._monitor is not None and self._monitor.cancelled:
+            try:
+                self._monitor._check()
+            except Exception as error:
+                self.set_exception(error)
+                return
+        if self._cancel_requested or self._skipped:
+            self._cancel_requested = True
+            self.set_exception(
+                SpkdCancelled(f"Cancelled after {self.pairs_done} of {self.pairs_total} spike train pairs.")
+            )
+            return
+        self.set_result(self.shared.open("r+"))
+
+
+class SpkdExecutor:
+    """
+    Process pool for spike distance, distclust and entropy jobs, exchanging arrays through shared memory.
+
+    Spike trains and distance tensors live in files of a shared memory directory (``/dev/shm`` on Linux) that
+    every worker maps, instead of being pickled to and from the workers. :meth:`submit_spkd` splits the
+    distance tensor of a job into ``block_size x block_size`` tiles of spike train pairs, queued on the workers
+    in order, each writing its tile straight into the shared output. Other jobs go through :meth:`submit`, whose
+    :class:`SharedArray` arguments are mapped by the worker, e.g. :func:`distclust` on a finished distance tensor.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Number of worker processes. Defaults to None, the number of CPUs.
+    n_jobs : int, optional
+        Threads of each worker for the 'rs' and 'numba' backends, as in :func:`spkd`. Defaults to 1, one
+        single-threaded process per CPU.
+    backend : str, optional
+        'rs', 'numba' or 'py', as in :func:`spkd`. Defaults to None, the fastest available one for each job.
+    mp_context : multiprocessing context, optional
+        Start method of the workers, as for ``ProcessPoolExecutor``. Defaults to None, Python's default.
+    warmup : bool, optional
+        Compile or load the numba kernels in every worker when it starts (see :func:`warmup`). Defaults to True.
+    shared_dir : str, optional
+        Directory in which the shared files are created; it should be a memory file system. Defaults to None,
+        ``/dev/shm`` if it exists, else the temporary directory.
+
+    Notes
+    -----
+    The copies of the spike trains of a :meth:`submit_spkd` job are deleted when it is done, and its distance
+    tensor by :meth:`SpkdFuture.release`. Arrays shared with :meth:`share` are deleted by
+    :meth:`SharedArray.release`. :meth:`shutdown` deletes the shared directory, with ``wait=False`` once the last
+    task has finished; an executor that is never shut down deletes it when garbage collected or at exit. Arrays
+    already mapped, such as the results of :class:`SpkdFuture`, stay valid after that on POSIX systems.
+    Containers often limit ``/dev/shm`` to a few tens of megabytes; point `shared_dir` to a larger memory file
+    system, or to a local disk, for large tensors.
+
+    Functions given to :meth:`submit` must be importable by the workers, e.g. defined in a module, as for any
+    ``ProcessPoolExecutor``.
+
+    Examples
+    --------
+        >>> with ms.SpkdExecutor(max_workers=32) as executor:
+        ...     future = executor.submit_spkd(cspks, qvals, monitor=ms.SpkdMonitor(report))
+        ...     # future.cancel() stops the job after the running tiles
+        ...     future.result()
+        ...     confusion = executor.submit(ms.distclust, future.shared, nsam).result()
+
+    """
+
+    def __init__(self, max_workers=None, n_jobs=1, backend=None, mp_context=None, warmup=True, shared_dir=None):
+        if shared_dir is None and os.path.isdir("/dev/shm"):
+            shared_dir = "/dev/shm"
+        self.n_jobs = _resolve_n_jobs(n_jobs)
+        self.backend = backend
+        self._dir = tempfile.mkdtemp(prefix="metricspace-", dir=shared_dir)
+        self._remove_dir = weakref.finalize(self, shutil.rmtree, self._dir, ignore_errors=True)
+        self._jobs = []
+        self._tasks = set()  # pool futures not done yet
+        self._closed = False
+        self._lock = threading.Lock()
+        self._pool = ProcessPoolExecutor(
+            max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker if warmup else None,
+            initargs=(None if backend is None else (backend,),) if warmup else (),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+    def share(self, array):
+        """
+        Copy an array into shared memory.
+
+        Parameters
+        ----------
+        array : array-like
+            Array to share.
+
+        Returns
+        -------
+        SharedArray
+            Reference to the copy, to pass to :meth:`submit`.
+        """
+        array = np.asarray(array)
+        shared = self._create(array.shape, array.dtype)
+        shared.open("r+")[...] = array
+        return shared
+
+    def submit(self, fn, /, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` in a worker.
+
+        :class:`SharedArray` arguments, positional or keyword, are mapped read-only by the worker before the call.
+        Arrays and other arguments are pickled as usual, and so is the return value.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future of the return value.
+        """
+        return self._track(self._pool.submit(_call, fn, args, kwargs))
+
+    def submit_spkd(self, cspks, qvals, block_size=256, banded=False, monitor=None):
+        """
+        Compute pairwise spike train distances on the workers, as :func:`spkd`.
+
+        Parameters
+        ----------
+        cspks : list[np.ndarray or list] or tuple(np.ndarray, np.ndarray)
+            Spike trains, as a list or in the flat ``(values, offsets)`` layout of :func:`spkd`.
+        qvals : list or np.ndarray
+            List or array of cost values.
+        block_size : int, optional
+            Number of spike trains per tile side; one tile is one task of a worker. Defaults to 256.
+        banded : bool, optional
+            Whether to use the exact banded kernel, as in :func:`spkd`. Defaults to False.
+        monitor : SpkdMonitor, optional
+            Counts the pairs of the finished tiles, and cancels the job when cancelled, as in :func:`spkd`. Its
+            callback runs in a thread of the executor. Defaults to None.
+
+        Returns
+        -------
+        SpkdFuture
+            Future of the ``(numt, numt, len(qvals))`` distance tensor.
+
+        Raises
+        ------
+        ValueError
+            If cspks is not a list or a ``(values, offsets)`` tuple of at least 2 spike trains, or if block_size
+            is not positive.
+        """
+        if isinstance(cspks, tuple):
+            values, offsets = _validate_csr(cspks)
+        elif isinstance(cspks, list):
+            values, offsets = _to_csr(cspks)
+        else:
+            raise ValueError("cspks must be a list or a (values, offsets) tuple.")
+        if len(offsets) < 3:
+            raise ValueError("cspks must contain at least 2 spike trains for comparisons.")
+        if block_size < 1:
+            raise ValueError("block_size must be a positive integer.")
+        qvals = np.asarray(qvals, dtype=np.float64).reshape(-1)
+        counts = np.diff(offsets)
+        numt, nq = len(counts), len(qvals)
+        backend = _resolve_backend(self.backend, None, counts, None, nq, self.n_jobs)
+
+        shared_values, shared_offsets = self.share(values), self.share(offsets)
+        out = self._create((numt, numt, nq), np.float64)
+        tiles, pairs, cells = [], [], []
+        for row_start in range(0, numt, block_size):
+            rows = counts[row_start:row_start + block_size]
+            for col_start in range(row_start, numt, block_size):
+                same = col_start == row_start
+                work = _work(rows, None if same else counts[col_start:col_start + block_size], nq)
+                tiles.append((row_start, col_start))
+                pairs.append(int(work[0]))
+                cells.append(int(work[1]))
+
+        future = SpkdFuture(pairs, cells, out, monitor, (shared_values, shared_offsets))
+        tasks = [
+            self._pool.submit(
+                _spkd_tile, shared_values, shared_offsets, out, row_start, col_start, block_size, qvals, self.n_jobs,
+                banded, backend,
+            )
+            for row_start, col_start in tiles
+        ]
+        future._attach(tasks)
+        for task in tasks:
+            self._track(task)  # after the job, which reads its result from the shared files when the last tile ends
+        self._jobs.append(future)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """
+        Stop the workers and delete the shared files.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Wait for the running and queued tasks to finish. Defaults to True. Without waiting, the shared files
+            are deleted once the last task has finished.
+        cancel_futures : bool, optional
+            Cancel the jobs and tasks not started yet. Defaults to False.
+        """
+        if cancel_futures:
+            for job in self._jobs:
+                job.cancel()
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+        with self._lock:
+            self._closed = True
+            idle = not self._tasks
+        if wait or idle:
+            self._remove_dir()
+
+    def _track(self, future):
+        """ Follow a task of the pool, so the shared files outlive it after a shutdown without waiting. """
+        with self._lock:
+            self._tasks.add(future)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._lock:
+            self._tasks.discard(future)
+            idle = self._closed and not self._tasks
+        if idle:
+            self._remove_dir()
+
+    def _create(self, shape, dtype):
+        """ A new zero-filled shared array. """
+        path = os.path.join(self._dir, f"{uuid.uuid4().hex}.npy")
+        np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape).flush()
+        return SharedArray(path, shape, dtype)
+
+
+def _init_worker(backends):
+    """ Worker initializer: load the numba kernels of the backends. """
+    from .warmup import warmup
+
+    warmup(backends, slide=False, multiunit=False, curve=False, population=False)
+
+
+def _call(fn, args, kwargs):
+    """ Call `fn` in a worker, with its SharedArray arguments mapped. """
+    args = [a.open() if isinstance(a, SharedArray) else a for a in args]
+    kwargs = {k: v.open() if isinstance(v, SharedArray) else v for k, v in kwargs.items()}
+    return fn(*args, **kwargs)
+
+
+def _spkd_tile(values, offsets, out, row_start, col_start, block_size, qvals, n_jobs, banded, backend):
+    """
+    Compute one tile of the distance tensor in a worker and write it, and its mirror image, to `out`.
+
+    Args:
+        values (SharedArray): Concatenated spike times of every spike train.
+        offsets (SharedArray): Start of each spike train in `values`, plus the end of the last one.
+        out (SharedArray): The ``(numt, numt, nq)`` distance tensor.
+        row_start (int): First spike train of the rows of the tile.
+        col_start (int): First spike train of the columns of the tile.
+        block_size (int): Number of spike trains per tile side.
+        qvals (np.ndarray): Cost values.
+        n_jobs (int): Number of threads.
+        banded (bool): Whether to use the banded kernel.
+        backend (str): Backend of the job.
+    """
+    values, offsets, d = values.open(), offsets.open(), out.open("r+")
+    numt = len(offsets) - 1
+    row_stop, col_stop = min(row_start + block_size, numt), min(col_start + block_size, numt)
+    tile_a = [values[offsets[i]:offsets[i + 1]] for i in range(row_start, row_stop)]
+    # a diagonal tile passes the same list so only its upper triangle is computed
+    if col_start == row_start:
+        tile_b = tile_a
+    else:
+        tile_b = [values[offsets[i]:offsets[i + 1]] for i in range(col_start, col_stop)]
+    block = spkd_cross(tile_a, tile_b, qvals, None, n_jobs, banded, backend=backend)
+    d[row_start:row_stop, col_start:col_stop] = block
+    if col_start != row_start:
+        d[col_start:col_stop, row_start:row_stop] = block.transpose(1, 0, 2)
@@ -0,0 +1,291 @@
+import numpy as np
+from .spkd import spkd_cross, _resolve_n_jobs
+from .backends import _resolve_backend
+from .distance_store import _iterate_tiles
+from .distclust_resample import (
+    _draw_resamples,
+    _resample_labels,
+    _label_weights,
+    _confusions_from_sums,
+    _draw_sums,
+)
+from ..entropy import tblxinfo, tblxbi
+
+
+class InfoCurve:
+    """
+    Transinformation between class labels and spike trains as a function of the cost value q.
+
+    Returned by :func:`info_curve`.
+
+    Attributes
+    ----------
+    qvals : np.ndarray
+        Cost values.
+    classes : np.ndarray
+        Class labels, in the row/column order of the confusion matrices.
+    confusion : np.ndarray
+        distclust confusion matrices, shape ``(nq, K, K)``.
+    info : np.ndarray
+        Bias-corrected transinformation in bits, shape ``(nq,)``.
+    bias : np.ndarray
+        Bias correction included in `info`, shape ``(nq,)``.
+    null : np.ndarray or None
+        Bias-corrected transinformation of each resample, shape ``(n_resamples, nq)``, or None without resamples.
+
+    """
+
+    def __init__(self, qvals, classes, confusion, info, bias, null):
+        self.qvals = qvals
+        self.classes = classes
+        self.confusion = confusion
+        self.info = info
+        self.bias = bias
+        self.null = null
+
+    def p_values(self):
+        """ Fraction of resamples with at least the observed information, per cost value. """
+        if self.null is None:
+            raise ValueError("No resamples were computed; pass n_resamples to info_curve.")
+        return (1 + np.sum(self.null >= self.info, axis=0)) / (1 + len(self.null))
+
+
+def info_curve(
+    cspks: list,
+    labels,
+    qvals: list | np.ndarray,
+    expo: float = -2,
+    iftrump: int = 1,
+    bias: str | None = "tp",
+    n_resamples: int = 0,
+    method: str = "relabel",
+    seed=None,
+    block_size: int = 256,
+    use_rs: bool | None = None,
+    n_jobs: int | None = None,
+    banded: bool = False,
+):
+    """
+    Compute the bias-corrected information-vs-q curve of labelled spike trains in one pass.
+
+    Fuses ``spkd``, ``distclust`` for every cost value, ``tblxinfo`` and the bias correction, and optionally a
+    resampled null distribution. Distances are computed tile by tile and streamed straight into per-class sums,
+    so the ``N x N x nq`` distance tensor is never built.
+
+    Parameters
+    ----------
+    cspks : list[np.ndarray or list]
+        List where each inner iterable contains spike times (floats or ints) for a single spike train.
+    labels : array-like
+        Class label of each spike train, in any order.
+    qvals : list or np.ndarray
+        List or array of time precision values (floats or ints) to use in the computation.
+    expo : float, optional
+        The exponent value for calculating the weighted mean distance, as in distclust. Negative values make
+        0-distances trump. Default is -2. The median is not supported.
+    iftrump : int, optional
+        Determines whether 0-distances should trump other values, as in distclust.
+    bias : str or None, optional
+        Bias correction added to the naive information: 'tp' for Treves-Panzeri (tblxtpbi), 'ja' for jackknife
+        (tblxbi), or None. Default is 'tp'.
+    n_resamples : int, optional
+        Number of resamples of the null distribution. Defaults to 0, none.
+    method : str, optional
+        'relabel' or 'bootstrap', as in :func:`distclust_resample`. Defaults to 'relabel'.
+    seed : None, int or numpy.random.SeedSequence, optional
+        Seed of the resampling. The same seed draws the same resamples as :func:`distclust_resample` on the
+        trials sorted by label.
+    block_size : int, optional
+        Number of spike trains per tile side. Defaults to 256.
+    use_rs : bool, optional
+        True runs the Rust implementation, False one of the numba backends, None the fastest available one, as in
+        :func:`spkd`. Defaults to None.
+    n_jobs : int, optional
+        Number of worker threads, as in :func:`spkd`. Defaults to None.
+    banded : bool, optional
+        Whether to use the exact banded kernel, as in :func:`spkd`. Defaults to False.
+
+    Returns
+    -------
+    InfoCurve
+        Confusion matrices, information curve and optional null distribution.
+
+    Raises
+    ------
+    ValueError
+        If cspks is not a list of at least 2 spike trains, if labels doesn't have one label per spike train, if
+        expo is 0 or 'median', if bias is not recognized, or for a bootstrap with trumping 0-distances.
+
+    Notes
+    -----
+    The weighted mean of distclust only needs, for every column, the sum of ``dists ** expo`` and the number of
+    0-distances over the trials of each class. Both are additive over tiles, and resamples are weights on those
+    sums (see :func:`distclust_resample`), so every resample is accumulated from the same tiles. Working memory is
+    one ``block_size x block_size x nq`` tile plus ``R x K x N x nq`` accumulators for a batch of ``R`` resamples,
+    with ``R`` bounded so that ``R x K x N x nq`` stays near ``2**22``; more resamples take more passes over the
+    tiles. Class averages within a relative ``1e-9`` of the nearest class are summed again in the order of
+    distclust from their recomputed columns, so exact ties, common with spike count distances at ``q = 0``, are
+    split as distclust and :func:`distclust_resample` split them.
+
+    Examples
+    --------
+        >>> curve = ms.info_curve(spike_trains, labels, costs, n_resamples=200, seed=0)
+        >>> curve.info          # bits, one per cost value
+        >>> curve.p_values()
+    """
+    if not isinstance(cspks, list):
+        raise ValueError("cspks must be a list.")
+    if len(cspks) < 2:
+        raise ValueError("cspks must contain at least 2 spike trains for comparisons.")
+    if len(labels) != len(cspks):
+        raise ValueError(f"labels has {len(labels)} entries for {len(cspks)} spike trains.")
+    if isinstance(expo, str) or expo == 0:
+        raise ValueError("info_curve supports the weighted mean only, not the median.")
+    if method not in ("relabel", "bootstrap"):
+        raise ValueError(f"method must be 'relabel' or 'bootstrap', got {method}.")
+    if bias not in ("tp", "ja", None):
+        raise ValueError(f"bias must be 'tp', 'ja' or None, got {bias}.")
+    if expo < 0:
+        iftrump = 1
+    ifresamp = 1 if method == "relabel" else 2
+    if n_resamples > 0 and ifresamp == 2 and iftrump == 1:
+        raise ValueError("Cannot bootstrap resample when 0-distances trump.")
+
+    classes, inverse, nsam = np.unique(np.asarray(labels), return_inverse=True, return_counts=True)
+    order = np.argsort(inverse, kind="stable")  # classes must be contiguous, as in distclust
+    cspks = [np.asarray(cspks[i], dtype=np.float64) for i in order]
+    qvals = np.asarray(qvals, dtype=np.float64).reshape(-1)
+    numt, nq, ncla = len(cspks), len(qvals), len(classes)
+    n_jobs = _resolve_n_jobs(n_jobs)
+    # one backend for the tiles and for the distances summed again at ties, so both are the same
+    backend = _resolve_backend(None, use_rs, np.array([len(x) for x in cspks]), None, nq, n_jobs)
+
+    # row 0 holds the observed labels, then one row per resample
+    draws = np.concatenate(
+        [np.arange(numt)[None, :], _draw_resamples(seed, 0, n_resamples, nsam, ifresamp)]
+    )
+    cls_labels, columns = _resample_labels(draws, nsam, ifresamp)
+    # class of each original column: its new label for a relabelling, its own class for a bootstrap
+    column_labels = cls_labels if ifresamp == 1 else np.broadcast_to(np.repeat(np.arange(ncla), nsam), draws.shape)
+    samstart = np.cumsum(nsam) - nsam
+    anear = np.zeros((len(draws), nq, ncla, ncla), dtype=int)
+    # accumulators are bounded as in distclust_resample; more resamples take more passes over the tiles
+    chunk = max(1, 2**22 // (ncla * numt * nq))
+    for start in range(0, len(draws), chunk):
+        stop = min(start + chunk, len(draws))
+        sums, nzero = _class_sums(
+            _iterate_tiles(cspks, qvals, block_size, use_rs, n_jobs, banded, backend),
+            _label_weights(cls_labels[start:stop], columns[start:stop], ncla),
+            column_labels[start:stop],
+            nq,
+            expo,
+            iftrump,
+        )
+
+        def resum(ires, k, pos, iq, start=start):
+            rows, cols = draws[start + ires], columns[start + ires, pos]
+            return _tie_sums(cspks, qvals, rows, cols, k, iq, samstart, nsam, expo, backend, n_jobs, banded)
+
+        anear[start:stop] = _confusions_from_sums(
+            sums, nzero, cls_labels[start:stop], columns[start:stop], nsam, expo, iftrump, resum
+        )
+    info = tblxinfo(anear / np.sum(anear, axis=(-2, -1), keepdims=True))
+    if bias is None:
+        correction = np.zeros_like(info)
+    else:
+        correction = tblxbi(anear, "tr" if bias == "tp" else "ja")
+    info = info + correction
+    null = info[1:] if n_resamples > 0 else None
+    return InfoCurve(qvals, classes, anear[0], info[0], correction[0], null)
+
+
+def _class_sums(tiles, weights, column_labels, nq, expo, iftrump):
+    """
+    Class sums of the powered distances and of the 0-distances of a batch of resamples, streamed from the tiles.
+
+    Args:
+        tiles (iterable): Upper-triangle tiles ``(row_start, col_start, block)``, as yielded by `_iterate_tiles`.
+        weights (np.ndarray): Label weights of the batch, shape (R, K, N).
+        column_labels (np.ndarray): Class of each original column in each resample, shape (R, N).
+        nq (int): Number of cost values.
+        expo (float): Exponent of the weighted mean.
+        iftrump (int): Whether 0-distances trump other values.
+
+    Returns:
+        tuple of np.ndarray: ``(sums, nzero)`` of shape (R, K, N, nq), as taken by `_confusions_from_sums`.
+            `nzero` is None without iftrump.
+    """
+    nres, ncla, numt = weights.shape
+    weights = weights.reshape(-1, numt)
+    sums = np.zeros((nres * ncla, numt, nq))
+    nzero = np.zeros_like(sums) if iftrump == 1 else None
+    for row_start, col_start, block in tiles:
+        rows = slice(row_start, row_start + block.shape[0])
+        cols = slice(col_start, col_start + block.shape[1])
+        mirror = row_start != col_start
+        with np.errstate(divide="ignore"):
+            powered = block**expo
+        if not mirror:
+            diag = np.arange(block.shape[0])
+            powered[diag, diag, :] = 0  # self-distances are not included
+        powered[np.isinf(powered)] = 0  # 0-distances with a negative exponent, these columns are trumped
+        _accumulate(sums, weights, powered, rows, cols, mirror)
+        if iftrump == 1:
+            _accumulate(nzero, weights, (block < np.finfo(float).eps).astype(np.float64), rows, cols, mirror)
+    sums = sums.reshape(nres, ncla, numt, nq)
+    if iftrump == 1:
+        # self-distances are counted above and taken out here, so the copies of a trial drawn more than once by a
+        # bootstrap are 0-distances to each other, as in distclust_resample
+        nzero = nzero.reshape(sums.shape)
+        nzero[np.arange(nres)[:, None], column_labels, np.arange(numt)[None, :], :] -= 1
+    return sums, nzero
+
+
+def _tie_sums(cspks, qvals, rows, cols, k, iq, samstart, nsam, expo, backend, n_jobs, banded):
+    """
+    Sums of the powered distances over the rows of class `k` of resampled matrices, for the few entries near a
+    tie. The distances of their columns are computed again, each pair in the order of the upper-triangle tiles,
+    and added as distclust does (see `_draw_sums`).
+
+    Args:
+        cspks (list): Spike trains, sorted by class.
+        qvals (np.ndarray): Cost values.
+        rows (np.ndarray): Row/column order of the resample of each entry, shape (E, N).
+        cols (np.ndarray): Original column of each entry.
+        k (np.ndarray): Class of each entry.
+        iq (np.ndarray): Cost value of each entry.
+        samstart (np.ndarray): First row of each class.
+        nsam (np.ndarray): Number of trials in each class.
+        expo (float): Exponent of the weighted mean.
+        backend (str): Backend the tiles were computed with.
+        n_jobs (int): Resolved number of threads.
+        banded (bool): Whether the banded kernel is used.
+
+    Returns:
+        np.ndarray: The sum of each entry.
+    """
+    numt = len(cspks)
+    out = np.zeros(len(k))
+    unique = np.unique(cols)
+    step = max(1, 2**22 // (2 * numt * len(qvals)))
+    for start in range(0, len(unique), step):
+        part = unique[start:start + step]
+        sel = np.nonzero(np.isin(cols, part))[0]
+        trains = [cspks[c] for c in part]
+        before = spkd_cross(cspks, trains, qvals, None, n_jobs, banded, backend=backend)
+        after = spkd_cross(trains, cspks, qvals, None, n_jobs, banded, backend=backend).transpose(1, 0, 2)
+        dists = np.where((np.arange(numt)[:, None] < part[None, :])[:, :, None], before, after)
+        with np.errstate(divide="ignore"):
+            powered = dists**expo
+        powered[part, np.arange(len(part)), :] = 0  # self-distances are not included
+        powered[np.isinf(powered)] = 0
+        out[sel] = _draw_sums(powered, rows[sel], np.searchsorted(part, cols[sel]), k[sel], iq[sel], samstart, nsam)
+    return out
+
+
+def _accumulate(acc, weights, tile, rows, cols, mirror):
+    """ Add the weighted class sums of one upper-triangle tile, and of its mirror image, to `acc`. """
+    nrow, ncol, nq = tile.shape
+    acc[:, cols, :] += (weights[:, rows] @ tile.reshape(nrow, ncol * nq)).reshape(-1, ncol, nq)
+    if mirror:
+        acc[:, rows, :] += (weights[:, cols] @ tile.transpose(1, 0, 2).reshape(ncol, nrow * nq)).reshape(-1, nrow, nq)
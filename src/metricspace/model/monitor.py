@@ -0,0 +1,147 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class SpkdCancelled(Exception):
+    """ Raised by :func:`spkd`, :func:`spkd_slide` and :func:`spkd_cross` when their monitor is cancelled. """
+
+
+class SpkdMonitor:
+    """
+    Progress, work counters, stage timings and cooperative cancellation of long spike distance calls.
+
+    Pass it as ``monitor=`` to :func:`spkd`, :func:`spkd_slide` or :func:`spkd_cross`, on either backend. The
+    pairwise loop updates the counters as pairs finish and calls `callback` about every `interval` seconds, and
+    once more at the end. A cancelled monitor stops the loop after the pairs in progress and the call raises
+    :class:`SpkdCancelled`.
+
+    Parameters
+    ----------
+    callback : callable, optional
+        Called as ``callback(monitor)`` while the distances are computed. Returning False cancels the call;
+        an exception raised by the callback cancels it and is raised again by the call.
+    interval : float, optional
+        Seconds between two calls of `callback`. Defaults to 1.0.
+
+    Attributes
+    ----------
+    pairs_done : int
+        Spike train pairs computed so far.
+    pairs_total : int
+        Spike train pairs to compute.
+    cells : int
+        Dynamic program cells computed, one per spike pair, cost value and evaluated offset. The banded kernel
+        only counts the cells inside its band.
+    offsets : int
+        Offsets evaluated by the search of :func:`spkd_slide`, over all pairs.
+    stages : dict
+        Seconds spent in each stage: 'prepare' (input conversion), 'pairs' (the pairwise loop) and 'assemble'
+        (building the output tensor).
+    cancelled : bool
+        Whether the call was cancelled.
+
+    Notes
+    -----
+    :meth:`cancel` can be called from any thread, e.g. by a job scheduler, or from the callback. The Rust
+    backend checks it before each pair; the running pairs finish first, so a call stops within about one pair
+    per worker thread. A monitor can be reused for several calls, whose counters add up, until it is cancelled.
+
+    Examples
+    --------
+        >>> def report(m):
+        ...     print(f"{m.pairs_done}/{m.pairs_total} pairs, ETA {m.eta:.0f} s")
+        >>> monitor = ms.SpkdMonitor(report, interval=10)
+        >>> d = ms.spkd(cspks, qvals, n_jobs=-1, monitor=monitor)
+        >>> monitor.stages
+        {'prepare': 0.01, 'pairs': 3605.2, 'assemble': 0.4}
+
+    """
+
+    def __init__(self, callback=None, interval=1.0):
+        self.callback = callback
+        self.interval = interval
+        self.pairs_done = 0
+        self.pairs_total = 0
+        self.cells = 0
+        self.offsets = 0
+        self.stages = {}
+        self.cancelled = False
+        self._start = None
+        self._last_report = None
+        self._base = (0, 0, 0)
+        self._error = None
+
+    @property
+    def elapsed(self):
+        """ Seconds since the first pair loop started. """
+        return 0.0 if self._start is None else time.perf_counter() - self._start
+
+    @property
+    def fraction(self):
+        """ Fraction of the pairs computed so far. """
+        return self.pairs_done / self.pairs_total if self.pairs_total else 0.0
+
+    @property
+    def eta(self):
+        """ Estimated seconds left, from the pair rate so far, or inf before the first pair. """
+        if self.pairs_done == 0:
+            return float("inf")
+        return self.elapsed * (self.pairs_total - self.pairs_done) / self.pairs_done
+
+    def cancel(self):
+        """ Ask the running call to stop. """
+        self.cancelled = True
+
+    @contextmanager
+    def stage(self, name):
+        """ Add the time spent in the block to ``stages[name]``. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def _begin(self, pairs_total):
+        """ Start a pair loop of `pairs_total` pairs. Its counters are added to those of earlier loops. """
+        if self._start is None:
+            self._start = time.perf_counter()
+            self._last_report = self._start
+        self._base = (self.pairs_done, self.cells, self.offsets)
+        self.pairs_total += pairs_total
+        return not self.cancelled
+
+    def _update(self, pairs, cells, offsets, final=False):
+        """
+        Record the counters of the running pair loop and call the callback if it is due.
+
+        Returns
+        -------
+        bool
+            Whether the loop should go on.
+        """
+        self.pairs_done = self._base[0] + pairs
+        self.cells = self._base[1] + cells
+        self.offsets = self._base[2] + offsets
+        now = time.perf_counter()
+        if self.callback is not None and self._error is None and (final or now - self._last_report >= self.interval):
+            self._last_report = now
+            try:
+                if self.callback(self) is False:
+                    self.cancel()
+            except Exception as error:
+                self._error = error
+                self.cancel()
+        return not self.cancelled
+
+    def _check(self):
+        """ Raise the callback's exception, or SpkdCancelled, if the call was cancelled. """
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        if self.cancelled:
+            raise SpkdCancelled(f"Cancelled after {self.pairs_done} of {self.pairs_total} spike train pairs.")
+
+
+def _stage(monitor, name):
+    """ ``monitor.stage(name)``, or a no-op without a monitor. """
+    return nullcontext() if monitor is None else monitor.stage(name)
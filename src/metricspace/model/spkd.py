@@ -1,24 +1,69 @@
+import os
 import numpy as np
 import warnings
-from .calculate_spkd.spkd_functions import calculate_spkd_py
-from metricspace.metricspace_rs import calculate_spkd_rs
-import pandas as pd
+from .spkd_cache import SpkdCache
+from .monitor import _stage
+from .backends import _resolve_backend
 
+# The backends are imported where they are called, so `import metricspace` stays light and the Rust path never
+# loads numba.
 
-def spkd(cspks: list, qvals: list | np.ndarray, use_rs: bool = True):
+
+def _resolve_n_jobs(n_jobs: int | None) -> int:
+    """ Translate a joblib-style n_jobs value into a positive thread count. """
+    if n_jobs is None:
+        return 1
+    if n_jobs == 0:
+        raise ValueError("n_jobs must be a non-zero integer or None.")
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return int(n_jobs)
+
+
+def spkd(
+    cspks: list | tuple,
+    qvals: list | np.ndarray,
+    use_rs: bool | None = None,
+    n_jobs: int | None = None,
+    banded: bool = False,
+    cache=None,
+    monitor=None,
+    backend: str | None = None,
+):
     """
     Compute pairwise spike train distances with variable time precision for multiple cost values.
 
     Parameters
     ----------
-    cspks : list[np.ndarray or list] 
-        List where each inner iterable contains spike times (floats or ints) for a single spike train.
+    cspks : list[np.ndarray or list] or tuple(np.ndarray, np.ndarray)
+        List where each inner iterable contains spike times (floats or ints) for a single spike train, or the flat
+        ``(values, offsets)`` layout: every spike time concatenated in `values`, and spike train ``i`` in
+        ``values[offsets[i]:offsets[i + 1]]``, so ``len(offsets)`` is the number of spike trains plus 1.
+        The Rust implementation reads the flat layout in place, without copying it.
     qvals : list or np.ndarray
         List or array of time precision values (floats or ints) to use in the computation.
     use_rs : bool, optional
-        Whether to use the rs_distances implementation. If True, it utilizes
-        calculate_spkd_rust function, otherwise, it uses spkd_functions.calculate_spkd.
-        Defaults to True.
+        True runs the Rust implementation, False one of the numba backends. Defaults to None, the backend of
+        lowest estimated time for the problem size among the installed ones (see :func:`select_backend`).
+    n_jobs : int, optional
+        Number of worker threads of the pairwise loop on the 'rs' and 'numba' backends. ``None`` means 1,
+        ``-1`` means all available cores and ``-2`` all but one; 0 is rejected. The GIL is released while the
+        threads run. Ignored by the 'py' backend. Defaults to None, a single thread: using several cores is
+        opt-in.
+    banded : bool, optional
+        Whether to use the exact banded kernel. Two spikes with ``q * |dt| >= 2`` are never matched, so for each
+        cost value only the band of spike pairs closer than ``2 / q`` is computed and the rest of the recurrence
+        is filled in closed form. Gives the same distances, much faster for large cost values.
+        Spike times in each train must be sorted. Defaults to False.
+    cache : SpkdCache or str, optional
+        A :class:`SpkdCache`, or the path of its directory, to read already computed distances from and store
+        new ones in. Empty spike trains are kept. Defaults to None, no caching.
+    monitor : SpkdMonitor, optional
+        Receives the progress, work counters and stage timings of the call, and can cancel it.
+        Defaults to None.
+    backend : str, optional
+        Run on this backend instead of choosing one: 'rs' (the Rust extension), 'numba' (a multi-threaded
+        numba loop over all pairs) or 'py' (a Python loop over the pairs calling numba kernels). Defaults to None.
   
     Returns
     -------
@@ -29,29 +74,93 @@ def spkd(cspks: list, qvals: list | np.ndarray, use_rs: bool = True):
     Raises
     ------
     ValueError
-        If cspks is not a list or if it contains less than 2 spike trains.
+        If cspks is not a list or a ``(values, offsets)`` tuple, if offsets are not non-decreasing indices of
+        values, if cspks contains less than 2 spike trains, if n_jobs is 0, or if backend is unknown.
+    ImportError
+        If the backend asked for, or the Rust extension with use_rs=True, is not installed.
+    SpkdCancelled
+        If the monitor was cancelled.
 
     Notes
     -----
-    The Rust implementation speed improvement typically scales by the number of spike-trains in cspks.
-    You can opt out for easier debugging using the use_rs flag. 
+    The Rust implementation speed improvement typically scales by the number of spike-trains in cspks,
+    and by n_jobs on multi-core machines. A list is concatenated into the flat layout once before it is
+    passed on, which is cheaper than handing over many small arrays.
+    You can opt out for easier debugging using the use_rs flag. Without the Rust extension, e.g. on platforms
+    without a wheel, the 'numba' backend runs the same pairwise loop on `n_jobs` threads.
 
     """
-    if not isinstance(cspks, list):
-        raise ValueError("cspks must be a list.")
-    if len(cspks) < 2:
+    if isinstance(cspks, tuple):
+        # the flat layout is only split into per-train views for the backends that take a list
+        values, offsets = _validate_csr(cspks)
+        counts = np.diff(offsets)
+    elif not isinstance(cspks, list):
+        raise ValueError("cspks must be a list or a (values, offsets) tuple.")
+    else:
+        values, offsets = None, None
+        counts = np.array([len(x) for x in cspks], dtype=np.int64)
+    if len(counts) < 2:
         raise ValueError("cspks must contain at least 2 spike trains for comparisons.")
     if not isinstance(qvals, np.ndarray):
         qvals = np.array(qvals)
-    if use_rs:
-        d = calculate_spkd_rs(cspks, qvals)
-        return np.maximum(d, np.transpose(d, [1, 0, 2]))
+    requested = backend
+    backend = _resolve_backend(backend, use_rs, counts, None, qvals.size, _resolve_n_jobs(n_jobs))
+    if cache is not None:
+        # every backend gives the same distances, so the backend is not part of the key, and the missing pairs are
+        # computed on the backend chosen for their own size
+        settings = {"function": "spkd", "banded": banded}
+        return _as_cache(cache).fetch(
+            _from_csr(values, offsets) if isinstance(cspks, tuple) else cspks,
+            qvals,
+            settings,
+            lambda a, b, q: spkd_cross(a, b, q, use_rs, n_jobs, banded, monitor, requested),
+        )
+    if backend == "rs":
+        from metricspace.metricspace_rs import calculate_spkd_csr_rs
+
+        with _stage(monitor, "prepare"):
+            if values is None:
+                values, offsets = _to_csr(cspks)
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_csr_rs(
+                values, offsets, qvals.astype(np.float64), _resolve_n_jobs(n_jobs), banded, monitor
+            )
+        with _stage(monitor, "assemble"):
+            d = np.maximum(d, np.transpose(d, [1, 0, 2]))
+    elif backend == "numba":
+        from .calculate_spkd.parallel_functions import calculate_spkd_numba
+
+        with _stage(monitor, "prepare"):
+            if values is None:
+                values, offsets = _to_csr(cspks)
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_numba(
+                values, offsets, values, offsets, qvals.astype(np.float64), True, _resolve_n_jobs(n_jobs), banded,
+                monitor,
+            )
     else:
-        return calculate_spkd_py(cspks, qvals, None)
+        from .calculate_spkd.spkd_functions import calculate_spkd_py
+
+        if isinstance(cspks, tuple):
+            cspks = _from_csr(values, offsets)
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_py(cspks, qvals, None, banded, monitor=monitor)
+    if monitor is not None:
+        monitor._check()
+    return d
 
 
 def spkd_slide(
-    cspks: list, qvals: list | np.ndarray, res: float | int = 1e-3
+    cspks: list,
+    qvals: list | np.ndarray,
+    res: float | int = 1e-3,
+    use_rs: bool | None = None,
+    n_jobs: int | None = None,
+    exact: bool = False,
+    banded: bool = False,
+    cache=None,
+    monitor=None,
+    backend: str | None = None,
 ):
     """
 
@@ -65,13 +174,33 @@ def spkd_slide(
 
     Parameters
     ----------
-    cspks : list[np.ndarray or list] 
-        List where each inner iterable contains spike times (floats or ints) for a single spike train.
+    cspks : list[np.ndarray or list] or tuple(np.ndarray, np.ndarray)
+        List where each inner iterable contains spike times (floats or ints) for a single spike train, or the flat
+        ``(values, offsets)`` layout of :func:`spkd`, e.g. from :func:`epoch`. Spike trains are then views of
+        `values`, not copies.
     qvals : list or np.ndarray
         List or array of time precision values (floats or ints) to use in the computation.
     res : float or int, optional
         Time resolution (float or int) to use in the computation. Defaults to 1e-3, which indicates
         a millisecond resolution search window.
+    use_rs : bool, optional
+        True runs the Rust implementation, False the numba one, None the faster available one, as in
+        :func:`spkd`. Defaults to None.
+    n_jobs : int, optional
+        Number of worker threads used by the Rust implementation, as in :func:`spkd`. Defaults to None.
+    exact : bool, optional
+        Search the continuous range of offsets in [-1, 1] instead of the `res` grid. The minimum is always
+        reached at an offset that makes two spikes coincide, so only those offsets are evaluated. `res` is
+        ignored. Defaults to False.
+    banded : bool, optional
+        Whether to use the exact banded kernel, as in :func:`spkd`. Spike times must be sorted. Defaults to False.
+    cache : SpkdCache or str, optional
+        A :class:`SpkdCache`, or the path of its directory, as in :func:`spkd`. Defaults to None, no caching.
+    monitor : SpkdMonitor, optional
+        Receives the progress, work counters (including the offsets evaluated) and stage timings of the call, and
+        can cancel it. Defaults to None.
+    backend : str, optional
+        'rs' or 'py', as in :func:`spkd`; the 'numba' backend does not compute sliding distances. Defaults to None.
 
     Returns
     -------
@@ -81,23 +210,213 @@ def spkd_slide(
 
     Notes
     -----
-    Currently, this function only uses the Python implementation.
+    The offset search is pruned: the distance can't drop below the spike count difference of a pair, and it
+    changes by at most ``q * min(n, m)`` per unit of offset, so offsets that can't beat the current minimum
+    for any cost value are skipped without running the dynamic program.
 
     Raises
     ------
     ValueError
-        If cspks is not a list or if it contains less than 2 spike trains.
+        If cspks is not a list or a ``(values, offsets)`` tuple, if it contains less than 2 spike trains, or if
+        backend is unknown or 'numba'.
+    ImportError
+        If the backend asked for is not installed.
+
+    SpkdCancelled
+        If the monitor was cancelled.
 
     UserWarning
        If the resolution is too small, the computation time may be long. A resolution of 1e-4 adds 200 computations per spike pair.
 
     """
-    if not isinstance(cspks, list):
-        raise ValueError("cspks must be a list.")
+    if isinstance(cspks, tuple):
+        cspks = _from_csr(*_validate_csr(cspks))
+    elif not isinstance(cspks, list):
+        raise ValueError("cspks must be a list or a (values, offsets) tuple.")
     if len(cspks) < 2:
         raise ValueError("cspks must contain at least 2 spike trains for comparisons.")
     if not isinstance(qvals, np.ndarray):
         qvals = np.array(qvals)
-    if res < 1e-4:
+    if not exact and res < 1e-4:
         raise UserWarning(f"Too small of a search window can drastically increase computation time: {res}")
-    return calculate_spkd_py(cspks, qvals, res)
+    counts = np.array([len(x) for x in cspks], dtype=np.int64)
+    requested = backend
+    backend = _resolve_backend(backend, use_rs, counts, None, qvals.size, _resolve_n_jobs(n_jobs), slide=True)
+    if cache is not None:
+
+        def compute(a, b, q):
+            # the backend is chosen for the size of the missing pairs, as it is not part of the key
+            counts_a = np.array([len(x) for x in a], dtype=np.int64)
+            counts_b = None if b is a else np.array([len(x) for x in b], dtype=np.int64)
+            chosen = _resolve_backend(requested, use_rs, counts_a, counts_b, len(q), _resolve_n_jobs(n_jobs), True)
+            return _spkd_slide_cross(a, b, q, res, chosen, n_jobs, exact, banded, monitor)
+
+        settings = {"function": "spkd_slide", "banded": banded, "exact": exact, "res": None if exact else float(res)}
+        return _as_cache(cache).fetch(cspks, qvals, settings, compute)
+    if backend == "rs":
+        from metricspace.metricspace_rs import calculate_spkd_slide_rs
+
+        with _stage(monitor, "prepare"):
+            offsets = np.arange(-1, 1 + res, res) if not exact else np.zeros(0)
+            cspks = [np.asarray(x, dtype=np.float64) for x in cspks]
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_slide_rs(
+                cspks, qvals.astype(np.float64), offsets, exact, _resolve_n_jobs(n_jobs), banded, monitor
+            )
+        with _stage(monitor, "assemble"):
+            d = np.maximum(d, np.transpose(d, [1, 0, 2]))
+    else:
+        from .calculate_spkd.spkd_functions import calculate_spkd_py
+
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_py(cspks, qvals, None if exact else res, banded, exact, monitor)
+    if monitor is not None:
+        monitor._check()
+    return d
+
+
+def spkd_cross(
+    cspks_a: list,
+    cspks_b: list,
+    qvals: list | np.ndarray,
+    use_rs: bool | None = None,
+    n_jobs: int | None = None,
+    banded: bool = False,
+    monitor=None,
+    backend: str | None = None,
+):
+    """
+    Compute spike train distances between two sets of spike trains for multiple cost values.
+
+    Only the ``len(cspks_a) x len(cspks_b)`` block is computed, e.g. test trials against a training set or new
+    trials against a reference library, instead of every pair of the combined list.
+
+    Parameters
+    ----------
+    cspks_a : list[np.ndarray or list]
+        List where each inner iterable contains spike times (floats or ints) for a single spike train.
+    cspks_b : list[np.ndarray or list]
+        Second list of spike trains. Passing the same list object as `cspks_a` gives the same result as :func:`spkd`.
+    qvals : list or np.ndarray
+        List or array of time precision values (floats or ints) to use in the computation.
+    use_rs : bool, optional
+        True runs the Rust implementation, False one of the numba backends, None the fastest available one, as in
+        :func:`spkd`. Defaults to None.
+    n_jobs : int, optional
+        Number of worker threads of the 'rs' and 'numba' backends, as in :func:`spkd`. Defaults to None.
+    banded : bool, optional
+        Whether to use the exact banded kernel, as in :func:`spkd`. Spike times must be sorted. Defaults to False.
+    monitor : SpkdMonitor, optional
+        Receives the progress of the call and can cancel it, as in :func:`spkd`. Defaults to None.
+    backend : str, optional
+        'rs', 'numba' or 'py', overriding the automatic choice, as in :func:`spkd`. Defaults to None.
+
+    Returns
+    -------
+    ndarray
+        A 3D ndarray of shape ``(len(cspks_a), len(cspks_b), len(qvals))``; entry ``[i, j, k]`` is the distance
+        between ``cspks_a[i]`` and ``cspks_b[j]`` at ``qvals[k]``.
+
+    Raises
+    ------
+    ValueError
+        If cspks_a or cspks_b is not a list or is empty, if n_jobs is 0, or if backend is unknown.
+    ImportError
+        If the backend asked for is not installed.
+    SpkdCancelled
+        If the monitor was cancelled.
+
+    """
+    if not isinstance(cspks_a, list) or not isinstance(cspks_b, list):
+        raise ValueError("cspks_a and cspks_b must be lists.")
+    if len(cspks_a) == 0 or len(cspks_b) == 0:
+        raise ValueError("cspks_a and cspks_b must each contain at least 1 spike train.")
+    qvals = np.asarray(qvals, dtype=np.float64)
+    counts_a = np.array([len(x) for x in cspks_a], dtype=np.int64)
+    counts_b = None if cspks_b is cspks_a else np.array([len(x) for x in cspks_b], dtype=np.int64)
+    backend = _resolve_backend(backend, use_rs, counts_a, counts_b, qvals.size, _resolve_n_jobs(n_jobs))
+    if backend == "rs":
+        from metricspace.metricspace_rs import calculate_spkd_cross_rs
+
+        with _stage(monitor, "prepare"):
+            trains_a = [np.asarray(x, dtype=np.float64) for x in cspks_a]
+            trains_b = trains_a if cspks_b is cspks_a else [np.asarray(x, dtype=np.float64) for x in cspks_b]
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_cross_rs(trains_a, trains_b, qvals, _resolve_n_jobs(n_jobs), banded, monitor)
+    elif backend == "numba":
+        from .calculate_spkd.parallel_functions import calculate_spkd_numba
+
+        with _stage(monitor, "prepare"):
+            values_a, offsets_a = _to_csr(cspks_a)
+            values_b, offsets_b = (values_a, offsets_a) if cspks_b is cspks_a else _to_csr(cspks_b)
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_numba(
+                values_a, offsets_a, values_b, offsets_b, qvals, cspks_b is cspks_a, _resolve_n_jobs(n_jobs), banded,
+                monitor,
+            )
+    else:
+        from .calculate_spkd.spkd_functions import calculate_spkd_cross_py
+
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_cross_py(cspks_a, cspks_b, qvals, banded, monitor=monitor)
+    if monitor is not None:
+        monitor._check()
+    return d
+
+
+def _spkd_slide_cross(cspks_a, cspks_b, qvals, res, backend, n_jobs, exact, banded, monitor=None):
+    """
+    Sliding distances between two lists of spike trains, shifting those of `cspks_a`, as :func:`spkd_cross`.
+    `backend` is 'rs' or 'py'.
+    """
+    qvals = np.asarray(qvals, dtype=np.float64)
+    if backend == "rs":
+        from metricspace.metricspace_rs import calculate_spkd_slide_cross_rs
+
+        with _stage(monitor, "prepare"):
+            offsets = np.arange(-1, 1 + res, res) if not exact else np.zeros(0)
+            trains_a = [np.asarray(x, dtype=np.float64) for x in cspks_a]
+            trains_b = trains_a if cspks_b is cspks_a else [np.asarray(x, dtype=np.float64) for x in cspks_b]
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_slide_cross_rs(
+                trains_a, trains_b, qvals, offsets, exact, _resolve_n_jobs(n_jobs), banded, monitor
+            )
+    else:
+        from .calculate_spkd.spkd_functions import calculate_spkd_cross_py
+
+        with _stage(monitor, "pairs"):
+            d = calculate_spkd_cross_py(cspks_a, cspks_b, qvals, banded, None if exact else res, exact, monitor)
+    if monitor is not None:
+        monitor._check()
+    return d
+
+
+def _to_csr(cspks):
+    """ Concatenate a list of spike trains into the flat ``(values, offsets)`` layout. """
+    trains = [np.asarray(x, dtype=np.float64).reshape(-1) for x in cspks]
+    offsets = np.zeros(len(trains) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in trains], out=offsets[1:])
+    values = np.concatenate(trains) if trains else np.zeros(0)
+    return values, offsets
+
+
+def _from_csr(values, offsets):
+    """ Split the flat ``(values, offsets)`` layout into a list of views of `values`, one per spike train. """
+    return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def _validate_csr(cspks):
+    """ Check a ``(values, offsets)`` tuple and return both as contiguous float64 and int64 arrays. """
+    if len(cspks) != 2:
+        raise ValueError("cspks must be a list or a (values, offsets) tuple.")
+    values = np.ascontiguousarray(cspks[0], dtype=np.float64)
+    offsets = np.ascontiguousarray(cspks[1], dtype=np.int64)
+    if values.ndim != 1 or offsets.ndim != 1:
+        raise ValueError("values and offsets must be 1D arrays.")
+    if len(offsets) == 0 or offsets[0] < 0 or offsets[-1] > len(values) or np.any(np.diff(offsets) < 0):
+        raise ValueError("offsets must be non-decreasing indices into values, one more than the spike trains.")
+    return values, offsets
+
+
+def _as_cache(cache):
+    return cache if isinstance(cache, SpkdCache) else SpkdCache(cache)
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class SpkdCache:
+    """
+    Content-addressed on-disk cache of spike train distances, with a size limit and least-recently-used eviction.
+
+    Pass it as ``cache=`` to :func:`spkd` or :func:`spkd_slide`. Results are keyed by a hash of every spike train,
+    the cost values and the computation settings (function, `banded`, and `res` / `exact` for :func:`spkd_slide`),
+    so a rerun with the same spike trains reads the distances back instead of computing them. The backend is not
+    part of the key, as every backend gives the same distances.
+    A call whose spike trains or cost values are only partly cached reuses the cached pairs and computes the rest:
+    the distances from the new spike trains to the cached ones, and every pair for new cost values.
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        Cache directory; created if missing. Several processes can share it on POSIX systems.
+    max_bytes : int, optional
+        Size limit of the stored distances. The least recently used results are evicted past it.
+        Defaults to 2 ** 30, 1 GiB.
+
+    Notes
+    -----
+    Every call is stored as one entry, a ``.npy`` file of the float64 ``(N, N, nq)`` distances of its distinct
+    spike trains, listed in ``index.json`` with the spike train hashes, cost values, settings and last use. An
+    entry whose spike trains and cost values are all covered by a newer one is dropped. Identical spike trains
+    in a call are computed once and get distance 0 to each other.
+
+    Changes to the index are made under an exclusive ``fcntl.flock`` on ``index.lock``, so processes sharing the
+    directory don't lose each other's entries. Eviction also deletes ``.npy`` files missing from the index, e.g.
+    left by a process killed while storing. Windows has no ``fcntl``: the index is not locked there, and the
+    directory should be used by one process at a time.
+
+    Reused :func:`spkd_slide` distances of the ``res`` grid can differ from a fresh call in the last bits when the
+    spike trains come in another order, since the search shifts the first spike train of each pair.
+
+    Examples
+    --------
+        >>> cache = ms.SpkdCache("~/.cache/metricspace", max_bytes=10 * 2**30)
+        >>> d = ms.spkd(cspks, qvals, cache=cache)          # computed and stored
+        >>> d = ms.spkd(cspks, qvals, cache=cache)          # read back
+        >>> d = ms.spkd(cspks + new, qvals, cache=cache)    # only the pairs with `new` are computed
+
+    """
+
+    def __init__(self, path, max_bytes=2**30):
+        self.path = os.path.abspath(os.path.expanduser(os.fspath(path)))
+        self.max_bytes = int(max_bytes)
+        os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def size_bytes(self):
+        """ Total size of the stored distances, in bytes. """
+        return sum(entry["bytes"] for entry in self._read_index().values())
+
+    def __len__(self):
+        return len(self._read_index())
+
+    def clear(self):
+        """ Delete every stored result. """
+        with self._lock():
+            self._write_index({})
+            self._sweep({})
+
+    def fetch(self, cspks, qvals, settings, compute):
+        """
+        Distances of `cspks` for `qvals`, from the cache where available and from `compute` otherwise.
+
+        Parameters
+        ----------
+        cspks : list[np.ndarray or list]
+            List where each inner iterable contains spike times (floats or ints) for a single spike train.
+        qvals : np.ndarray
+            Array of time precision values.
+        settings : dict
+            JSON-serializable computation settings; only results with equal settings are reused.
+        compute : callable
+            ``compute(cspks_a, cspks_b, qvals)`` returns the ``(len(cspks_a), len(cspks_b), len(qvals))``
+            distances, computing only the upper triangle when both lists are the same object, like
+            :func:`spkd_cross`.
+
+        Returns
+        -------
+        ndarray
+            A 3D ndarray of shape ``(len(cspks), len(cspks), len(qvals))``.
+        """
+        trains = [np.ascontiguousarray(x, dtype=np.float64).reshape(-1) for x in cspks]
+        hashes, first, inverse = np.unique([_train_hash(x) for x in trains], return_index=True, return_inverse=True)
+        order = np.argsort(first)  # keep the order of the call, so every pair is computed as without the cache
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        hashes, inverse = hashes[order], rank[inverse.reshape(-1)]
+        trains = [trains[i] for i in first[order]]
+        qvals = np.asarray(qvals, dtype=np.float64).reshape(-1)
+        numt, nq = len(trains), len(qvals)
+
+        d = np.zeros((numt, numt, nq))
+        covered = np.zeros((nq, numt), dtype=bool)
+        used = []
+        for key, rows, iq, entry_rows, entry_iq in self._matches(hashes, qvals, settings):
+            fresh = ~np.any(covered[iq], axis=1)  # each cost value is read from one entry
+            iq, entry_iq = iq[fresh], entry_iq[fresh]
+            if len(iq) == 0:
+                continue
+            try:
+                data = np.load(os.path.join(self.path, key + ".npy"), mmap_mode="r")
+            except FileNotFoundError:  # evicted by another process since the index was read
+                continue
+            d[np.ix_(rows, rows, iq)] = data[np.ix_(entry_rows, entry_rows, entry_iq)]
+            covered[np.ix_(iq, rows)] = True
+            used.append(key)
+
+        computed = False
+        for mask in np.unique(covered, axis=0):
+            iq = np.flatnonzero(np.all(covered == mask, axis=1))
+            old, new = np.flatnonzero(mask), np.flatnonzero(~mask)
+            if len(new) == 0:
+                continue
+            new_trains = [trains[i] for i in new]
+            if len(old) > 0:
+                cross = compute([trains[i] for i in old], new_trains, qvals[iq])
+                d[np.ix_(old, new, iq)] = cross
+                d[np.ix_(new, old, iq)] = np.transpose(cross, [1, 0, 2])
+            d[np.ix_(new, new, iq)] = compute(new_trains, new_trains, qvals[iq])
+            computed = True
+
+        self._update(used, (hashes, qvals, settings, d) if computed else None)
+        return d[np.ix_(inverse, inverse)]
+
+    def _matches(self, hashes, qvals, settings):
+        """
+        Entries with the same settings that share spike trains and cost values with the request, most shared pairs
+        first, as ``(key, rows, iq, entry_rows, entry_iq)``: positions of the shared spike trains and cost values in
+        the request and in the entry.
+        """
+        matches = []
+        for key, entry in self._read_index().items():
+            if entry["settings"] != settings:
+                continue
+            _, rows, entry_rows = np.intersect1d(hashes, entry["trains"], assume_unique=True, return_indices=True)
+            _, iq, entry_iq = np.intersect1d(qvals, entry["qvals"], return_indices=True)
+            if len(rows) >= 2 and len(iq) > 0:
+                matches.append((len(rows) ** 2 * len(iq), key, rows, iq, entry_rows, entry_iq))
+        matches.sort(key=lambda match: -match[0])
+        return [match[1:] for match in matches]
+
+    def _update(self, used, new_entry):
+        """ Mark `used` entries as used, store `new_entry`, drop the entries it covers and evict past the limit. """
+        if new_entry is not None:
+            # written outside of the lock, and only renamed to an entry under it
+            key = uuid.uuid4().hex
+            tmp = os.path.join(self.path, key + ".tmp.npy")
+            np.save(tmp, new_entry[3])
+        with self._lock():
+            index = self._read_index()
+            now = time.time()
+            for used_key in used:
+                if used_key in index:
+                    index[used_key]["last_used"] = now
+            if new_entry is not None:
+                self._store(index, key, tmp, new_entry, now)
+            total = sum(entry["bytes"] for entry in index.values())
+            for old_key in sorted(index, key=lambda old_key: index[old_key]["last_used"]):
+                if total <= self.max_bytes:
+                    break
+                total -= index[old_key]["bytes"]
+                del index[old_key]
+            self._write_index(index)
+            self._sweep(index)
+
+    def _store(self, index, key, tmp, new_entry, now):
+        """ Add the distances saved to `tmp` to `index` as entry `key`, dropping the entries they cover. """
+        hashes, qvals, settings, d = new_entry
+        for old_key in [old_key for old_key, entry in index.items() if _covers(entry, hashes, qvals, settings)]:
+            del index[old_key]
+        os.replace(tmp, os.path.join(self.path, key + ".npy"))
+        index[key] = {
+            "settings": settings,
+            "trains": hashes.tolist(),
+            "qvals": qvals.tolist(),
+            "bytes": d.nbytes,
+            "last_used": now,
+        }
+
+    @contextmanager
+    def _lock(self):
+        """ Hold an exclusive lock on the index, shared by every process using the directory. """
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, "index.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _sweep(self, index):
+        """ Delete the distance files that are not entries of `index`. Called with the lock held. """
+        for name in os.listdir(self.path):
+            key, ext = os.path.splitext(name)
+            if ext == ".npy" and "." not in key and key not in index:
+                self._remove_file(key)
+
+    def _read_index(self):
+        """ Entries of the cache index whose distances are on disk. """
+        try:
+            with open(os.path.join(self.path, "index.json")) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}
+        return {key: entry for key, entry in index.items() if os.path.exists(os.path.join(self.path, key + ".npy"))}
+
+    def _write_index(self, index):
+        tmp = os.path.join(self.path, f"index.{uuid.uuid4().hex}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.path, "index.json"))
+
+    def _remove_file(self, key):
+        try:
+            os.remove(os.path.join(self.path, key + ".npy"))
+        except FileNotFoundError:
+            pass
+
+
+def _train_hash(spk_train):
+    """ Hex digest of the float64 spike times of one spike train. """
+    return hashlib.blake2b(spk_train.tobytes(), digest_size=16).hexdigest()
+
+
+def _covers(entry, hashes, qvals, settings):
+    """ Whether every spike train and cost value of `entry` is in `hashes` and `qvals`, with the same settings. """
+    return (
+        entry["settings"] == settings
+        and np.all(np.isin(entry["trains"], hashes))
+        and np.all(np.isin(entry["qvals"], qvals))
+    )
@@ -0,0 +1,150 @@
+import numpy as np
+
+
+class SpkdCurve:
+    """
+    Exact pairwise spike train distances as piecewise-linear functions of the cost value q.
+
+    Returned by :func:`spkd_curve`. For every pair of spike trains the distance is stored as the segments of its
+    lower envelope, so distances at any set of cost values can be read off without re-running the
+    dynamic program.
+
+    Attributes
+    ----------
+    numt : int
+        Number of spike trains.
+    offsets : np.ndarray
+        Start of each pair's segments in the flat segment arrays, length ``npairs + 1``. Pairs are stored in
+        upper-triangle order ``(0, 1), (0, 2), ..., (1, 2), ...``.
+    starts : np.ndarray
+        Cost value at which each segment starts. The first segment of every pair starts at 0.
+    intercepts : np.ndarray
+        Distance at q = 0 of the line carrying each segment, i.e. the number of unmatched spikes.
+    slopes : np.ndarray
+        Slope of each segment, i.e. the summed time shift of the matched spikes.
+
+    """
+
+    def __init__(self, numt, offsets, starts, intercepts, slopes):
+        self.numt = numt
+        self.offsets = offsets
+        self.starts = starts
+        self.intercepts = intercepts
+        self.slopes = slopes
+
+    def _pair_index(self, xi, xj):
+        if xi == xj or not (0 <= xi < self.numt and 0 <= xj < self.numt):
+            raise ValueError(f"({xi}, {xj}) is not a pair of distinct spike trains out of {self.numt}.")
+        xi, xj = min(xi, xj), max(xi, xj)
+        return self.numt * xi - xi * (xi + 1) // 2 + (xj - xi - 1)
+
+    def segments(self, xi, xj):
+        """
+        Segments of the cost curve between spike trains `xi` and `xj`.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            ``(starts, intercepts, slopes)``; the distance is ``intercepts[i] + q * slopes[i]`` for
+            ``starts[i] <= q < starts[i + 1]``.
+        """
+        pair = self._pair_index(xi, xj)
+        seg = slice(self.offsets[pair], self.offsets[pair + 1])
+        return self.starts[seg], self.intercepts[seg], self.slopes[seg]
+
+    def breakpoints(self, xi, xj):
+        """ Cost values where the slope of the curve between spike trains `xi` and `xj` changes. """
+        return self.segments(xi, xj)[0][1:]
+
+    def __call__(self, qvals: list | np.ndarray):
+        """
+        Evaluate every curve at the given cost values.
+
+        Parameters
+        ----------
+        qvals : list or np.ndarray
+            Non-negative cost values.
+
+        Returns
+        -------
+        ndarray
+            A 3D ndarray of shape ``(numt, numt, len(qvals))``, the same as :func:`metricspace.spkd` would return.
+        """
+        qvals = np.asarray(qvals, dtype=np.float64).reshape(-1)
+        if np.any(qvals < 0):
+            raise ValueError("qvals must be non-negative.")
+        from .calculate_spkd.curve_functions import _evaluate_curves_py
+
+        d = np.zeros((self.numt, self.numt, len(qvals)))
+        _evaluate_curves_py(self.numt, self.offsets, self.starts, self.intercepts, self.slopes, qvals, d)
+        return d
+
+
+def spkd_curve(cspks: list):
+    """
+    Compute the exact spike train distance of every pair as a function of the cost value q.
+
+    For a fixed pair of spike trains the cost-based distance is a concave piecewise-linear function of q: each
+    alignment contributes the line ``(unmatched spikes) + q * (summed time shift of matched spikes)`` and the
+    distance is their minimum. This function finds the breakpoints and slopes of that minimum, so the distances
+    at any grid of cost values, including one refined later around a point of interest, can be read off the
+    result without recomputing.
+
+    Parameters
+    ----------
+    cspks : list[np.ndarray or list]
+        List where each inner iterable contains sorted spike times (floats or ints) for a single spike train.
+
+    Returns
+    -------
+    SpkdCurve
+        The curves of every pair. Call it with an array of cost values to get the same 3D ndarray as
+        :func:`metricspace.spkd`, or use ``segments``/``breakpoints`` to inspect a single pair.
+
+    Raises
+    ------
+    ValueError
+        If cspks is not a list or if it contains less than 2 spike trains.
+
+    Notes
+    -----
+    The dynamic program also tracks the number of matched spikes, so each pair costs
+    ``O(n * m * min(n, m))`` instead of the ``O(n * m * len(qvals))`` of :func:`metricspace.spkd`.
+    It pays off when many cost values are evaluated, or when the grid is refined afterwards.
+
+    Examples
+    --------
+        >>> import numpy as np
+        >>> import metricspace as ms
+        >>> spike_trains = [np.sort(np.random.uniform(0, 2, 20)) for _ in range(5)]
+        >>> curves = ms.spkd_curve(spike_trains)
+        >>> costs = 2 ** np.arange(-4, 9.5, 0.5)
+        >>> np.allclose(curves(costs), ms.spkd(spike_trains, costs, use_rs=False))
+        True
+        >>> fine = curves(np.linspace(8, 16, 200))  # refine the grid without re-running the pairwise job
+    """
+    if not isinstance(cspks, list):
+        raise ValueError("cspks must be a list.")
+    if len(cspks) < 2:
+        raise ValueError("cspks must contain at least 2 spike trains for comparisons.")
+
+    from .calculate_spkd.curve_functions import calculate_curve_py
+
+    trains = [np.asarray(x, dtype=np.float64) for x in cspks]
+    numt = len(trains)
+    maxcount = max(len(x) for x in trains)
+    row_prev = np.empty((maxcount + 1, maxcount + 1))
+    row_cur = np.empty((maxcount + 1, maxcount + 1))
+
+    starts, intercepts, slopes = [], [], []
+    offsets = np.zeros(numt * (numt - 1) // 2 + 1, dtype=np.int64)
+    pair = 0
+    for xi in range(numt - 1):
+        for xj in range(xi + 1, numt):
+            seg_starts, seg_intercepts, seg_slopes = calculate_curve_py(trains[xi], trains[xj], row_prev, row_cur)
+            starts.append(seg_starts)
+            intercepts.append(seg_intercepts)
+            slopes.append(seg_slopes)
+            offsets[pair + 1] = offsets[pair] + len(seg_starts)
+            pair += 1
+    return SpkdCurve(numt, offsets, np.concatenate(starts), np.concatenate(intercepts), np.concatenate(slopes))
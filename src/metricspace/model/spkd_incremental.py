@@ -0,0 +1,105 @@
+import numpy as np
+from .spkd import spkd_cross
+
+
+class IncrementalSpkd:
+    """
+    Pairwise spike train distances that grow as spike trains are appended.
+
+    Each :meth:`append` computes only the distances from the new spike trains to the existing ones and among
+    themselves, ``O(N * n_new)`` dynamic programs instead of the ``O(N^2)`` of recomputing :func:`spkd` on the
+    whole list. The tensor is kept in a buffer whose capacity doubles, so appends don't copy it every time.
+
+    Parameters
+    ----------
+    qvals : list or np.ndarray
+        List or array of time precision values (floats or ints) to use in the computation.
+    cspks : list[np.ndarray or list], optional
+        Initial spike trains.
+    distances : np.ndarray, optional
+        Already computed ``spkd(cspks, qvals)`` for the initial spike trains, to avoid computing it again.
+    use_rs : bool, optional
+        True runs the Rust implementation, False one of the numba backends, None the fastest available one, as in
+        :func:`spkd`. Defaults to None.
+    n_jobs : int, optional
+        Number of worker threads, as in :func:`spkd`. Defaults to None.
+    banded : bool, optional
+        Whether to use the exact banded kernel, as in :func:`spkd`. Defaults to False.
+
+    Examples
+    --------
+        >>> inc = ms.IncrementalSpkd(qvals, cspks)
+        >>> inc.append(new_trials)
+        >>> confusion_matrix = ms.distclust(inc.distances[:, :, 3], nsam)
+
+    """
+
+    def __init__(self, qvals, cspks=None, distances=None, use_rs=None, n_jobs=None, banded=False):
+        self.qvals = np.asarray(qvals, dtype=np.float64)
+        self.use_rs = use_rs
+        self.n_jobs = n_jobs
+        self.banded = banded
+        self.cspks = []
+        self._buffer = np.zeros((0, 0, len(self.qvals)))
+        if distances is not None:
+            cspks = list(cspks) if cspks is not None else []
+            if distances.shape != (len(cspks), len(cspks), len(self.qvals)):
+                raise ValueError(
+                    f"distances should have shape {(len(cspks), len(cspks), len(self.qvals))}, got {distances.shape}."
+                )
+            self._reserve(len(cspks))
+            self._buffer[:len(cspks), :len(cspks), :] = distances
+            self.cspks = cspks
+        elif cspks:
+            self.append(cspks)
+
+    def __len__(self):
+        return len(self.cspks)
+
+    @property
+    def distances(self):
+        """
+        The ``(N, N, nq)`` distance tensor, the same as :func:`spkd` on all spike trains appended so far.
+
+        This is a view of the internal buffer; copy it to keep it across appends.
+        """
+        n = len(self.cspks)
+        return self._buffer[:n, :n, :]
+
+    def _reserve(self, numt):
+        capacity = self._buffer.shape[0]
+        if numt <= capacity:
+            return
+        capacity = max(numt, 2 * capacity)
+        buffer = np.zeros((capacity, capacity, len(self.qvals)))
+        n = len(self.cspks)
+        buffer[:n, :n, :] = self._buffer[:n, :n, :]
+        self._buffer = buffer
+
+    def append(self, new_cspks):
+        """
+        Add spike trains and compute their distances to every spike train held so far.
+
+        Parameters
+        ----------
+        new_cspks : list[np.ndarray or list]
+            Spike trains to add, in order.
+
+        Returns
+        -------
+        IncrementalSpkd
+            self, for chaining.
+        """
+        new_cspks = list(new_cspks)
+        if not new_cspks:
+            return self
+        n, m = len(self.cspks), len(new_cspks)
+        self._reserve(n + m)
+        kwargs = dict(use_rs=self.use_rs, n_jobs=self.n_jobs, banded=self.banded)
+        if n > 0:
+            cross = spkd_cross(self.cspks, new_cspks, self.qvals, **kwargs)
+            self._buffer[:n, n:n + m, :] = cross
+            self._buffer[n:n + m, :n, :] = np.transpose(cross, [1, 0, 2])
+        self._buffer[n:n + m, n:n + m, :] = spkd_cross(new_cspks, new_cspks, self.qvals, **kwargs)
+        self.cspks.extend(new_cspks)
+        return self
@@ -0,0 +1,289 @@
+import heapq
+import numpy as np
+from .spkd import _to_csr
+
+# Absolute tolerance of the pruning tests, so rounding in the kernels never prunes a true neighbour
+_SLACK = 1e-9
+
+
+class SpkdIndex:
+    """
+    Vantage-point tree over a library of spike trains, for nearest-neighbour and radius queries at one cost value.
+
+    The spike train distance is a metric, so if a query is at distance ``d`` from a vantage point, every spike
+    train at distance ``[lo, hi]`` from that vantage point is at least ``max(lo - d, d - hi)`` from the query. Each
+    node of the tree splits its spike trains into the half closer to its vantage point and the half further
+    away, and a query skips every subtree whose bound exceeds the current k-th distance (or the radius). Within
+    the leaves, spike trains are also skipped when their spike count differs from the query's by more than that,
+    since the distance is at least the spike count difference.
+
+    Building takes about ``N log2(N / leaf_size)`` distances. A query computes far fewer than the ``N`` of
+    :func:`spkd_cross` when the library is structured, e.g. trials of a few stimuli or units; with ``q = 0`` the
+    distance is the spike count difference and most leaves are skipped by the count bound alone.
+
+    Parameters
+    ----------
+    cspks : list[np.ndarray or list]
+        Library of spike trains. Spike times must be sorted when `banded`.
+    q : float
+        Cost value of the distance the index answers queries for. Build one index per cost value.
+    leaf_size : int, optional
+        Largest number of spike trains of a leaf, which are compared to the query one by one. Defaults to 16.
+    banded : bool, optional
+        Whether to use the exact banded kernel, as in :func:`spkd`. Defaults to False.
+    seed : None, int or numpy.random.Generator, optional
+        Seed of the vantage point choice. Defaults to None.
+
+    Attributes
+    ----------
+    q : float
+        Cost value of the distance.
+    numt : int
+        Number of spike trains in the library.
+    evaluations : int
+        Distances computed by the last query call, over all its queries.
+
+    Notes
+    -----
+    Distances are computed one pair at a time with the numba kernels of the 'py' backend, which have the lowest
+    latency for a single pair. An index keeps scratch buffers, so one index must not be queried from several
+    threads at once; load a copy per thread instead.
+
+    Examples
+    --------
+        >>> index = ms.SpkdIndex(library, q=8.0)
+        >>> dists, neighbours = index.query(new_trials, k=5)
+        >>> predicted = np.array([np.bincount(labels[row]).argmax() for row in neighbours])
+        >>> index.save("library_q8.npz")
+        >>> index = ms.SpkdIndex.load("library_q8.npz")
+
+    """
+
+    def __init__(self, cspks, q, leaf_size=16, banded=False, seed=None):
+        if not isinstance(cspks, list):
+            raise ValueError("cspks must be a list.")
+        if len(cspks) == 0:
+            raise ValueError("cspks must contain at least 1 spike train.")
+        if not q >= 0:
+            raise ValueError(f"q must be non-negative, got {q}.")
+        if leaf_size < 1:
+            raise ValueError("leaf_size must be a positive integer.")
+        self.q = float(q)
+        self.leaf_size = int(leaf_size)
+        self.banded = bool(banded)
+        self._attach(*_to_csr(cspks))
+        self._build(np.random.default_rng(seed))
+
+    @property
+    def numt(self):
+        return len(self._counts)
+
+    def __len__(self):
+        return self.numt
+
+    def query(self, cspks, k=1):
+        """
+        The `k` nearest spike trains of the library to each query spike train.
+
+        Parameters
+        ----------
+        cspks : list[np.ndarray or list]
+            Query spike trains; a list of one for a single query.
+        k : int, optional
+            Number of neighbours. Defaults to 1.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            ``(distances, indices)``, both of shape ``(len(cspks), k)``: the distances to the neighbours in
+            increasing order, ties broken by library index, and the neighbours' indices in the library.
+
+        Raises
+        ------
+        ValueError
+            If cspks is not a list or k is not between 1 and the number of library spike trains.
+        """
+        if not 1 <= k <= self.numt:
+            raise ValueError(f"k must be between 1 and {self.numt}, got {k}.")
+        trains = self._queries(cspks)
+        distances = np.empty((len(trains), k))
+        indices = np.empty((len(trains), k), dtype=np.int64)
+        for row, x in enumerate(trains):
+            distances[row], indices[row] = self._search(x, k, np.inf)
+        return distances, indices
+
+    def query_radius(self, cspks, radius):
+        """
+        The spike trains of the library within `radius` of each query spike train.
+
+        Parameters
+        ----------
+        cspks : list[np.ndarray or list]
+            Query spike trains; a list of one for a single query.
+        radius : float
+            Largest distance, inclusive.
+
+        Returns
+        -------
+        tuple of list
+            ``(distances, indices)``: for each query, an array of the distances within `radius` in increasing
+            order and an array of the matching library indices.
+        """
+        trains = self._queries(cspks)
+        found = [self._search(x, None, float(radius)) for x in trains]
+        return [d for d, _ in found], [i for _, i in found]
+
+    def save(self, path):
+        """ Write the index, library included, to the ``.npz`` file `path`. """
+        np.savez(
+            path,
+            values=self._values,
+            offsets=self._offsets,
+            settings=np.array([self.q, self.leaf_size, self.banded], dtype=np.float64),
+            order=self._order,
+            vantage=self._vantage,
+            ranges=self._ranges,
+            children=self._children,
+            bounds=self._bounds,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """ Read an index written by :meth:`save`. """
+        with np.load(path, allow_pickle=False) as f:
+            index = cls.__new__(cls)
+            q, leaf_size, banded = f["settings"]
+            index.q, index.leaf_size, index.banded = float(q), int(leaf_size), bool(banded)
+            index._attach(f["values"], f["offsets"])
+            index._order, index._vantage, index._ranges = f["order"], f["vantage"], f["ranges"]
+            index._children, index._bounds = f["children"], f["bounds"]
+        return index
+
+    def _attach(self, values, offsets):
+        """ Store the library in the flat layout and allocate the kernel scratch buffers. """
+        self._values, self._offsets = values, offsets
+        self._counts = np.diff(offsets)
+        maxcount = int(self._counts.max(initial=0))
+        self._qvals = np.array([self.q])
+        self._row = np.empty((maxcount + 1, 1))
+        self._diag = np.empty(1)
+        self._stamp = np.empty(maxcount + 1, dtype=np.int64)
+        self.evaluations = 0
+
+    def _queries(self, cspks):
+        if not isinstance(cspks, list):
+            raise ValueError("cspks must be a list.")
+        self.evaluations = 0
+        return [np.ascontiguousarray(x, dtype=np.float64).reshape(-1) for x in cspks]
+
+    def _distances(self, x, members, tau=np.inf):
+        """
+        Distances from the float64 spike train `x` to the library spike trains `members`, infinite for those whose
+        spike count differs from that of `x` by more than `tau`.
+        """
+        from .calculate_spkd.index_functions import _distances_to_py
+
+        out = np.empty(len(members))
+        self.evaluations += _distances_to_py(
+            x, self._values, self._offsets, members, self._qvals, tau, self.banded, self._row, self._diag,
+            self._stamp, out,
+        )
+        return out
+
+    def _build(self, rng):
+        """
+        Build the tree over the library.
+
+        Nodes are stored in flat arrays. Node ``v`` covers ``order[ranges[v, 0]:ranges[v, 1]]``. An inner node has
+        vantage point ``vantage[v]``, stored first in its range, and children ``children[v]``: the half of the
+        rest of its range closest to the vantage point, then the other half. ``bounds[v]`` holds the smallest and
+        largest distance to the vantage point in the first child, then in the second. Leaves have vantage -1.
+        """
+        order = np.arange(self.numt)
+        vantage, ranges, children, bounds = [], [], [], []
+        stack = [(0, self.numt, -1, 0)]
+        while stack:
+            lo, hi, parent, side = stack.pop()
+            node = len(vantage)
+            if parent >= 0:
+                children[parent][side] = node
+            ranges.append((lo, hi))
+            children.append([-1, -1])
+            if hi - lo <= self.leaf_size:
+                vantage.append(-1)
+                bounds.append((0.0, 0.0, 0.0, 0.0))
+                continue
+            pick = rng.integers(lo, hi)
+            order[lo], order[pick] = order[pick], order[lo]
+            vp = order[lo]
+            x = self._values[self._offsets[vp]:self._offsets[vp + 1]]
+            dist = self._distances(x, order[lo + 1:hi])
+            by_distance = np.argsort(dist, kind="stable")
+            order[lo + 1:hi] = order[lo + 1:hi][by_distance]
+            dist = dist[by_distance]
+            half = (len(dist) + 1) // 2
+            vantage.append(vp)
+            if half < len(dist):
+                bounds.append((dist[0], dist[half - 1], dist[half], dist[-1]))
+            else:
+                # an empty second child gets bounds no query can meet
+                bounds.append((dist[0], dist[half - 1], np.inf, -np.inf))
+            stack.append((lo + 1 + half, hi, node, 1))
+            stack.append((lo + 1, lo + 1 + half, node, 0))
+        self._order = order
+        self._vantage = np.array(vantage, dtype=np.int64)
+        self._ranges = np.array(ranges, dtype=np.int64)
+        self._children = np.array(children, dtype=np.int64)
+        self._bounds = np.array(bounds, dtype=np.float64)
+
+    def _search(self, x, k, radius):
+        """
+        Best-first search of the tree for the `k` nearest spike trains to `x`, or all within `radius` if `k` is
+        None.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Distances in increasing order, ties broken by index, and the library indices.
+        """
+        found = []  # a max-heap of (-distance, -index) when k is given, else a list of (distance, index)
+        tau = radius
+        nodes = [(0.0, 0)]
+        while nodes:
+            bound, node = heapq.heappop(nodes)
+            if bound > tau + _SLACK:
+                break
+            lo, hi = self._ranges[node]
+            vp = self._vantage[node]
+            if vp < 0:
+                members = self._order[lo:hi]
+                for i, d in zip(members, self._distances(x, members, tau + _SLACK)):
+                    if d < np.inf:
+                        tau = self._offer(found, d, i, k, tau)
+                continue
+            d_vp = self._distances(x, self._order[lo:lo + 1])[0]
+            tau = self._offer(found, d_vp, vp, k, tau)
+            inner_lo, inner_hi, outer_lo, outer_hi = self._bounds[node]
+            for child, c_lo, c_hi in ((0, inner_lo, inner_hi), (1, outer_lo, outer_hi)):
+                child_bound = max(bound, c_lo - d_vp, d_vp - c_hi)
+                if child_bound <= tau + _SLACK:
+                    heapq.heappush(nodes, (child_bound, self._children[node, child]))
+
+        if k is not None:
+            found = [(-d, -i) for d, i in found]
+        found.sort()
+        return np.array([d for d, _ in found]), np.array([i for _, i in found], dtype=np.int64)
+
+    @staticmethod
+    def _offer(found, distance, index, k, tau):
+        """ Add a candidate to `found` and return the new pruning distance. """
+        if k is None:
+            if distance <= tau:
+                found.append((distance, int(index)))
+            return tau
+        item = (-distance, -int(index))
+        if len(found) < k:
+            heapq.heappush(found, item)
+        elif item > found[0]:
+            heapq.heapreplace(found, item)
+        return -found[0][0] if len(found) == k else tau
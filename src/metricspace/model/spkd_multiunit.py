@@ -0,0 +1,85 @@
+import numpy as np
+from .spkd import spkd_cross, _resolve_n_jobs
+
+
+def spkd_multiunit(
+    cspks: list, qvals: list | np.ndarray, k: float, use_rs: bool | None = None, n_jobs: int | None = None
+):
+    """
+    Compute pairwise multi-unit (labeled-line) spike train distances for multiple cost values.
+
+    Each trial is a population response, a list with one spike train per unit. On top of the edits of
+    :func:`spkd`, a spike can be moved to another unit at cost `k`, so `k` sweeps from treating the population as
+    one pooled spike train (``k = 0``) to treating every unit separately (``k >= 2``).
+
+    Parameters
+    ----------
+    cspks : list[list[np.ndarray or list]]
+        List of trials; each trial is a list with the spike times (floats or ints) of every unit, in the same
+        unit order for every trial. Spike times of each unit must be sorted.
+    qvals : list or np.ndarray
+        List or array of time precision values (floats or ints) to use in the computation.
+    k : float
+        Cost of changing the unit label of a spike.
+    use_rs : bool, optional
+        Backend for ``k = 0`` and ``k >= 2``, as in :func:`spkd`. Defaults to None, the fastest available one.
+        ``0 < k < 2`` always runs on numba; True is then an error.
+    n_jobs : int, optional
+        Number of worker threads, as in :func:`spkd`. Defaults to None.
+
+    Returns
+    -------
+    ndarray
+        A 3D ndarray of shape ``(len(cspks), len(cspks), len(qvals))``, usable with :func:`metricspace.distclust`
+        like the output of :func:`spkd`.
+
+    Raises
+    ------
+    ValueError
+        If cspks is not a list of at least 2 trials, if the trials don't all have the same number of units, if
+        k is negative, or if use_rs is True for ``0 < k < 2``.
+
+    Notes
+    -----
+    For ``k = 0`` this is :func:`spkd` of the pooled spike trains, and for ``k >= 2`` (relabeling never beats
+    deleting and inserting) the sum of :func:`spkd` over units; both are computed that way. In between, the
+    dynamic program tracks one counter per unit of one trial, so a pair costs up to
+    ``n_spikes * prod(n_unit_spikes + 1)`` states. Only the states within ``2 / q`` of the current spike are
+    computed, so this grows with the number of spikes inside that window rather than in the whole trial. The
+    pairs are computed by one compiled loop on `n_jobs` threads, over the rows of the distance matrix as in
+    :func:`spkd`.
+
+    Examples
+    --------
+        >>> import numpy as np
+        >>> import metricspace as ms
+        >>> trials = [[np.sort(np.random.uniform(0, 2, 4)) for unit in range(6)] for trial in range(10)]
+        >>> d = ms.spkd_multiunit(trials, 2 ** np.arange(-2, 6.5, 0.5), k=1.0)
+        >>> d.shape
+        (10, 10, 17)
+    """
+    if not isinstance(cspks, list):
+        raise ValueError("cspks must be a list.")
+    if len(cspks) < 2:
+        raise ValueError("cspks must contain at least 2 trials for comparisons.")
+    num_units = len(cspks[0])
+    if num_units == 0 or any(len(trial) != num_units for trial in cspks):
+        raise ValueError("Every trial in cspks must have the same, non-zero number of units.")
+    if k < 0:
+        raise ValueError(f"k must be non-negative, got {k}.")
+    qvals = np.asarray(qvals, dtype=np.float64)
+
+    if k == 0:
+        pooled = [np.sort(np.concatenate([np.asarray(x, dtype=np.float64) for x in trial])) for trial in cspks]
+        return spkd_cross(pooled, pooled, qvals, use_rs, n_jobs)
+    if k >= 2:
+        d = np.zeros((len(cspks), len(cspks), len(qvals)))
+        for unit in range(num_units):
+            trains = [np.asarray(trial[unit], dtype=np.float64) for trial in cspks]
+            d += spkd_cross(trains, trains, qvals, use_rs, n_jobs)
+        return d
+    if use_rs:
+        raise ValueError("The Rust extension has no multi-unit kernel for 0 < k < 2; use use_rs=None or False.")
+    from .calculate_spkd.multiunit_functions import calculate_spkd_multiunit_py
+
+    return calculate_spkd_multiunit_py(cspks, qvals, k, _resolve_n_jobs(n_jobs))
@@ -0,0 +1,73 @@
+import time
+import numpy as np
+from .spkd import spkd, spkd_slide
+from .spkd_curve import spkd_curve
+from .spkd_multiunit import spkd_multiunit
+from .distclust_population import distclust_population
+from .backends import available_backends
+
+
+def warmup(
+    backends=None, slide: bool = True, multiunit: bool = True, curve: bool = True, population: bool = True
+) -> float:
+    """
+    Import the backends and compile the numba kernels ahead of the first real call.
+
+    The numba kernels are compiled with ``cache=True``: the first process to run one compiles it and writes the
+    machine code to numba's on-disk cache, and later processes load it instead of compiling again. This function
+    runs every kernel once on a few tiny spike trains, so a worker initializer or a container build step can pay
+    the import and compile cost up front rather than inside the first timed or latency-sensitive call.
+
+    Parameters
+    ----------
+    backends : iterable of str, optional
+        Backends to run, among 'rs', 'numba' and 'py'. Defaults to None, every available one.
+    slide : bool, optional
+        Warm up the kernels of :func:`spkd_slide`, grid and exact search. Defaults to True.
+    multiunit : bool, optional
+        Warm up the kernel of :func:`spkd_multiunit`. Defaults to True.
+    curve : bool, optional
+        Warm up the kernels of :func:`spkd_curve`. Defaults to True.
+    population : bool, optional
+        Warm up the kernel of :func:`distclust_population`. Defaults to True.
+
+    Returns
+    -------
+    float
+        Seconds spent, mostly compiling on a cold cache and loading on a warm one.
+
+    Notes
+    -----
+    numba stores the cache in ``__pycache__`` next to the package sources, or in ``NUMBA_CACHE_DIR`` if that is
+    set, which is needed when the installation is read-only. Cached code is reused until the package sources
+    change or the cache is moved to a machine with a different CPU. To fill the cache while building an image::
+
+        python -c "import metricspace; metricspace.warmup()"
+
+    Examples
+    --------
+        >>> from concurrent.futures import ProcessPoolExecutor
+        >>> import metricspace as ms
+        >>> with ProcessPoolExecutor(8, initializer=ms.warmup) as pool:
+        ...     results = list(pool.map(work, jobs))
+
+    """
+    start = time.perf_counter()
+    cspks = [np.array([0.1, 0.3, 0.5]), np.array([0.12, 0.33]), np.zeros(0)]
+    qvals = np.array([0.0, 1.0, 10.0])
+
+    backends = available_backends() if backends is None else tuple(backends)
+    for banded in (False, True):
+        for backend in backends:
+            spkd(cspks, qvals, banded=banded, backend=backend)
+        if slide and "py" in backends:
+            spkd_slide(cspks, qvals, 0.5, banded=banded, backend="py")
+            spkd_slide(cspks, qvals, exact=True, banded=banded, backend="py")
+    if multiunit and "py" in backends:
+        spkd_multiunit([[x, x] for x in cspks], qvals, k=1)
+    if curve and "py" in backends:
+        spkd_curve(cspks)(qvals)
+    if population and "numba" in backends:
+        for banded in (False, True):
+            distclust_population([cspks + cspks[:1]] * 2, [0, 0, 1, 1], qvals, banded=banded)
+    return time.perf_counter() - start
@@ -0,0 +1,3 @@
+from .epoch import epoch
+
+__all__ = ['epoch']
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def epoch(spike_times, events, window, reference=True):
+    """
+    Cut trials out of a continuous recording, for every event and every window at once.
+
+    Each trial holds the spikes with ``event + start <= t < event + end``. The trial boundaries of all events are
+    found with two binary searches of the sorted spike times, and the spikes are gathered with one vectorized
+    index, so the cost is ``O(E log S + spikes kept)`` without a Python loop over the events.
+
+    The result is in the flat ``(values, offsets)`` layout, trial ``i`` being ``values[offsets[i]:offsets[i + 1]]``,
+    which :func:`metricspace.spkd`, :func:`metricspace.spkd_slide` and :func:`metricspace.spkd_interval` take
+    directly: the Rust backend reads it in place and no per-trial arrays are built.
+
+    Parameters
+    ----------
+    spike_times : array-like
+        Sorted spike times of the whole recording, 1D.
+    events : array-like
+        Event times, one trial each, in any order; trials are returned in the same order. Windows of nearby
+        events may overlap, a spike then belongs to several trials.
+    window : tuple of float, or list of tuples
+        ``(start, end)`` of a trial relative to its event, e.g. ``(-0.5, 2.0)``, or a list of such windows.
+    reference : bool, optional
+        Subtract the event time from the spike times of its trial, so every trial is in event-relative time.
+        Defaults to True.
+
+    Returns
+    -------
+    tuple or list of tuples
+        ``(values, offsets)``: float64 spike times and int64 offsets of length ``len(events) + 1``. A list of
+        them, one per window, when `window` is a list.
+
+    Raises
+    ------
+    ValueError
+        If spike_times or events are not 1D, if spike_times is not sorted, or if a window ends before it starts.
+
+    Examples
+    --------
+        >>> windows = [(0, 0.25), (0, 0.5), (0, 1.0)]
+        >>> trials = ms.epoch(spike_times, stimulus_onsets, windows)
+        >>> curves = [ms.spkd(t, qvals, n_jobs=-1) for t in trials]
+
+    """
+    spike_times = np.ascontiguousarray(spike_times, dtype=np.float64)
+    events = np.ascontiguousarray(events, dtype=np.float64)
+    if spike_times.ndim != 1 or events.ndim != 1:
+        raise ValueError("spike_times and events must be 1D arrays.")
+    if np.any(spike_times[1:] < spike_times[:-1]):
+        raise ValueError("spike_times must be sorted.")
+    windows = list(window) if isinstance(window, list) else [window]
+    for start, end in windows:
+        if end < start:
+            raise ValueError(f"A window must not end before it starts, got {(start, end)}.")
+
+    trials = []
+    for start, end in windows:
+        first = np.searchsorted(spike_times, events + start, side="left")
+        stop = np.searchsorted(spike_times, events + end, side="left")
+        counts = stop - first
+        offsets = np.zeros(len(events) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # spike k of the output is spike first[i] + (k - offsets[i]) of the recording, for its trial i
+        index = np.arange(offsets[-1], dtype=np.int64) + np.repeat(first - offsets[:-1], counts)
+        values = spike_times[index]
+        if reference:
+            values -= np.repeat(events, counts)
+        trials.append((values, offsets))
+    return trials if isinstance(window, list) else trials[0]
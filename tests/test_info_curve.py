@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+import metricspace as ms
+
+
+@pytest.mark.parametrize("expo, method, data_seed", [(-1, "relabel", 2), (1, "relabel", 2), (2, "bootstrap", 10)])
+def test_ties_split_as_distclust(expo, method, data_seed):
+    # spike count distances at q = 0 are integers, so class averages tie exactly and often
+    rng = np.random.default_rng(data_seed)
+    nsam = np.array([6, 8, 5])
+    labels = rng.permutation(np.repeat(np.arange(len(nsam)), nsam))
+    cspks = [np.sort(np.round(rng.random(rng.integers(0, 6)) * 10, 1)) for _ in labels]
+    qvals = np.array([0.0, 1.0, 10.0])
+    iftrump = 0 if method == "bootstrap" else 1
+
+    curve = ms.info_curve(cspks, labels, qvals, expo, iftrump, None, 40, method, seed=3, block_size=7, use_rs=False)
+
+    dists = ms.spkd([cspks[i] for i in np.argsort(labels, kind="stable")], qvals, use_rs=False)
+    np.testing.assert_array_equal(curve.confusion, ms.distclust(dists, nsam, expo, 0, iftrump))
+    null = ms.distclust_resample(dists, nsam, 40, method, expo, iftrump, seed=3, info=True)
+    np.testing.assert_allclose(curve.null, null)